@@ -1,6 +1,6 @@
 {
     'name': 'Construction Management',
-    'version': '17.0.1.0.3',
+    'version': '17.0.1.0.5',
     'category': 'Construction/Project Management',
     'summary': 'Manage construction projects, stages, materials, and payments',
     'description': """
@@ -22,8 +22,8 @@
         'views/webapp_template.xml',
         'views/construction_project_views.xml',
         'views/construction_stage_views.xml',
+        'views/construction_portfolio_kpi_views.xml',
         'views/construction_stage_product_template_views.xml',
-        'wizard/construction_financial_report_wizard_views.xml',
         'views/construction_payment_views.xml',
         'views/construction_uom_views.xml',
         'views/construction_kirim_views.xml',
@@ -32,14 +32,17 @@
         'views/construction_work_task_views.xml',
         'views/construction_material_request_batch_views.xml',
         'views/construction_issue_views.xml',
+        'views/construction_alert_views.xml',
         'data/construction_products.xml',
         'data/sequence.xml',
         'data/construction_issue_sequence.xml',
         'data/construction_stage_templates.xml',
         'reports/construction_financial_report.xml',
+        'reports/construction_financial_ledger_views.xml',
         'views/portal_templates.xml',
         'views/construction_file_views.xml',
         'data/construction_cron.xml',
+        'data/construction_alert_rules.xml',
     ],
 
 
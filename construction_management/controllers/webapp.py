@@ -4,23 +4,55 @@ import json
 import logging
 import io
 import xlsxwriter
-import base64
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
 from datetime import datetime, timedelta, date
+from odoo.addons.construction_management.services.summary_engine import SummaryEngine, encode_response, compress_body, dumps, resolve_period
+from odoo.addons.construction_management.services.response_cache import SUMMARY_CACHE, make_etag, etag_matches
+from odoo.addons.construction_management.services.cashflow_forecast import CashflowForecast
+import gzip
+import time
 
 _logger = logging.getLogger(__name__)
 
+# Live updates: /webapp/api/changes may hold a request this long while the
+# project's data_version is unchanged. Kept short, each wait occupies a worker.
+POLL_DEFAULT_WAIT_SECONDS = 5
+POLL_MAX_WAIT_SECONDS = 10
+POLL_STEP_SECONDS = 1
+
 class ConstructionWebApp(http.Controller):
 
+    @staticmethod
+    def _request_token():
+        """API calls send the dashboard token in a header, never in the query string (access logs)."""
+        return request.httprequest.headers.get('X-WebApp-Token')
+
     def _validate_token(self, token):
-        session = request.env['construction.webapp.session'].sudo().search([('token', '=', token)], limit=1)
-        if not session or not session.is_valid():
-            return None
-        return session.user_id
+        """
+        Signed token from the dashboard link, checked in memory.
+        Telegram initData (X-Telegram-Init-Data header) is accepted as well: it keeps an
+        open WebApp working after the link expires and, when both are sent, must
+        belong to the same Telegram account as the token.
+        """
+        Session = request.env['construction.webapp.session'].sudo()
+        Users = request.env['res.users'].sudo()
+        init_data = request.httprequest.headers.get('X-Telegram-Init-Data')
+        tg_user_id = Session.verify_init_data(init_data) if init_data else None
+
+        user_id = Session.verify_token(token)
+        if user_id:
+            user = Users.browse(user_id).exists()
+            if user and tg_user_id and user.telegram_chat_id and user.telegram_chat_id != str(tg_user_id):
+                return None
+            return user or None
+
+        if tg_user_id:
+            return Users.search([('telegram_chat_id', '=', str(tg_user_id))], limit=1) or None
+        return None
 
     @http.route('/webapp/dashboard', type='http', auth='public', website=False)
     def webapp_dashboard(self, token=None, **kwargs):
@@ -41,232 +73,236 @@ class ConstructionWebApp(http.Controller):
         })
 
     @http.route('/webapp/api/summary', type='http', auth='public', methods=['GET'], csrf=False)
-    def api_summary(self, token=None, project_id=None, period='all', custom_start=None, custom_end=None, **kwargs):
+    def api_summary(self, project_id=None, period='all', custom_start=None, custom_end=None, **kwargs):
+        """Headline totals, stage headers and per-stage expense totals."""
+        token = self._request_token()
         user = self._validate_token(token)
         if not user:
-            return json.dumps({'error': 'Unauthorized'})
+            return self._json_response({'error': 'Unauthorized'})
 
-        try:
-            pid = int(project_id) if project_id else False
-        except:
-            pid = False
-            
+        pid = self._to_int(project_id)
+        engine = SummaryEngine(request.env, user)
         if not pid:
-             # Just return list of projects if no ID 
-             projects = request.env['construction.project'].with_user(user).search([])
-             if not projects:
-                 return json.dumps({'error': 'No Projects Found'})
-             pid = projects[0].id
-
-        project = request.env['construction.project'].with_user(user).browse(pid)
-        if not project.exists():
-             return json.dumps({'error': 'Project Not Found'})
+            project = engine.get_project()
+            if not project:
+                return self._json_response({'error': 'No Projects Found'})
+            pid = project.id
+
+        def build(project):
+            result = engine.build_summary(project, period, custom_start, custom_end)
+            result['sync'] = engine.sync_state(project.id)
+            return result
+
+        return self._versioned_json(engine, user, pid, token, ('summary', period, custom_start, custom_end), build)
+
+    @http.route('/webapp/api/incomes', type='http', auth='public', methods=['GET'], csrf=False)
+    def api_incomes(self, project_id=None, period='all', custom_start=None, custom_end=None,
+                    cursor=None, limit=None, **kwargs):
+        """Income days, newest first (keyset paginated by date)."""
+        token = self._request_token()
+        user = self._validate_token(token)
+        if not user:
+            return self._json_response({'error': 'Unauthorized'})
+        pid = self._to_int(project_id)
+        if not pid:
+            return self._json_response({'error': 'Project Not Found'})
+
+        engine = SummaryEngine(request.env, user)
+        date_from, date_to = resolve_period(period, custom_start, custom_end)
+
+        def build(project):
+            return engine.income_days(project.id, date_from, date_to, cursor=cursor, limit=limit)
+
+        return self._versioned_json(engine, user, pid, token,
+                                    ('incomes', period, custom_start, custom_end, cursor, limit), build)
+
+    @http.route('/webapp/api/expenses', type='http', auth='public', methods=['GET'], csrf=False)
+    def api_expenses(self, stage_id=None, period='all', custom_start=None, custom_end=None,
+                     cursor=None, limit=None, **kwargs):
+        """Expense items of one stage (keyset paginated by type, id)."""
+        date_from, date_to = resolve_period(period, custom_start, custom_end)
+        return self._stage_endpoint(stage_id, ('expenses', period, custom_start, custom_end, cursor, limit),
+                                    lambda engine, sid: engine.expense_items(sid, date_from, date_to,
+                                                                             cursor=cursor, limit=limit))
+
+    @http.route('/webapp/api/stage/checklist', type='http', auth='public', methods=['GET'], csrf=False)
+    def api_stage_checklist(self, stage_id=None, cursor=None, limit=None, **kwargs):
+        """Checklist tasks/services of one stage."""
+        return self._stage_endpoint(stage_id, ('checklist', cursor, limit),
+                                    lambda engine, sid: engine.stage_checklist(sid, cursor=cursor, limit=limit))
+
+    @http.route('/webapp/api/stage/images', type='http', auth='public', methods=['GET'], csrf=False)
+    def api_stage_images(self, stage_id=None, cursor=None, limit=None, **kwargs):
+        """Image URLs of one stage, newest first."""
+        return self._stage_endpoint(stage_id, ('images', cursor, limit),
+                                    lambda engine, sid: engine.stage_images(sid, self._request_token(), cursor=cursor, limit=limit))
+
+    @http.route('/webapp/api/changes', type='http', auth='public', methods=['GET'], csrf=False)
+    def api_changes(self, project_id=None, since=None, version=None, wait=None, **kwargs):
+        """
+        Delta sync: rows written and ids deleted after the `since` watermark.
+        Live updates: with `version` (the data_version the client last saw) and
+        `wait` seconds, the request is held while the version is unchanged,
+        for at most construction.webapp_poll_wait_seconds.
+        """
+        token = self._request_token()
+        user = self._validate_token(token)
+        if not user:
+            return self._json_response({'error': 'Unauthorized'})
+        pid = self._to_int(project_id)
+        engine = SummaryEngine(request.env, user)
+        if not pid or not engine.get_project(pid):
+            return self._json_response({'error': 'Project Not Found'})
+
+        known_version = self._to_int(version)
+        wait_seconds = min(self._to_int(wait) or 0, self._poll_wait_seconds())
+        if known_version is not False and wait_seconds > 0:
+            self._wait_for_version(engine, pid, known_version, wait_seconds)
+
+        # An unchanged data_version means nothing was written: the cached answer
+        # (with its older watermark) is still exact
+        def build(project):
+            result = engine.changes(project.id, since=since, token=token)
+            result['version'] = engine.get_data_version(project.id)
+            return result
+
+        return self._versioned_json(engine, user, pid, token, ('changes', since), build)
+
+    @http.route('/webapp/api/forecast', type='http', auth='public', methods=['GET'], csrf=False)
+    def api_forecast(self, project_id=None, **kwargs):
+        """Projected balance and the date it turns negative (see services/cashflow_forecast.py)."""
+        token = self._request_token()
+        user = self._validate_token(token)
+        if not user:
+            return self._json_response({'error': 'Unauthorized'})
 
-        # Date Filtering Logic
-        today = fields.Date.today()
-        date_from = None
-        date_to = None
-        
-        # Default to month if 'all' passed? User requested defaults. But let's stick to logic passed.
-        # Frontend defaults can be handled there, but if period='all', we fetch all.
-        
-        if period == 'today':
-            date_from = today
-            date_to = today
-        elif period == 'week':
-            date_from = today - timedelta(days=today.weekday()) # Start of week (Mon)
-            date_to = today
-        elif period == 'month':
-            date_from = today.replace(day=1)
-            date_to = today
-        elif period == 'custom' and custom_start and custom_end:
-            date_from = fields.Date.from_string(custom_start)
-            date_to = fields.Date.from_string(custom_end)
-        else:
-             # Default to All Time (no filters)
-             pass
+        pid = self._to_int(project_id)
+        engine = SummaryEngine(request.env, user)
+        if not pid:
+            project = engine.get_project()
+            if not project:
+                return self._json_response({'error': 'No Projects Found'})
+            pid = project.id
 
-        # 1. Income Data (Correct Auth)
-        income_domain = [('project_id', '=', project.id)]
-        if date_from: income_domain.append(('date', '>=', date_from))
-        if date_to: income_domain.append(('date', '<=', date_to))
-        
-        incomes = request.env['construction.project.income'].with_user(user).search(income_domain, order='date desc')
-        
-        # Group Income by Date
-        income_grouped = {}
-        total_income_period = 0.0
-        for inc in incomes:
-            d_str = inc.date.strftime('%Y-%m-%d')
-            if d_str not in income_grouped:
-                income_grouped[d_str] = {'date': d_str, 'total': 0, 'items': []}
-            
-            income_grouped[d_str]['total'] += inc.amount
-            income_grouped[d_str]['items'].append({
-                'id': inc.id,
-                'description': inc.description,
-                'amount': inc.amount
-            })
-            total_income_period += inc.amount
+        # The ETag includes today's date, so the projection is rebuilt daily
+        def build(project):
+            return CashflowForecast(request.env).forecast_project(project.id) or {}
 
-        # 2. Expense Data (Correct Auth)
-        # Materials
-        mat_domain = [('stage_id.project_id', '=', project.id)]
-        if date_from: mat_domain.append(('date', '>=', date_from))
-        if date_to: mat_domain.append(('date', '<=', date_to))
-        
-        materials = request.env['construction.stage.material'].with_user(user).search(mat_domain)
-        
-        # Services
-        svc_domain = [('stage_id.project_id', '=', project.id)]
-        if date_from: svc_domain.append(('date', '>=', date_from))
-        if date_to: svc_domain.append(('date', '<=', date_to))
-        
-        services = request.env['construction.stage.service'].with_user(user).search(svc_domain)
+        return self._versioned_json(engine, user, pid, token, ('forecast',), build)
 
-        total_expense_period = sum(materials.mapped('total_cost')) + sum(services.mapped('total_cost'))
-        total_material = sum(materials.mapped('total_cost'))
-        total_service = sum(services.mapped('total_cost'))
-        
-        # Group Expenses by Stage
-        expense_by_stage = {}
-        
-        # Process Materials
-        for m in materials:
-            sid = m.stage_id.id if m.stage_id else 0
-            sname = m.stage_id.name if m.stage_id else "Stage belgilanmagan"
-            
-            if sid not in expense_by_stage:
-                expense_by_stage[sid] = {'name': sname, 'total': 0, 'items': []}
-            
-            expense_by_stage[sid]['total'] += m.total_cost
-            expense_by_stage[sid]['items'].append({
-                'type': 'material',
-                'name': m.product_id.name,
-                'amount': m.total_cost,
-                'date': m.date.strftime('%Y-%m-%d'),
-                'status': m.state, 
-                'color': 'blue'
-            })
+    @http.route('/webapp/api/portfolio', type='http', auth='public', methods=['GET'], csrf=False)
+    def api_portfolio(self, order='balance', limit=None, offset=None, **kwargs):
+        """Cross-project KPIs from the portfolio materialized view (admins only)."""
+        user = self._validate_token(self._request_token())
+        if not user:
+            return self._json_response({'error': 'Unauthorized'})
+        if user.construction_role != 'admin' and not user.has_group('base.group_system'):
+            return self._json_response({'error': 'Forbidden'})
+
+        data = request.env['construction.portfolio.kpi'].sudo().get_portfolio(
+            order=order,
+            limit=SummaryEngine._limit(limit, default=50),
+            offset=max(self._to_int(offset) or 0, 0),
+            company_ids=user.company_ids.ids,
+        )
+        return self._json_response(data)
+
+    @http.route('/webapp/api/batch', type='http', auth='public', methods=['POST'], csrf=False)
+    def api_batch(self, **kwargs):
+        """
+        Several named queries in one round trip (see SummaryEngine.run_batch).
+        Body: {"token": ..., "queries": [...]}; the token may come in the X-WebApp-Token header instead.
+        """
+        try:
+            payload = json.loads(request.httprequest.get_data() or b'{}')
+        except ValueError:
+            return self._json_response({'error': 'Invalid JSON'})
+        if not isinstance(payload, dict):
+            return self._json_response({'error': 'Invalid JSON'})
+        token = self._request_token() or payload.get('token')
+        user = self._validate_token(token)
+        if not user:
+            return self._json_response({'error': 'Unauthorized'})
+        queries = payload.get('queries')
+        if not isinstance(queries, list):
+            return self._json_response({'error': 'queries must be a list'})
 
-        # Process Services
-        for s in services:
-            sid = s.stage_id.id if s.stage_id else 0
-            sname = s.stage_id.name if s.stage_id else "Stage belgilanmagan"
-            
-            if sid not in expense_by_stage:
-                expense_by_stage[sid] = {'name': sname, 'total': 0, 'items': []}
-            
-            expense_by_stage[sid]['total'] += s.total_cost
-            expense_by_stage[sid]['items'].append({
-                'type': 'service',
-                'name': s.service_id.name + (f" ({s.description})" if s.description else ""),
-                'amount': s.total_cost,
-                'date': s.date.strftime('%Y-%m-%d'),
-                'status': 'Done' if s.is_done else 'Planned',
-                'color': 'yellow'
-            })
+        engine = SummaryEngine(request.env, user)
+        return self._json_response({'results': engine.run_batch(queries, token)})
 
-        # 3. Stages List (For Progress Tab)
-        stages = request.env['construction.stage'].with_user(user).search([('project_id', '=', project.id)], order='id')
-        stages_data = []
-        for stage in stages:
-            # Fetch Tasks for this stage
-            tasks_data = []
-            total_services = 0
-            done_services = 0
-            
-            stage_images = []
-            
-            for task in stage.task_ids:
-                # Handle Image Tasks
-                task_name_lower = (task.name or '').lower()
-                if 'rasmlar' in task_name_lower:
-                    try:
-                        for img in task.image_ids:
-                             stage_images.append({
-                                 'id': img.id,
-                                 'url': f'/webapp/api/image/{img.id}?token={token}',
-                                 'name': img.name or "Rasm"
-                             })
-                    except Exception as e:
-                        _logger.error(f"Error fetching images for task {task.id}: {str(e)}")
-                    continue # Skip adding to main task list
-
-                # Filter: Exclude material tasks
-                if 'материал' in task_name_lower:
-                    continue  # Skip material tasks
-                
-                # We only want tasks that have checklist items (services)
-                services_data = []
-                for svc in task.service_ids:
-                    total_services += 1
-                    if svc.is_done:
-                        done_services += 1
-                    
-                    services_data.append({
-                        'id': svc.id,
-                        'name': svc.service_id.name,
-                        'description': svc.description or "",
-                        'quantity': svc.quantity,
-                        'unit': svc.construction_uom_id.name or "",
-                        'price': svc.unit_price,
-                        'total': svc.total_cost,
-                        'is_done': svc.is_done
-                    })
-                
-                # Only add task if it has services to show
-                if services_data:
-                    tasks_data.append({
-                        'id': task.id,
-                        'name': task.name,
-                        'progress': task.progress,
-                        'items': services_data
-                    })
-
-            # Calculate stage progress from services
-            stage_progress = (done_services / total_services * 100) if total_services > 0 else 0
-            
-            # Auto-determine status based on progress
-            if stage_progress >= 100:
-                computed_status = 'completed'
-            elif stage_progress > 0:
-                computed_status = 'in_progress'
-            else:
-                computed_status = 'pending'
-            
-            stages_data.append({
-                'id': stage.id,
-                'name': stage.name,
-                'status': computed_status,  # Use computed status instead of stage.state
-                'progress': round(stage_progress, 1),  # Use calculated progress
-                'type': stage.stage_type,
-                'tasks': tasks_data, # Nested Tasks
-                'images': stage_images # Stage Images
-            })
+    @staticmethod
+    def _poll_wait_seconds():
+        try:
+            value = int(request.env['ir.config_parameter'].sudo().get_param(
+                'construction.webapp_poll_wait_seconds', POLL_DEFAULT_WAIT_SECONDS))
+        except (TypeError, ValueError):
+            value = POLL_DEFAULT_WAIT_SECONDS
+        return max(min(value, POLL_MAX_WAIT_SECONDS), 0)
+
+    @staticmethod
+    def _wait_for_version(engine, pid, known_version, wait_seconds):
+        """
+        Re-reads data_version until it differs from known_version or the wait
+        is over. Each check ends the read-only transaction so the next one sees
+        new commits, and no LISTEN connection is held.
+        """
+        deadline = time.monotonic() + wait_seconds
+        while time.monotonic() < deadline:
+            request.env.cr.rollback()
+            if engine.get_data_version(pid) != known_version:
+                return
+            time.sleep(POLL_STEP_SECONDS)
+        request.env.cr.rollback()
+
+    def _stage_endpoint(self, stage_id, key_parts, fetch):
+        token = self._request_token()
+        user = self._validate_token(token)
+        if not user:
+            return self._json_response({'error': 'Unauthorized'})
+        sid = self._to_int(stage_id)
+        engine = SummaryEngine(request.env, user)
+        pid = engine.get_stage_project_id(sid) if sid else None
+        if not pid:
+            return self._json_response({'error': 'Stage Not Found'})
+        return self._versioned_json(engine, user, pid, token, key_parts + (sid,),
+                                    lambda project: fetch(engine, sid))
+
+    def _versioned_json(self, engine, user, pid, token, key_parts, build):
+        """
+        Versioned cache: unchanged projects are answered without building the payload.
+        The project access check runs on every request, so revoked access takes
+        effect before the data version changes; build(project) only runs on a cache miss.
+        """
+        version = engine.get_data_version(pid)
+        if version is None:
+            return self._json_response({'error': 'Project Not Found'})
+        project = engine.get_project(pid)
+        if not project:
+            return self._json_response({'error': 'Project Not Found'})
+        etag = make_etag(request.db, user.id, pid, version, fields.Date.today(), token, *key_parts)
+        cache_headers = [('ETag', etag), ('Cache-Control', 'private, no-cache')]
+        if etag_matches(request.httprequest.headers.get('If-None-Match'), etag):
+            return request.make_response(b'', headers=cache_headers, status=304)
+
+        cached = SUMMARY_CACHE.get(etag)
+        if cached is None:
+            raw = dumps(build(project))
+            cached = {'body': raw, 'gzip': gzip.compress(raw, compresslevel=5)}
+            SUMMARY_CACHE.put(etag, cached)
+
+        body, headers = compress_body(cached['body'], request.httprequest.headers.get('Accept-Encoding'), cached['gzip'])
+        return request.make_response(body, headers=headers + cache_headers)
+
+    @staticmethod
+    def _to_int(value):
+        try:
+            return int(value) if value else False
+        except (TypeError, ValueError):
+            return False
 
-        all_time_income = project.total_income
-        all_time_expense = project.total_expense
-        balance = project.balance
-
-        data = {
-            'project': {
-                'id': project.id,
-                'name': project.name,
-                'balance': balance, # All time
-                'income_period': total_income_period,
-                'expense_period': total_expense_period,
-                'material_total': total_material,
-                'service_total': total_service,
-                'last_payment_date': incomes[0].date.strftime('%Y-%m-%d') if incomes else None,
-                'payment_count': len(incomes)
-            },
-            'stages': stages_data,
-            'income_grouped': list(income_grouped.values()),
-            'expense_by_stage': list(expense_by_stage.values())
-        }
-        
-        return json.dumps(data, default=str)
+    def _json_response(self, data):
+        body, headers = encode_response(data, request.httprequest.headers.get('Accept-Encoding'))
+        return request.make_response(body, headers=headers)
 
     @http.route('/webapp/api/report/download', type='http', auth='public')
     def download_report(self, token=None, project_id=None, report_type='pdf', period='all', custom_start=None, custom_end=None, **kwargs):
@@ -391,8 +427,8 @@ class ConstructionWebApp(http.Controller):
     def _get_report_data(self, project, date_from, date_to):
         """Helper to fetch filtered data for reports"""
         income_domain = [('project_id', '=', project.id)]
-        mat_domain = [('stage_id.project_id', '=', project.id)]
-        svc_domain = [('stage_id.project_id', '=', project.id)]
+        mat_domain = [('project_id', '=', project.id)]
+        svc_domain = [('project_id', '=', project.id)]
         
         if date_from:
             income_domain.append(('date', '>=', date_from))
@@ -410,21 +446,61 @@ class ConstructionWebApp(http.Controller):
         return incomes, materials, services
 
     @http.route('/webapp/api/image/<int:image_id>', type='http', auth='public')
-    def get_image(self, image_id, token=None, **kwargs):
+    def get_image(self, image_id, token=None, size=None, **kwargs):
         """Securely serve specific image with token auth"""
         user = self._validate_token(token)
         if not user:
             return http.Response("Unauthorized", status=403)
-            
-        image = request.env['construction.stage.image'].sudo().browse(image_id)
-        if not image.exists() or not image.image:
+
+        image = request.env['construction.stage.image'].sudo().browse(image_id).exists()
+        project = image.project_id
+        if not image or not project or not SummaryEngine(request.env, user).get_project(project.id):
             return http.Response("Not Found", status=404)
-            
-        image_content = base64.b64decode(image.image)
-        return request.make_response(image_content, headers=[
-            ('Content-Type', 'image/jpeg'),
-            ('Cache-Control', 'max-age=3600')
-        ])
+        return self._stream_image(image, immutable=False, size=size)
+
+    @http.route('/webapp/api/image/<int:image_id>/<string:checksum>', type='http', auth='public')
+    def get_image_by_checksum(self, image_id, checksum, sig=None, size=None, **kwargs):
+        """
+        Content-addressed URL from SummaryEngine.image_url: the signature covers the
+        id and the file checksum, so the response never changes and is cached forever.
+        """
+        Session = request.env['construction.webapp.session'].sudo()
+        if not Session.verify_image_signature(image_id, checksum, sig):
+            return http.Response("Unauthorized", status=403)
+
+        image = request.env['construction.stage.image'].sudo().browse(image_id).exists()
+        if not image:
+            return http.Response("Not Found", status=404)
+        return self._stream_image(image, immutable=True, checksum=checksum, size=size)
+
+    def _stream_image(self, image, immutable, checksum=None, size=None):
+        """
+        Streams from the filestore (or X-Sendfile when configured) with the
+        attachment's mimetype, checksum ETag, 304 and Range support.
+        size picks a rendition; until the cron has made it the original is
+        served, without the immutable caching.
+        """
+        Binary = request.env['ir.binary']
+        try:
+            stream = Binary._get_stream_from(image, 'image')
+        except Exception:
+            return http.Response("Not Found", status=404)
+        if checksum and stream.etag != checksum:
+            # The image was replaced: this URL no longer points to anything
+            return http.Response("Not Found", status=404)
+
+        rendition = image._get_rendition_field(size)
+        if rendition:
+            if not image.rendition_pending and image.with_context(bin_size=True)[rendition]:
+                stream = Binary._get_stream_from(image, rendition)
+            else:
+                immutable = False
+
+        response = stream.get_response(as_attachment=False, immutable=immutable)
+        # Photos are private even though the URL is unguessable
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
 
     def _generate_pdf_report(self, project, date_from, date_to, period_label):
         buffer = io.BytesIO()
@@ -0,0 +1,38 @@
+# Backfills the denormalized project_id of cost lines and stage images in SQL,
+# so the upgrade does not recompute the new stored fields record by record.
+
+import logging
+
+from odoo.tools.sql import column_exists, create_column
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    for table in ('construction_stage_material', 'construction_stage_service'):
+        if not column_exists(cr, table, 'project_id'):
+            create_column(cr, table, 'project_id', 'int4')
+        cr.execute(f"""
+            UPDATE {table} line
+            SET project_id = st.project_id
+            FROM construction_stage st
+            WHERE st.id = line.stage_id AND line.project_id IS NULL
+        """)
+        _logger.info(f"[MIGRATION] {table}: project_id set on {cr.rowcount} rows")
+
+    if not column_exists(cr, 'construction_stage_image', 'project_id'):
+        create_column(cr, 'construction_stage_image', 'project_id', 'int4')
+    cr.execute("""
+        UPDATE construction_stage_image img
+        SET project_id = COALESCE(
+            (SELECT st.project_id FROM construction_stage st WHERE st.id = img.stage_id),
+            (SELECT ts.project_id FROM construction_stage_task t
+             JOIN construction_stage ts ON ts.id = t.stage_id
+             WHERE t.id = img.task_id)
+        )
+        WHERE img.project_id IS NULL
+    """)
+    _logger.info(f"[MIGRATION] construction_stage_image: project_id set on {cr.rowcount} rows")
@@ -0,0 +1,25 @@
+# The daily balance snapshot now stores daily amounts only, and counts the
+# task lines (the set behind project.total_expense). Drops the running-total
+# columns and refills the table from the lines.
+
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    cr.execute("""
+        ALTER TABLE construction_project_daily_balance
+            DROP COLUMN IF EXISTS cum_income,
+            DROP COLUMN IF EXISTS cum_material_cost,
+            DROP COLUMN IF EXISTS cum_service_cost,
+            DROP COLUMN IF EXISTS closing_balance
+    """)
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['construction.project.daily.balance'].rebuild()
+    _logger.info("[MIGRATION] construction_project_daily_balance rebuilt with daily amounts only")
@@ -1,3 +1,8 @@
+from . import construction_price_index
+from . import construction_data_version
+from . import construction_daily_balance
+from . import construction_cost_rollup
+from . import construction_image_rendition
 from . import construction_project
 from . import construction_stage
 from . import construction_materials_services
@@ -17,3 +22,6 @@ from . import construction_material_request_batch
 from . import construction_escalation
 from . import construction_file
 from . import construction_webapp_session
+from . import construction_portfolio_kpi
+from . import construction_alert
+from . import account_analytic_line
@@ -0,0 +1,176 @@
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Cursor over construction.project.daily.balance: "<write_date>|<id>"
+POSTING_CURSOR_PARAM = 'construction.analytic_posting_cursor'
+POSTING_BATCH = 1000
+# Rows are re-read from this far behind the cursor: a transaction may commit
+# after the cursor moved with an earlier write_date. Posting is idempotent.
+# Transactions running longer than this are caught by the daily reconcile.
+POSTING_OVERLAP = timedelta(minutes=5)
+POSTING_CRON_SECONDS = 120
+
+# Snapshot rows whose analytic lines are missing, stale or left over
+_RECONCILE_SQL = """
+    SELECT b.id, b.project_id, b.date, b.material_cost, b.service_cost
+    FROM construction_project_daily_balance b
+    JOIN construction_project p ON p.id = b.project_id
+    LEFT JOIN account_analytic_line am
+           ON am.construction_daily_balance_id = b.id AND am.construction_cost_kind = 'material'
+    LEFT JOIN account_analytic_line sv
+           ON sv.construction_daily_balance_id = b.id AND sv.construction_cost_kind = 'service'
+    CROSS JOIN LATERAL (
+        SELECT -ROUND(COALESCE(b.material_cost, 0)::numeric, 2) AS material,
+               -ROUND(COALESCE(b.service_cost, 0)::numeric, 2) AS service
+    ) want
+    WHERE b.id > %s AND (
+        (want.material = 0 AND am.id IS NOT NULL)
+        OR (want.material != 0 AND p.analytic_account_id IS NOT NULL
+            AND (am.id IS NULL OR am.amount != want.material OR am.account_id != p.analytic_account_id))
+        OR (want.service = 0 AND sv.id IS NOT NULL)
+        OR (want.service != 0 AND p.analytic_account_id IS NOT NULL
+            AND (sv.id IS NULL OR sv.amount != want.service OR sv.account_id != p.analytic_account_id))
+    )
+    ORDER BY b.id
+    LIMIT %s
+"""
+
+
+class AccountAnalyticLine(models.Model):
+    """
+    Project costs on the project's analytic account: one line per project,
+    day and cost kind, mirrored from construction.project.daily.balance.
+    The link to the snapshot row makes posting idempotent; rows removed by a
+    snapshot rebuild take their analytic lines with them. The snapshot counts
+    the task lines only, the set behind project.total_expense.
+    """
+    _inherit = 'account.analytic.line'
+
+    construction_daily_balance_id = fields.Many2one(
+        'construction.project.daily.balance', string='Loyiha kunlik balansi',
+        ondelete='cascade', index=True, readonly=True, copy=False)
+    construction_cost_kind = fields.Selection([
+        ('material', 'Materiallar'),
+        ('service', 'Xizmatlar'),
+    ], string='Xarajat turi', readonly=True, copy=False)
+
+    _sql_constraints = [
+        ('construction_daily_balance_kind_uniq', 'unique(construction_daily_balance_id, construction_cost_kind)',
+         'Kunlik balans qatori uchun har bir xarajat turida bitta analitik qator bo\'lishi kerak!'),
+    ]
+
+    @api.model
+    def _construction_post_rows(self, rows):
+        """rows: [(daily_balance_id, project_id, date, material_cost, service_cost)]. Returns (created, updated, removed)."""
+        projects = {p.id: p for p in self.env['construction.project'].sudo().browse({row[1] for row in rows})}
+        existing = {
+            (line.construction_daily_balance_id.id, line.construction_cost_kind): line
+            for line in self.sudo().search([('construction_daily_balance_id', 'in', [row[0] for row in rows])])
+        }
+
+        vals_list, removed = [], self.browse()
+        updated = 0
+        for balance_id, project_id, day, material_cost, service_cost in rows:
+            project = projects[project_id]
+            costs = {'material': material_cost, 'service': service_cost}
+            for kind, cost in costs.items():
+                line = existing.get((balance_id, kind))
+                amount = -round(cost or 0.0, 2)
+                if not amount:
+                    removed |= line or self.browse()
+                    continue
+                if not project.analytic_account_id:
+                    continue
+                if line:
+                    if line.amount != amount or line.account_id != project.analytic_account_id:
+                        line.write({'amount': amount, 'account_id': project.analytic_account_id.id})
+                        updated += 1
+                    continue
+                vals_list.append({
+                    'name': f"{project.name}: {dict(self._fields['construction_cost_kind'].selection)[kind]}",
+                    'date': day,
+                    'amount': amount,
+                    'account_id': project.analytic_account_id.id,
+                    'company_id': project.company_id.id,
+                    'partner_id': project.customer_id.id,
+                    'construction_daily_balance_id': balance_id,
+                    'construction_cost_kind': kind,
+                })
+        if vals_list:
+            self.sudo().create(vals_list)
+        if removed:
+            removed.sudo().unlink()
+        return len(vals_list), updated, len(removed)
+
+    @api.model
+    def _cron_post_construction_costs(self):
+        """Posts the snapshot rows written since the stored cursor, in batches."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        last_ts, last_id = None, 0
+        cursor = ICP.get_param(POSTING_CURSOR_PARAM)
+        if cursor and '|' in cursor:
+            try:
+                last_ts = fields.Datetime.from_string(cursor.rsplit('|', 1)[0]) - POSTING_OVERLAP
+            except ValueError:
+                last_ts = None
+
+        self.env['construction.project.daily.balance'].flush_model()
+        deadline = time.monotonic() + POSTING_CRON_SECONDS
+        totals = [0, 0, 0]
+        while True:
+            if time.monotonic() > deadline:
+                cron = self.env.ref('construction_management.ir_cron_construction_analytic_posting', raise_if_not_found=False)
+                if cron:
+                    cron.sudo()._trigger()
+                break
+            clause, params = '', []
+            if last_ts:
+                clause, params = "WHERE (write_date, id) > (%s, %s)", [last_ts, last_id]
+            self.env.cr.execute(f"""
+                SELECT id, project_id, date, material_cost, service_cost, write_date
+                FROM construction_project_daily_balance
+                {clause}
+                ORDER BY write_date, id
+                LIMIT %s
+            """, params + [POSTING_BATCH])
+            rows = self.env.cr.fetchall()
+            if not rows:
+                break
+            for i, count in enumerate(self._construction_post_rows([row[:5] for row in rows])):
+                totals[i] += count
+            last_ts, last_id = rows[-1][5], rows[-1][0]
+            ICP.set_param(POSTING_CURSOR_PARAM, f"{fields.Datetime.to_string(last_ts)}|{last_id}")
+            self.env.cr.commit()
+            if len(rows) < POSTING_BATCH:
+                break
+        _logger.info(f"[ANALYTIC] Posted project costs: {totals[0]} created, {totals[1]} updated, {totals[2]} removed")
+
+    @api.model
+    def _cron_reconcile_construction_costs(self):
+        """
+        Daily safety net for the write_date cursor: posts every snapshot row
+        whose analytic lines differ from it, whenever it was written.
+        """
+        self.env['construction.project.daily.balance'].flush_model()
+        self.flush_model(['amount', 'account_id', 'construction_daily_balance_id', 'construction_cost_kind'])
+        deadline = time.monotonic() + POSTING_CRON_SECONDS
+        totals = [0, 0, 0]
+        last_id = 0
+        while time.monotonic() < deadline:
+            self.env.cr.execute(_RECONCILE_SQL, (last_id, POSTING_BATCH))
+            rows = self.env.cr.fetchall()
+            if not rows:
+                break
+            for i, count in enumerate(self._construction_post_rows(rows)):
+                totals[i] += count
+            last_id = rows[-1][0]
+            self.env.cr.commit()
+            if len(rows) < POSTING_BATCH:
+                break
+        if any(totals):
+            _logger.warning(f"[ANALYTIC] Reconcile fixed project costs missed by the cursor: "
+                            f"{totals[0]} created, {totals[1]} updated, {totals[2]} removed")
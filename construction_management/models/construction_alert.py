@@ -0,0 +1,204 @@
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Logs sent per cron run
+ALERT_SEND_BATCH = 100
+# Characters with a meaning in Telegram's (legacy) Markdown
+_MARKDOWN_SPECIAL = ('_', '*', '`', '[')
+
+
+def md_escape(text):
+    """Escapes a value placed outside Markdown entities (names are user input)."""
+    text = str(text or '')
+    for char in _MARKDOWN_SPECIAL:
+        text = text.replace(char, '\\' + char)
+    return text
+
+
+class ConstructionAlertRule(models.Model):
+    """
+    Threshold alerts evaluated on the cost / income deltas being written
+    (see _evaluate_deltas), never by rescanning projects. A rule fires when a
+    value crosses its threshold; the same stage or project is not alerted
+    again by that rule within the cool-down.
+    """
+    _name = 'construction.alert.rule'
+    _description = 'Ogohlantirish qoidasi'
+    _order = 'alert_type, id'
+
+    name = fields.Char(string='Nomi', required=True)
+    active = fields.Boolean(string='Faol', default=True)
+    alert_type = fields.Selection([
+        ('stage_over_budget', "Bosqich byudjetdan oshdi"),
+        ('project_low_balance', "Loyiha balansi chegaradan past"),
+    ], string='Turi', required=True, default='stage_over_budget')
+    threshold = fields.Float(
+        string='Chegara', default=100.0,
+        help="Bosqich uchun: taxminiy byudjetning foizi (100 = byudjet). "
+             "Loyiha uchun: balans summasi (0 = manfiy balans).")
+    project_ids = fields.Many2many('construction.project', string='Loyihalar',
+                                   help="Bo'sh bo'lsa, barcha loyihalar")
+    cooldown_hours = fields.Integer(string='Qayta ogohlantirish oralig\'i (soat)', default=24)
+    notify_manager = fields.Boolean(string='Loyiha menejeriga', default=True)
+    notify_customer = fields.Boolean(string='Buyurtmachiga', default=True)
+    company_id = fields.Many2one('res.company', string='Kompaniya', default=lambda self: self.env.company)
+    # Written whenever the rule fires; concurrent transactions firing it serialize on this row
+    last_alert_date = fields.Datetime(string='Oxirgi ogohlantirish', readonly=True, copy=False)
+    log_ids = fields.One2many('construction.alert.log', 'rule_id', string='Ogohlantirishlar', readonly=True)
+
+    @api.onchange('alert_type')
+    def _onchange_alert_type(self):
+        self.threshold = 100.0 if self.alert_type == 'stage_over_budget' else 0.0
+
+    def _applies_to(self, project_id, company_id):
+        if self.company_id and self.company_id.id != company_id:
+            return False
+        return not self.project_ids or project_id in self.project_ids.ids
+
+    @api.model
+    def _evaluate_deltas(self, stage_deltas=None, balance_deltas=None):
+        """
+        stage_deltas: {stage_id: actual_cost delta}, balance_deltas: {project_id: balance delta},
+        both already applied. Only rows whose value crossed a threshold with
+        this change raise an alert.
+        """
+        stage_deltas = {k: v for k, v in (stage_deltas or {}).items() if abs(v) > 1e-9}
+        balance_deltas = {k: v for k, v in (balance_deltas or {}).items() if abs(v) > 1e-9}
+        if not stage_deltas and not balance_deltas:
+            return
+        rules = self.sudo().search([])
+        if not rules:
+            return
+        Log = self.env['construction.alert.log'].sudo()
+        fired = Log.browse()
+
+        stage_rules = rules.filtered(lambda r: r.alert_type == 'stage_over_budget')
+        if stage_deltas and stage_rules:
+            self.env['construction.stage'].flush_model(['estimated_budget', 'actual_cost'])
+            self.env.cr.execute("""
+                SELECT st.id, st.project_id, p.company_id, st.name, p.name,
+                       st.estimated_budget, COALESCE(st.actual_cost, 0)
+                FROM construction_stage st
+                JOIN construction_project p ON p.id = st.project_id
+                WHERE st.id IN %s AND COALESCE(st.estimated_budget, 0) > 0
+            """, (tuple(stage_deltas),))
+            for stage_id, project_id, company_id, stage_name, project_name, budget, actual in self.env.cr.fetchall():
+                before = actual - stage_deltas[stage_id]
+                for rule in stage_rules:
+                    limit = budget * rule.threshold / 100.0
+                    if before <= limit < actual and rule._applies_to(project_id, company_id):
+                        fired |= Log._record(rule, project_id, actual, limit, stage_id=stage_id, message=(
+                            f"⚠️ *Bosqich byudjetdan oshdi*\n\n"
+                            f"🏗 Loyiha: {md_escape(project_name)}\n"
+                            f"📌 Bosqich: {md_escape(stage_name)}\n"
+                            f"💸 Xarajat: {actual:,.0f} so'm\n"
+                            f"📊 Byudjet: {budget:,.0f} so'm ({rule.threshold:g}%)"
+                        ))
+
+        balance_rules = rules.filtered(lambda r: r.alert_type == 'project_low_balance')
+        if balance_deltas and balance_rules:
+            self.env['construction.project'].flush_model(['balance'])
+            self.env.cr.execute("""
+                SELECT id, company_id, name, COALESCE(balance, 0) FROM construction_project WHERE id IN %s
+            """, (tuple(balance_deltas),))
+            for project_id, company_id, project_name, balance in self.env.cr.fetchall():
+                before = balance - balance_deltas[project_id]
+                for rule in balance_rules:
+                    if before >= rule.threshold > balance and rule._applies_to(project_id, company_id):
+                        fired |= Log._record(rule, project_id, balance, rule.threshold, message=(
+                            f"🔴 *Balans chegaradan pastga tushdi*\n\n"
+                            f"🏗 Loyiha: {md_escape(project_name)}\n"
+                            f"💰 Balans: {balance:,.0f} so'm\n"
+                            f"📉 Chegara: {rule.threshold:,.0f} so'm"
+                        ))
+
+        if fired:
+            cron = self.env.ref('construction_management.ir_cron_construction_alert_dispatch', raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger()
+
+
+class ConstructionAlertLog(models.Model):
+    """One fired alert; delivered through the bot by a cron after the commit."""
+    _name = 'construction.alert.log'
+    _description = 'Ogohlantirish'
+    _order = 'create_date desc, id desc'
+    _rec_name = 'rule_id'
+
+    rule_id = fields.Many2one('construction.alert.rule', string='Qoida', required=True, ondelete='cascade', readonly=True)
+    project_id = fields.Many2one('construction.project', string='Loyiha', required=True, ondelete='cascade', readonly=True)
+    stage_id = fields.Many2one('construction.stage', string='Bosqich', ondelete='cascade', readonly=True)
+    # rule:project or rule:stage, matched for the cool-down
+    dedupe_key = fields.Char(string='Kalit', required=True, index=True, readonly=True)
+    value = fields.Float(string='Qiymat', readonly=True)
+    threshold = fields.Float(string='Chegara', readonly=True)
+    message = fields.Text(string='Xabar', readonly=True)
+    state = fields.Selection([
+        ('pending', 'Kutilmoqda'),
+        ('sent', 'Yuborildi'),
+        ('failed', 'Xatolik'),
+    ], string='Holat', default='pending', required=True, index=True, readonly=True)
+    sent_at = fields.Datetime(string='Yuborilgan vaqt', readonly=True)
+    recipient_count = fields.Integer(string='Qabul qiluvchilar', readonly=True)
+
+    @api.model
+    def _record(self, rule, project_id, value, threshold, stage_id=None, message=''):
+        key = f"{rule.id}:stage:{stage_id}" if stage_id else f"{rule.id}:project:{project_id}"
+        # Concurrent transactions firing the same rule wait here; the later one
+        # hits a serialization failure on the rule row written below and is
+        # retried, so it sees this log and respects the cool-down
+        self.env.cr.execute("SELECT id FROM construction_alert_rule WHERE id = %s FOR UPDATE", (rule.id,))
+        since = fields.Datetime.now() - timedelta(hours=max(rule.cooldown_hours, 0))
+        if self.search_count([('dedupe_key', '=', key), ('create_date', '>=', since)], limit=1):
+            return self.browse()
+        log = self.create({
+            'rule_id': rule.id,
+            'project_id': project_id,
+            'stage_id': stage_id,
+            'dedupe_key': key,
+            'value': value,
+            'threshold': threshold,
+            'message': message,
+        })
+        rule.write({'last_alert_date': fields.Datetime.now()})
+        rule.flush_recordset(['last_alert_date'])
+        _logger.info(f"[ALERT] {rule.name}: {key} value={value:.2f} threshold={threshold:.2f}")
+        return log
+
+    def _get_chat_ids(self):
+        self.ensure_one()
+        if 'telegram_chat_id' not in self.env['res.partner']._fields:
+            return []
+        project = self.project_id
+        chat_ids = []
+        if self.rule_id.notify_manager and project.user_id.partner_id.telegram_chat_id:
+            chat_ids.append(project.user_id.partner_id.telegram_chat_id)
+        if self.rule_id.notify_customer and project.customer_id.telegram_chat_id:
+            chat_ids.append(project.customer_id.telegram_chat_id)
+        return list(dict.fromkeys(chat_ids))
+
+    @api.model
+    def _cron_send_pending(self):
+        if 'construction.telegram.bot' not in self.env:
+            _logger.warning("[ALERT] Telegram bot module not installed, alerts stay pending")
+            return
+        bot = self.env['construction.telegram.bot'].sudo()
+        logs = self.sudo().search([('state', '=', 'pending')], order='id', limit=ALERT_SEND_BATCH)
+        for log in logs:
+            chat_ids = log._get_chat_ids()
+            sent = 0
+            for chat_id in chat_ids:
+                res = bot._send_message(chat_id, log.message)
+                if res and res.get('ok'):
+                    sent += 1
+            log.write({
+                'state': 'sent' if sent or not chat_ids else 'failed',
+                'sent_at': fields.Datetime.now(),
+                'recipient_count': sent,
+            })
+            self.env.cr.commit()
+        if len(logs) == ALERT_SEND_BATCH:
+            self.env.ref('construction_management.ir_cron_construction_alert_dispatch').sudo()._trigger()
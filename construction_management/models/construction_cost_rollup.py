@@ -0,0 +1,121 @@
+from odoo import models, api
+from collections import defaultdict
+
+
+class ConstructionCostRollupSourceMixin(models.AbstractModel):
+    """
+    Stage materials/services: every create, write or unlink pushes its old/new
+    total_cost delta into task.total_cost, stage.actual_cost and the project's
+    total_expense / total_cost / balance, one UPDATE per level. The rollups are
+    plain stored fields; construction.project.check_cost_rollups reconciles them.
+    """
+    _name = 'construction.cost.rollup.source.mixin'
+    _description = 'Xarajat yig\'indisi manbasi'
+
+    # Writes touching none of these cannot change the rollups
+    _cost_rollup_trigger_fields = ('total_cost', 'quantity', 'quantity_planned', 'unit_price', 'task_id', 'stage_id')
+
+    def _cost_rollup_deltas(self, sign=1):
+        """{level: {id: amount}} for 'task', 'stage', 'expense' and 'cost' (project levels)."""
+        deltas = defaultdict(lambda: defaultdict(float))
+        for rec in self.sudo():
+            amount = sign * (rec.total_cost or 0.0)
+            if not amount:
+                continue
+            if rec.task_id:
+                deltas['task'][rec.task_id.id] += amount
+                # total_expense sums the tasks of the project's stages
+                if rec.task_id.stage_id.project_id:
+                    deltas['expense'][rec.task_id.stage_id.project_id.id] += amount
+            if rec.stage_id:
+                deltas['stage'][rec.stage_id.id] += amount
+                deltas['cost'][rec.stage_id.project_id.id] += amount
+        return deltas
+
+    @api.model
+    def _apply_cost_rollup_deltas(self, deltas):
+        def values(level):
+            items = [(res_id, amount) for res_id, amount in deltas.get(level, {}).items() if abs(amount) > 1e-9]
+            if not items:
+                return None, []
+            rows = ', '.join(['(%s, %s::float8)'] * len(items))
+            return rows, [value for item in items for value in item]
+
+        Task = self.env['construction.stage.task']
+        Stage = self.env['construction.stage']
+        Project = self.env['construction.project']
+        Task.flush_model(['total_cost'])
+        Stage.flush_model(['actual_cost'])
+        Project.flush_model(['total_expense', 'total_cost', 'balance'])
+
+        cr = self.env.cr
+        rows, params = values('task')
+        if rows:
+            cr.execute(f"""
+                UPDATE construction_stage_task t
+                SET total_cost = COALESCE(t.total_cost, 0) + d.amount
+                FROM (VALUES {rows}) AS d(id, amount)
+                WHERE t.id = d.id
+            """, params)
+        rows, params = values('stage')
+        if rows:
+            cr.execute(f"""
+                UPDATE construction_stage s
+                SET actual_cost = COALESCE(s.actual_cost, 0) + d.amount
+                FROM (VALUES {rows}) AS d(id, amount)
+                WHERE s.id = d.id
+            """, params)
+
+        project_deltas = defaultdict(lambda: [0.0, 0.0])
+        for project_id, amount in deltas.get('expense', {}).items():
+            project_deltas[project_id][0] += amount
+        for project_id, amount in deltas.get('cost', {}).items():
+            project_deltas[project_id][1] += amount
+        items = [(pid, exp, cost) for pid, (exp, cost) in project_deltas.items()
+                 if abs(exp) > 1e-9 or abs(cost) > 1e-9]
+        if items:
+            rows = ', '.join(['(%s, %s::float8, %s::float8)'] * len(items))
+            cr.execute(f"""
+                UPDATE construction_project p
+                SET total_expense = COALESCE(p.total_expense, 0) + d.expense,
+                    balance = COALESCE(p.balance, 0) - d.expense,
+                    total_cost = COALESCE(p.total_cost, 0) + d.cost
+                FROM (VALUES {rows}) AS d(id, expense, cost)
+                WHERE p.id = d.id
+            """, [value for item in items for value in item])
+
+        Task.invalidate_model(['total_cost'])
+        Stage.invalidate_model(['actual_cost'])
+        Project.invalidate_model(['total_expense', 'total_cost', 'balance'])
+
+        self.env['construction.alert.rule']._evaluate_deltas(
+            stage_deltas=deltas.get('stage'),
+            balance_deltas={project_id: -amount for project_id, amount in deltas.get('expense', {}).items()},
+        )
+
+    @staticmethod
+    def _merge_cost_rollup_deltas(deltas, other):
+        for level, amounts in other.items():
+            for res_id, amount in amounts.items():
+                deltas[level][res_id] += amount
+        return deltas
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self._apply_cost_rollup_deltas(records._cost_rollup_deltas())
+        return records
+
+    def write(self, vals):
+        if not any(field in vals for field in self._cost_rollup_trigger_fields):
+            return super().write(vals)
+        deltas = self._cost_rollup_deltas(-1)
+        res = super().write(vals)
+        self._apply_cost_rollup_deltas(self._merge_cost_rollup_deltas(deltas, self._cost_rollup_deltas()))
+        return res
+
+    def unlink(self):
+        deltas = self._cost_rollup_deltas(-1)
+        res = super().unlink()
+        self._apply_cost_rollup_deltas(deltas)
+        return res
@@ -0,0 +1,245 @@
+from odoo import models, fields, api
+from odoo.tools.sql import table_exists, create_index
+from collections import defaultdict
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Snapshot column fed by each source model
+_BALANCE_COLUMNS = ('income', 'material_cost', 'service_cost')
+
+# (project_id, date, income, material_cost, service_cost) per day, straight from the lines.
+# Costs are the task lines, attributed to the task's project: the same set as
+# construction.project.total_expense, so the snapshot agrees with project.balance.
+_DAILY_SOURCE_SQL = """
+    SELECT project_id, date, SUM(income) AS income,
+           SUM(material_cost) AS material_cost, SUM(service_cost) AS service_cost
+    FROM (
+        SELECT i.project_id, i.date, COALESCE(i.amount, 0) AS income,
+               0.0 AS material_cost, 0.0 AS service_cost
+        FROM construction_project_income i
+        UNION ALL
+        SELECT ts.project_id, m.date, 0.0, COALESCE(m.total_cost, 0), 0.0
+        FROM construction_stage_material m
+        JOIN construction_stage_task t ON t.id = m.task_id
+        JOIN construction_stage ts ON ts.id = t.stage_id
+        UNION ALL
+        SELECT ts.project_id, s.date, 0.0, 0.0, COALESCE(s.total_cost, 0)
+        FROM construction_stage_service s
+        JOIN construction_stage_task t ON t.id = s.task_id
+        JOIN construction_stage ts ON ts.id = t.stage_id
+    ) lines
+    WHERE date IS NOT NULL AND project_id IS NOT NULL {where}
+    GROUP BY project_id, date
+"""
+
+TOLERANCE = 0.01
+
+
+class ConstructionDailyBalanceSourceMixin(models.AbstractModel):
+    """
+    Incomes and task materials/services: every create, write or unlink pushes
+    its (project, date) delta into construction.project.daily.balance.
+    """
+    _name = 'construction.daily.balance.source.mixin'
+    _description = 'Kunlik balans manbasi'
+
+    # Snapshot column ('income', 'material_cost' or 'service_cost')
+    _daily_balance_column = None
+    _daily_balance_amount_field = 'total_cost'
+    _daily_balance_project_path = 'project_id'
+    # Writes touching none of these cannot change the snapshot
+    _daily_balance_trigger_fields = ()
+
+    def _daily_balance_deltas(self, sign=1):
+        deltas = defaultdict(float)
+        for rec in self.sudo():
+            project = rec.mapped(self._daily_balance_project_path)
+            if project and rec.date:
+                deltas[(project.id, rec.date, self._daily_balance_column)] += sign * (rec[self._daily_balance_amount_field] or 0.0)
+        return deltas
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env['construction.project.daily.balance']._apply_deltas(records._daily_balance_deltas())
+        return records
+
+    def write(self, vals):
+        if not any(field in vals for field in self._daily_balance_trigger_fields):
+            return super().write(vals)
+        deltas = self._daily_balance_deltas(-1)
+        res = super().write(vals)
+        for key, amount in self._daily_balance_deltas().items():
+            deltas[key] += amount
+        self.env['construction.project.daily.balance']._apply_deltas(deltas)
+        return res
+
+    def unlink(self):
+        deltas = self._daily_balance_deltas(-1)
+        res = super().unlink()
+        self.env['construction.project.daily.balance']._apply_deltas(deltas)
+        return res
+
+
+class ConstructionProjectDailyBalance(models.Model):
+    """
+    One row per project and day with any movement: the day's income, material
+    and service cost. Only daily amounts are stored, so a delta touches a
+    single row; running totals are summed on read (see get_period_totals).
+    """
+    _name = 'construction.project.daily.balance'
+    _description = 'Loyiha kunlik balansi'
+    _order = 'project_id, date'
+    _rec_name = 'date'
+
+    project_id = fields.Many2one('construction.project', string='Loyiha', required=True, ondelete='cascade', readonly=True)
+    date = fields.Date(string='Sana', required=True, readonly=True)
+    income = fields.Float(string='Kirim', readonly=True)
+    material_cost = fields.Float(string='Material xarajati', readonly=True)
+    service_cost = fields.Float(string='Xizmat xarajati', readonly=True)
+
+    _sql_constraints = [
+        ('project_date_uniq', 'unique(project_id, date)', 'Loyiha uchun bir kunda bitta balans qatori bo\'lishi kerak!'),
+    ]
+
+    def init(self):
+        cr = self.env.cr
+        # Cursor of the analytic posting cron (account.analytic.line)
+        create_index(cr, 'construction_project_daily_balance_write_date_idx', self._table, ['write_date', 'id'])
+        # Existing databases: fill the new table once. On a fresh install the
+        # source tables may not exist yet, and there is nothing to fill anyway.
+        if not all(table_exists(cr, t) for t in (
+                'construction_project_income', 'construction_stage_material', 'construction_stage_service',
+                'construction_stage_task')):
+            return
+        cr.execute("SELECT 1 FROM construction_project_daily_balance LIMIT 1")
+        if not cr.fetchone():
+            self._rebuild_sql()
+
+    @api.model
+    def _apply_deltas(self, deltas):
+        """deltas: {(project_id, date, column): amount}"""
+        by_day = defaultdict(lambda: dict.fromkeys(_BALANCE_COLUMNS, 0.0))
+        for (project_id, day, column), amount in deltas.items():
+            by_day[(project_id, day)][column] += amount
+        # Sorted, so concurrent writers lock the rows in the same order
+        items = [
+            (project_id, day, delta['income'], delta['material_cost'], delta['service_cost'])
+            for (project_id, day), delta in sorted(by_day.items())
+            if any(abs(value) >= 1e-9 for value in delta.values())
+        ]
+        if not items:
+            return
+
+        rows = ', '.join(['(%s, %s::date, %s::float8, %s::float8, %s::float8)'] * len(items))
+        self.env.cr.execute(f"""
+            INSERT INTO construction_project_daily_balance
+                (project_id, date, income, material_cost, service_cost,
+                 create_uid, create_date, write_uid, write_date)
+            SELECT d.project_id, d.date, d.income, d.material_cost, d.service_cost,
+                   %s, (now() at time zone 'UTC'), %s, (now() at time zone 'UTC')
+            FROM (VALUES {rows}) AS d(project_id, date, income, material_cost, service_cost)
+            ON CONFLICT (project_id, date) DO UPDATE SET
+                income = construction_project_daily_balance.income + EXCLUDED.income,
+                material_cost = construction_project_daily_balance.material_cost + EXCLUDED.material_cost,
+                service_cost = construction_project_daily_balance.service_cost + EXCLUDED.service_cost,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+        """, [self.env.uid, self.env.uid] + [value for item in items for value in item])
+        self.invalidate_model()
+
+    def _flush_sources(self):
+        self.env['construction.project.income'].flush_model(['project_id', 'date', 'amount'])
+        for source in ('construction.stage.material', 'construction.stage.service'):
+            self.env[source].flush_model(['task_id', 'date', 'total_cost'])
+        self.env['construction.stage.task'].flush_model(['stage_id'])
+        self.env['construction.stage'].flush_model(['project_id'])
+
+    def _rebuild_sql(self, project_ids=None):
+        where, params = '', []
+        if project_ids:
+            where, params = "AND project_id IN %s", [tuple(project_ids)]
+            self.env.cr.execute("DELETE FROM construction_project_daily_balance WHERE project_id IN %s",
+                                (tuple(project_ids),))
+        else:
+            self.env.cr.execute("DELETE FROM construction_project_daily_balance")
+        self.env.cr.execute(f"""
+            INSERT INTO construction_project_daily_balance
+                (project_id, date, income, material_cost, service_cost,
+                 create_uid, create_date, write_uid, write_date)
+            SELECT d.project_id, d.date, d.income, d.material_cost, d.service_cost,
+                   %s, (now() at time zone 'UTC'), %s, (now() at time zone 'UTC')
+            FROM ({_DAILY_SOURCE_SQL.format(where=where)}) d
+        """, params + [self.env.uid, self.env.uid])
+
+    @api.model
+    def rebuild(self, project_ids=None):
+        """Recomputes the snapshot from the lines (all projects by default)."""
+        self._flush_sources()
+        self._rebuild_sql(project_ids)
+        self.invalidate_model()
+        _logger.info(f"[DAILY BALANCE] Rebuilt {'all projects' if not project_ids else project_ids}")
+
+    @api.model
+    def check_consistency(self, project_ids=None, repair=False):
+        """
+        Compares the snapshot with a recomputation from the lines.
+        Returns the ids of projects that differ; with repair=True they are rebuilt.
+        """
+        self._flush_sources()
+        where, params = '', []
+        scope = ''
+        if project_ids:
+            where, params = "AND project_id IN %s", [tuple(project_ids)]
+            scope = "AND COALESCE(e.project_id, b.project_id) IN %s"
+            params.append(tuple(project_ids))
+        self.env.cr.execute(f"""
+            WITH expected AS ({_DAILY_SOURCE_SQL.format(where=where)})
+            SELECT DISTINCT COALESCE(e.project_id, b.project_id)
+            FROM expected e
+            FULL OUTER JOIN construction_project_daily_balance b
+                 ON b.project_id = e.project_id AND b.date = e.date
+            WHERE TRUE {scope}
+              AND CASE
+                  WHEN b.id IS NULL THEN TRUE
+                  -- A day whose lines were all removed stays as an all-zero row
+                  WHEN e.project_id IS NULL THEN
+                      ABS(b.income) + ABS(b.material_cost) + ABS(b.service_cost) > %s
+                  ELSE ABS(e.income - b.income) > %s
+                    OR ABS(e.material_cost - b.material_cost) > %s
+                    OR ABS(e.service_cost - b.service_cost) > %s
+              END
+        """, params + [TOLERANCE] * 4)
+        mismatched = [row[0] for row in self.env.cr.fetchall()]
+        if mismatched:
+            _logger.warning(f"[DAILY BALANCE] Snapshot differs from the lines for projects {mismatched}")
+            if repair:
+                self.rebuild(mismatched)
+        return mismatched
+
+    @api.model
+    def get_period_totals(self, project_id, date_from=None, date_to=None):
+        """
+        Income / material / service totals between two dates (inclusive) and the
+        balance at date_to, in one pass over the project's daily rows.
+        """
+        clause, params = '', []
+        if date_to:
+            clause, params = "AND date <= %s", [date_to]
+        self.env.cr.execute(f"""
+            SELECT COALESCE(SUM(income) FILTER (WHERE date >= %s), 0),
+                   COALESCE(SUM(material_cost) FILTER (WHERE date >= %s), 0),
+                   COALESCE(SUM(service_cost) FILTER (WHERE date >= %s), 0),
+                   COALESCE(SUM(income - material_cost - service_cost), 0)
+            FROM construction_project_daily_balance
+            WHERE project_id = %s {clause}
+        """, [date_from or '-infinity'] * 3 + [project_id] + params)
+        income, material_cost, service_cost, closing_balance = self.env.cr.fetchone()
+        return {
+            'income': income,
+            'material_cost': material_cost,
+            'service_cost': service_cost,
+            'expense': material_cost + service_cost,
+            'closing_balance': closing_balance,
+        }
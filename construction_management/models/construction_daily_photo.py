@@ -45,6 +45,7 @@ class ConstructionDailyPhoto(models.Model):
 
 class ConstructionDailyPhotoLine(models.Model):
     _name = 'construction.daily.photo.line'
+    _inherit = ['construction.image.rendition.mixin']
     _description = 'Construction Daily Photo Line'
 
     photo_id = fields.Many2one('construction.daily.photo', string='Photo Header', required=True, ondelete='cascade')
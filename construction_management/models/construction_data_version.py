@@ -0,0 +1,100 @@
+from odoo import models, fields, api
+from datetime import timedelta
+
+DEFAULT_TOMBSTONE_DAYS = 30
+
+
+class ConstructionProjectVersionMixin(models.AbstractModel):
+    """
+    Bumps construction.project.data_version whenever a record that feeds the
+    WebApp dashboard is created, changed or deleted. The version is part of the
+    WebApp cache key / ETag.
+    """
+    _name = 'construction.project.version.mixin'
+    _description = 'Loyiha ma\'lumotlari versiyasi'
+
+    # Dotted path from the record to its construction.project
+    _project_version_path = 'project_id'
+
+    def _get_versioned_project_ids(self):
+        return set(self.sudo().mapped(self._project_version_path).ids)
+
+    def _get_versioned_project_map(self):
+        """{record id: project id}, used for the deletion tombstones."""
+        return {rec.id: rec.mapped(self._project_version_path).id for rec in self.sudo()}
+
+    def _bump_project_version(self, project_ids):
+        """
+        Increments data_version. WebApp clients long-poll /webapp/api/changes
+        on it, and it keys the summary cache / ETag. Writes that change nothing
+        the dashboard shows pass skip_project_version=True.
+        """
+        if not project_ids or self.env.context.get('skip_project_version'):
+            return
+        self.env.cr.execute("""
+            UPDATE construction_project
+            SET data_version = COALESCE(data_version, 0) + 1
+            WHERE id IN %s
+        """, (tuple(project_ids),))
+        self.env['construction.project'].browse(project_ids).invalidate_recordset(['data_version'])
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._bump_project_version(records._get_versioned_project_ids())
+        return records
+
+    def write(self, vals):
+        # Records may move to another stage/project: bump both sides
+        before = self._get_versioned_project_ids()
+        res = super().write(vals)
+        self._bump_project_version(before | self._get_versioned_project_ids())
+        return res
+
+    def unlink(self):
+        project_map = self._get_versioned_project_map()
+        res = super().unlink()
+        self.env['construction.sync.tombstone'].record(self._name, project_map)
+        self._bump_project_version(set(project_map.values()) - {False})
+        return res
+
+
+class ConstructionSyncTombstone(models.Model):
+    """
+    Deleted dashboard records, so the WebApp delta sync (/webapp/api/changes) can
+    tell clients what to drop. Rows removed by a database cascade (services of a
+    deleted stage...) get no tombstone of their own: the parent's one implies them.
+    """
+    _name = 'construction.sync.tombstone'
+    _description = 'O\'chirilgan yozuvlar (sinxronizatsiya)'
+    _order = 'deleted_at desc, id desc'
+
+    model_name = fields.Char(string='Model', required=True, index=True)
+    res_id = fields.Integer(string='Yozuv ID', required=True)
+    project_id = fields.Many2one('construction.project', string='Loyiha', ondelete='cascade', index=True)
+    deleted_at = fields.Datetime(string='O\'chirilgan vaqt', required=True, default=fields.Datetime.now, index=True)
+
+    @api.model
+    def get_retention_days(self):
+        try:
+            return int(self.env['ir.config_parameter'].sudo().get_param(
+                'construction.sync_tombstone_days', DEFAULT_TOMBSTONE_DAYS))
+        except (TypeError, ValueError):
+            return DEFAULT_TOMBSTONE_DAYS
+
+    @api.model
+    def record(self, model_name, project_map):
+        vals_list = [{
+            'model_name': model_name,
+            'res_id': res_id,
+            'project_id': project_id,
+        } for res_id, project_id in project_map.items() if project_id]
+        if vals_list:
+            self.sudo().create(vals_list)
+
+    @api.model
+    def cleanup_old(self):
+        """Cron: clients older than the retention window do a full resync instead."""
+        limit_date = fields.Datetime.now() - timedelta(days=self.get_retention_days())
+        self.env.cr.execute("DELETE FROM construction_sync_tombstone WHERE deleted_at < %s", (limit_date,))
+
@@ -1,13 +1,18 @@
 from odoo import models, fields, api
+from odoo.tools.sql import create_index
 
 class ConstructionStageImage(models.Model):
     _name = 'construction.stage.image'
+    _inherit = ['construction.project.version.mixin', 'construction.image.rendition.mixin']
+    _project_version_path = 'stage_id.project_id'
     _description = 'Stage Image'
     _order = 'upload_date desc'
 
     name = fields.Char(string='Description')
     stage_id = fields.Many2one('construction.stage', string='Stage', ondelete='cascade')
     task_id = fields.Many2one('construction.stage.task', string='Task', domain="[('stage_id', '=', stage_id)]")
+    # Images may be linked through the task only
+    project_id = fields.Many2one('construction.project', string='Project', compute='_compute_project_id', store=True, index=True)
     image = fields.Binary(string='Image', required=True, attachment=True)
     uploaded_by = fields.Many2one('res.users', string='Uploaded By', default=lambda self: self.env.user)
     upload_date = fields.Datetime(string='Upload Date', default=fields.Datetime.now)
@@ -16,9 +21,28 @@ class ConstructionStageImage(models.Model):
         ('telegram', 'Telegram')
     ], string='Source', default='odoo')
 
+    def init(self):
+        create_index(self.env.cr, 'construction_stage_image_project_upload_date_idx',
+                     self._table, ['project_id', 'upload_date'])
+
+    @api.depends('stage_id.project_id', 'task_id.stage_id.project_id')
+    def _compute_project_id(self):
+        for rec in self:
+            rec.project_id = rec.stage_id.project_id or rec.task_id.stage_id.project_id
+
     @api.model
     def create(self, vals):
         if vals.get('task_id') and not vals.get('stage_id'):
             task = self.env['construction.stage.task'].browse(vals['task_id'])
             vals['stage_id'] = task.stage_id.id
         return super(ConstructionStageImage, self).create(vals)
+
+    def _get_versioned_project_ids(self):
+        # Images may be linked through the task only
+        return super()._get_versioned_project_ids() | set(self.sudo().mapped('task_id.stage_id.project_id').ids)
+
+    def _get_versioned_project_map(self):
+        return {
+            rec.id: rec.stage_id.project_id.id or rec.task_id.stage_id.project_id.id
+            for rec in self.sudo()
+        }
@@ -0,0 +1,132 @@
+from odoo import models, fields, api
+from odoo.tools.image import image_process
+import base64
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Rendition field -> longest side in pixels
+RENDITION_SIZES = {
+    'image_256': 256,
+    'image_1024': 1024,
+}
+# Accepted values of the ?size= parameter
+RENDITION_ALIASES = {
+    'small': 'image_256',
+    '256': 'image_256',
+    'medium': 'image_1024',
+    '1024': 'image_1024',
+}
+RENDITION_QUALITY = 80
+RENDITION_BATCH = 20
+# One cron run stops after this; it re-triggers itself while work remains
+RENDITION_CRON_SECONDS = 120
+
+
+class ConstructionImageRenditionMixin(models.AbstractModel):
+    """
+    Downscaled JPEG copies of a photo field for galleries and kanban tiles.
+    They are generated by a cron, never during the upload request. Existing
+    records start as pending, so the same cron is the backfill.
+    """
+    _name = 'construction.image.rendition.mixin'
+    _description = 'Rasm kichik nusxalari'
+
+    # Binary field holding the original photo
+    _rendition_source_field = 'image'
+
+    image_256 = fields.Binary(string='Rasm (kichik)', attachment=True, readonly=True)
+    image_1024 = fields.Binary(string='Rasm (o\'rta)', attachment=True, readonly=True)
+    rendition_pending = fields.Boolean(string='Nusxalar kutilmoqda', default=True, index=True, copy=False)
+
+    @api.model
+    def _get_rendition_field(self, size):
+        """Rendition field for a ?size= value, None for the original."""
+        return RENDITION_ALIASES.get(str(size or '').lower())
+
+    @api.model
+    def _trigger_renditions(self):
+        cron = self.env.ref('construction_management.ir_cron_construction_image_renditions', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        if any(vals.get(self._rendition_source_field) for vals in vals_list):
+            self._trigger_renditions()
+        return records
+
+    def write(self, vals):
+        if self._rendition_source_field in vals:
+            vals = dict(vals, rendition_pending=True, **{field: False for field in RENDITION_SIZES})
+            res = super().write(vals)
+            self._trigger_renditions()
+            return res
+        return super().write(vals)
+
+    def _generate_pending_renditions(self, batch_size=RENDITION_BATCH):
+        """
+        Processes one batch of pending records. Returns how many were handled.
+        The renditions are stored with one attachment create and the flags
+        cleared with one write; none of it bumps the project data_version, the
+        image URLs already fall back to the original until a rendition exists.
+        """
+        records = self.sudo().search([('rendition_pending', '=', True)], limit=batch_size)
+        if not records:
+            return 0
+        attachment_vals = []
+        for rec in records:
+            source = rec[self._rendition_source_field]
+            if not source:
+                continue
+            for field_name, size in RENDITION_SIZES.items():
+                try:
+                    resized = image_process(base64.b64decode(source), size=(size, size),
+                                            quality=RENDITION_QUALITY, output_format='JPEG')
+                except Exception as e:
+                    _logger.warning(f"[RENDITION] {rec._name}({rec.id}) {field_name} failed: {e}")
+                    continue
+                attachment_vals.append({
+                    'name': field_name,
+                    'res_model': rec._name,
+                    'res_field': field_name,
+                    'res_id': rec.id,
+                    'type': 'binary',
+                    'raw': resized,
+                })
+
+        Attachment = self.env['ir.attachment'].sudo()
+        # Renditions left over from an interrupted run
+        Attachment.search([
+            ('res_model', '=', records._name),
+            ('res_field', 'in', list(RENDITION_SIZES)),
+            ('res_id', 'in', records.ids),
+        ]).unlink()
+        if attachment_vals:
+            Attachment.create(attachment_vals)
+        records.with_context(skip_project_version=True).write({'rendition_pending': False})
+        records.invalidate_recordset(list(RENDITION_SIZES))
+        return len(records)
+
+    @api.model
+    def _cron_generate_renditions(self):
+        deadline = time.monotonic() + RENDITION_CRON_SECONDS
+        model_names = [
+            name for name in self.env.registry.descendants(['construction.image.rendition.mixin'], '_inherit')
+            if not self.env[name]._abstract
+        ]
+        remaining = False
+        for model_name in model_names:
+            Model = self.env[model_name]
+            while True:
+                if time.monotonic() > deadline:
+                    remaining = True
+                    break
+                done = Model._generate_pending_renditions()
+                self.env.cr.commit()
+                if done < RENDITION_BATCH:
+                    break
+        if remaining:
+            self._trigger_renditions()
@@ -467,7 +467,9 @@ class ConstructionMaterialRequestBatch(models.Model):
 
 class ConstructionMaterialRequestLine(models.Model):
     _name = 'construction.material.request.line'
+    _inherit = ['construction.price.source.mixin']
     _description = 'Material Request Line'
+    _price_index_trigger_fields = ('unit_price', 'product_name')
 
     batch_id = fields.Many2one('construction.material.request.batch', string='So‘rov', required=True, ondelete='cascade')
     product_name = fields.Char(string='Mahsulot nomi', required=True)
@@ -480,3 +482,9 @@ class ConstructionMaterialRequestLine(models.Model):
     def _compute_total_price(self):
         for line in self:
             line.total_price = line.quantity * line.unit_price
+
+    @api.depends('product_name')
+    def _compute_price_key(self):
+        PriceIndex = self.env['construction.price.index']
+        for line in self:
+            line.price_key, line.uom_key = PriceIndex.make_key(line.product_name)
@@ -1,12 +1,27 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.tools.sql import create_index
+from collections import defaultdict
+import logging
+
+_logger = logging.getLogger(__name__)
 
 class StageMaterial(models.Model):
     _name = 'construction.stage.material'
+    _inherit = ['construction.price.source.mixin', 'construction.project.version.mixin',
+                'construction.daily.balance.source.mixin', 'construction.cost.rollup.source.mixin']
+    _project_version_path = 'stage_id.project_id'
     _description = 'Stage Material'
+    _price_index_trigger_fields = ('unit_price', 'product_id', 'construction_uom_id', 'uom_id')
+    _daily_balance_column = 'material_cost'
+    # Same line set as project.total_expense: task lines, on the task's project
+    _daily_balance_project_path = 'task_id.stage_id.project_id'
+    _daily_balance_trigger_fields = ('quantity_planned', 'unit_price', 'total_cost', 'date', 'task_id')
 
     stage_id = fields.Many2one('construction.stage', string='Bosqich', required=True, ondelete='cascade')
     task_id = fields.Many2one('construction.stage.task', string='Vazifa', ondelete='cascade')
+    # Denormalized for project/date filters without joining construction_stage
+    project_id = fields.Many2one('construction.project', string='Loyiha', related='stage_id.project_id', store=True, index=True)
 
     company_id = fields.Many2one('res.company', string='Kompaniya', required=True, default=lambda self: self.env.company)
     currency_id = fields.Many2one('res.currency', related='company_id.currency_id', string='Valyuta', readonly=True)
@@ -29,6 +44,10 @@ class StageMaterial(models.Model):
     ], string='Holat', default='draft')
     notes = fields.Text(string='Izohlar')
 
+    def init(self):
+        create_index(self.env.cr, 'construction_stage_material_project_date_idx',
+                     self._table, ['project_id', 'date'])
+
     @api.onchange('product_id')
     def _onchange_product_id(self):
         if self.product_id:
@@ -41,6 +60,13 @@ class StageMaterial(models.Model):
         for record in self:
             record.total_cost = record.quantity_planned * record.unit_price
 
+    @api.depends('product_id.name', 'construction_uom_id.name', 'uom_id.name')
+    def _compute_price_key(self):
+        PriceIndex = self.env['construction.price.index']
+        for record in self:
+            uom = record.construction_uom_id.name or record.uom_id.name
+            record.price_key, record.uom_key = PriceIndex.make_key(record.product_id.name, uom)
+
 
     @api.model_create_multi
     def create(self, vals_list):
@@ -57,10 +83,18 @@ class StageMaterial(models.Model):
 
 class StageService(models.Model):
     _name = 'construction.stage.service'
+    _inherit = ['construction.project.version.mixin', 'construction.daily.balance.source.mixin',
+                'construction.cost.rollup.source.mixin']
+    _project_version_path = 'stage_id.project_id'
     _description = 'Stage Service'
+    _daily_balance_column = 'service_cost'
+    _daily_balance_project_path = 'task_id.stage_id.project_id'
+    _daily_balance_trigger_fields = ('quantity', 'unit_price', 'total_cost', 'date', 'task_id')
 
     stage_id = fields.Many2one('construction.stage', string='Bosqich', required=True, ondelete='cascade')
     task_id = fields.Many2one('construction.stage.task', string='Vazifa', ondelete='cascade')
+    # Denormalized for project/date filters without joining construction_stage
+    project_id = fields.Many2one('construction.project', string='Loyiha', related='stage_id.project_id', store=True, index=True)
 
     company_id = fields.Many2one('res.company', string='Kompaniya', required=True, default=lambda self: self.env.company)
     currency_id = fields.Many2one('res.currency', related='company_id.currency_id', string='Valyuta', readonly=True)
@@ -72,7 +106,9 @@ class StageService(models.Model):
     quantity = fields.Float(string='Miqdor', default=1.0)
     uom_id = fields.Many2one('uom.uom', related='service_id.uom_id', string='O\'lchov birligi (Standard)', readonly=True)
     construction_uom_id = fields.Many2one('construction.uom', string='O\'lchov birligi')
-    unit_price = fields.Float(string='Narx', related='service_id.list_price', readonly=False, store=True)
+    # Snapshot of the service's list price when the line was created;
+    # catalog changes reach existing lines only through reprice_open_lines
+    unit_price = fields.Float(string='Narx')
     
     total_cost = fields.Float(string='Jami xarajat', compute='_compute_total_cost', store=True)
     
@@ -89,6 +125,10 @@ class StageService(models.Model):
 
     is_done = fields.Boolean(string='Bajarildi')
 
+    def init(self):
+        create_index(self.env.cr, 'construction_stage_service_project_date_idx',
+                     self._table, ['project_id', 'date'])
+
     @api.model_create_multi
     def create(self, vals_list):
         for vals in vals_list:
@@ -96,8 +136,88 @@ class StageService(models.Model):
                 task = self.env['construction.stage.task'].browse(vals['task_id'])
                 if task.stage_id:
                     vals['stage_id'] = task.stage_id.id
+        product_ids = {vals['service_id'] for vals in vals_list if vals.get('service_id') and 'unit_price' not in vals}
+        if product_ids:
+            prices = {p.id: p.list_price for p in self.env['product.product'].browse(product_ids)}
+            for vals in vals_list:
+                if vals.get('service_id') and 'unit_price' not in vals:
+                    vals['unit_price'] = prices[vals['service_id']]
         return super(StageService, self).create(vals_list)
 
+    @api.onchange('service_id')
+    def _onchange_service_id(self):
+        if self.service_id:
+            self.unit_price = self.service_id.list_price
+
+    @api.model
+    def reprice_open_lines(self, project_ids, product_ids=None):
+        """
+        Sets unit_price of the not yet done service lines of the given projects
+        to the current list price, in one UPDATE. Cost rollups, the daily
+        balance and the project versions get the resulting deltas.
+        Returns the number of repriced lines.
+        """
+        if not project_ids:
+            return 0
+        self.flush_model(['service_id', 'stage_id', 'project_id', 'task_id', 'quantity', 'unit_price', 'total_cost',
+                          'is_done', 'state', 'date'])
+        self.env['product.product'].flush_model(['product_tmpl_id'])
+        self.env['product.template'].flush_model(['list_price'])
+
+        product_clause, params = '', [tuple(project_ids)]
+        if product_ids:
+            product_clause = "AND s.service_id IN %s"
+            params.append(tuple(product_ids))
+        params.append(self.env.uid)
+        self.env.cr.execute(f"""
+            WITH open_lines AS (
+                SELECT s.id, COALESCE(s.total_cost, 0) AS old_total
+                FROM construction_stage_service s
+                WHERE s.project_id IN %s {product_clause}
+                  AND NOT COALESCE(s.is_done, FALSE)
+                  AND COALESCE(s.state, 'planned') != 'completed'
+                FOR UPDATE OF s
+            )
+            UPDATE construction_stage_service s
+            SET unit_price = pt.list_price,
+                total_cost = COALESCE(s.quantity, 0) * pt.list_price,
+                write_uid = %s,
+                write_date = (now() at time zone 'UTC')
+            FROM open_lines o, product_product pp, product_template pt
+            WHERE s.id = o.id
+              AND pp.id = s.service_id
+              AND pt.id = pp.product_tmpl_id
+              AND s.unit_price IS DISTINCT FROM pt.list_price::float8
+            RETURNING s.id, s.task_id, s.stage_id, s.project_id, s.date, o.old_total, s.total_cost,
+                      (SELECT ts.project_id FROM construction_stage_task t
+                       JOIN construction_stage ts ON ts.id = t.stage_id
+                       WHERE t.id = s.task_id)
+        """, params)
+        rows = self.env.cr.fetchall()
+        self.invalidate_model(['unit_price', 'total_cost'])
+        if not rows:
+            return 0
+
+        rollup = defaultdict(lambda: defaultdict(float))
+        daily = defaultdict(float)
+        projects = set()
+        for line_id, task_id, stage_id, project_id, day, old_total, new_total, task_project_id in rows:
+            delta = (new_total or 0.0) - old_total
+            projects.add(project_id)
+            if task_id:
+                rollup['task'][task_id] += delta
+                if task_project_id:
+                    rollup['expense'][task_project_id] += delta
+                    if day:
+                        daily[(task_project_id, day, self._daily_balance_column)] += delta
+            rollup['stage'][stage_id] += delta
+            rollup['cost'][project_id] += delta
+        self._apply_cost_rollup_deltas(rollup)
+        self.env['construction.project.daily.balance']._apply_deltas(daily)
+        self._bump_project_version(list(projects))
+        _logger.info(f"[REPRICE] {len(rows)} service lines repriced in projects {sorted(projects)}")
+        return len(rows)
+
     @api.depends('quantity', 'unit_price')
     def _compute_total_cost(self):
         for record in self:
@@ -112,6 +232,8 @@ class StageService(models.Model):
 
 class StageTask(models.Model):
     _name = 'construction.stage.task'
+    _inherit = ['construction.project.version.mixin']
+    _project_version_path = 'stage_id.project_id'
     _description = 'Stage Task'
     _order = 'sequence, id'
 
@@ -131,7 +253,8 @@ class StageTask(models.Model):
     material_ids = fields.One2many('construction.stage.material', 'task_id', string='Materiallar')
     service_ids = fields.One2many('construction.stage.service', 'task_id', string='Xizmatlar')
     
-    total_cost = fields.Float(string='Jami xarajat', compute='_compute_total_cost', store=True)
+    # Maintained by construction.cost.rollup.source.mixin
+    total_cost = fields.Float(string='Jami xarajat', readonly=True, copy=False)
     limit_content = fields.Html(string='Kontent xulosasi', compute='_compute_content_summary')
     progress = fields.Float(string='Jarayon (%)', compute='_compute_progress', store=True)
 
@@ -149,13 +272,6 @@ class StageTask(models.Model):
             else:
                 record.progress = 0
 
-    @api.depends('material_ids.total_cost', 'service_ids.total_cost')
-    def _compute_total_cost(self):
-        for record in self:
-            materials_cost = sum(record.material_ids.mapped('total_cost'))
-            services_cost = sum(record.service_ids.mapped('total_cost'))
-            record.total_cost = materials_cost + services_cost
-
     @api.depends('material_ids', 'service_ids', 'name')
     def _compute_content_summary(self):
         for record in self:
@@ -174,6 +290,22 @@ class StageTask(models.Model):
 
 
 
+    def write(self, vals):
+        old_projects = set(self.mapped('stage_id.project_id').ids) if 'stage_id' in vals else set()
+        res = super().write(vals)
+        if old_projects:
+            # Project total_expense and the daily balance sum the tasks of its stages
+            project_ids = list(old_projects | set(self.mapped('stage_id.project_id').ids))
+            self.env['construction.project.daily.balance'].rebuild(project_ids)
+            self.env['construction.project'].check_cost_rollups(project_ids, repair=True)
+        return res
+
+    def unlink(self):
+        # The database cascade would skip the lines' unlink (daily balance and cost deltas)
+        self.sudo().mapped('material_ids').unlink()
+        self.sudo().mapped('service_ids').unlink()
+        return super().unlink()
+
     def toggle_completed(self):
         for record in self:
             record.completed = not record.completed
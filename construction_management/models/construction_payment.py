@@ -1,4 +1,10 @@
 from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from collections import defaultdict
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
 
 class ConstructionPayment(models.Model):
     _name = 'construction.payment'
@@ -41,28 +47,57 @@ class ConstructionPayment(models.Model):
     def action_confirm(self):
         self.write({'state': 'confirmed'})
 
-    def action_create_invoice(self):
-        self.ensure_one()
-        AccountMove = self.env['account.move']
-        
-        invoice = AccountMove.create({
+    def _prepare_invoice_vals(self):
+        """One customer invoice for payments of the same project, one line per payment."""
+        project = self[0].project_id
+        return {
             'move_type': 'out_invoice',
-            'partner_id': self.project_id.customer_id.id,
-            'invoice_date': self.payment_date,
+            'partner_id': project.customer_id.id,
+            'invoice_date': max(self.mapped('payment_date')),
+            'invoice_origin': project.name,
+            'ref': ', '.join(self.mapped('name')),
             'invoice_line_ids': [(0, 0, {
-                'name': f'Payment for {self.project_id.name} - {self.payment_type}',
+                'name': f'Payment for {project.name} - {payment.payment_type} ({payment.name})',
                 'quantity': 1,
-                'price_unit': self.amount,
-            })],
-        })
-        
-        self.invoice_id = invoice.id
-        self.state = 'reconciled'
-        
+                'price_unit': payment.amount,
+            }) for payment in self],
+        }
+
+    def action_create_invoice(self):
+        """
+        Invoices every selected confirmed payment that has none yet: payments
+        are grouped by customer and project, all invoices are created in one call.
+        """
+        started = time.perf_counter()
+        payments = self.filtered(lambda p: p.state == 'confirmed' and not p.invoice_id)
+        if not payments:
+            raise UserError(_('No confirmed payments without an invoice were selected.'))
+
+        groups = defaultdict(lambda: self.browse())
+        for payment in payments.sorted(lambda p: (p.payment_date, p.id)):
+            groups[(payment.project_id.customer_id.id, payment.project_id.id)] |= payment
+        groups = list(groups.values())
+
+        invoices = self.env['account.move'].create([group._prepare_invoice_vals() for group in groups])
+        for group, invoice in zip(groups, invoices):
+            group.write({'invoice_id': invoice.id, 'state': 'reconciled'})
+
+        _logger.info(f"[INVOICE] {len(invoices)} invoices for {len(payments)} payments "
+                     f"in {time.perf_counter() - started:.2f}s")
+
+        if len(invoices) == 1:
+            return {
+                'type': 'ir.actions.act_window',
+                'res_model': 'account.move',
+                'res_id': invoices.id,
+                'view_mode': 'form',
+                'target': 'current',
+            }
         return {
+            'name': _('Invoices'),
             'type': 'ir.actions.act_window',
             'res_model': 'account.move',
-            'res_id': invoice.id,
-            'view_mode': 'form',
+            'view_mode': 'tree,form',
+            'domain': [('id', 'in', invoices.ids)],
             'target': 'current',
         }
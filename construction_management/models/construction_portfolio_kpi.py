@@ -0,0 +1,180 @@
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Sort keys accepted by get_portfolio (API / bot) -> ORDER BY clause
+PORTFOLIO_ORDERS = {
+    'balance': 'balance ASC, id',
+    'expense': 'total_expense DESC, id',
+    'income': 'total_income DESC, id',
+    'progress': 'progress ASC, id',
+    'overdue': 'overdue_task_count DESC, id',
+    'name': 'name, id',
+}
+
+
+class ConstructionPortfolioKpi(models.Model):
+    """
+    One row per project, aggregated straight from the line tables into a
+    Postgres materialized view. Refreshed by a cron, so reading hundreds of
+    projects never walks the ORM.
+    """
+    _name = 'construction.portfolio.kpi'
+    _description = 'Loyihalar portfeli'
+    _auto = False
+    _order = 'balance asc, id'
+    _rec_name = 'name'
+
+    project_id = fields.Many2one('construction.project', string='Loyiha', readonly=True)
+    name = fields.Char(string='Loyiha nomi', readonly=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('in_progress', 'In Progress'),
+        ('on_hold', 'On Hold'),
+        ('completed', 'Completed'),
+        ('cancelled', 'Cancelled')
+    ], string='Holat', readonly=True)
+    company_id = fields.Many2one('res.company', string='Kompaniya', readonly=True)
+    customer_id = fields.Many2one('res.partner', string='Mijoz', readonly=True)
+    user_id = fields.Many2one('res.users', string='Loyiha menejeri', readonly=True)
+
+    total_income = fields.Float(string='Jami kirim', readonly=True)
+    total_expense = fields.Float(string='Jami chiqim', readonly=True)
+    balance = fields.Float(string='Balans', readonly=True)
+
+    stage_count = fields.Integer(string='Bosqichlar', readonly=True)
+    stage_completed_count = fields.Integer(string='Yakunlangan bosqichlar', readonly=True)
+    service_count = fields.Integer(string='Xizmatlar', readonly=True)
+    service_done_count = fields.Integer(string='Bajarilgan xizmatlar', readonly=True)
+    progress = fields.Float(string='Jarayon (%)', readonly=True, group_operator='avg')
+
+    open_batch_count = fields.Integer(string='Ochiq so\'rovlar', readonly=True)
+    open_issue_count = fields.Integer(string='Ochiq muammolar', readonly=True)
+    overdue_task_count = fields.Integer(string='Muddati o\'tgan vazifalar', readonly=True)
+
+    refreshed_at = fields.Datetime(string='Yangilangan vaqt', readonly=True)
+
+    def init(self):
+        self.env.cr.execute("DROP MATERIALIZED VIEW IF EXISTS construction_portfolio_kpi CASCADE")
+        self.env.cr.execute("""
+            CREATE MATERIALIZED VIEW construction_portfolio_kpi AS
+            SELECT
+                p.id AS id,
+                p.id AS project_id,
+                p.name AS name,
+                p.state AS state,
+                p.company_id AS company_id,
+                p.customer_id AS customer_id,
+                p.user_id AS user_id,
+                COALESCE(inc.total, 0) AS total_income,
+                COALESCE(cost.total, 0) AS total_expense,
+                COALESCE(inc.total, 0) - COALESCE(cost.total, 0) AS balance,
+                COALESCE(stg.cnt, 0) AS stage_count,
+                COALESCE(stg.completed, 0) AS stage_completed_count,
+                COALESCE(svc.cnt, 0) AS service_count,
+                COALESCE(svc.done, 0) AS service_done_count,
+                CASE WHEN COALESCE(svc.cnt, 0) > 0
+                     THEN ROUND(svc.done * 100.0 / svc.cnt, 1) ELSE 0 END AS progress,
+                COALESCE(bat.cnt, 0) AS open_batch_count,
+                COALESCE(iss.cnt, 0) AS open_issue_count,
+                COALESCE(wt.cnt, 0) AS overdue_task_count,
+                (now() AT TIME ZONE 'UTC') AS refreshed_at
+            FROM construction_project p
+            LEFT JOIN (
+                SELECT project_id, SUM(amount) AS total
+                FROM construction_project_income GROUP BY project_id
+            ) inc ON inc.project_id = p.id
+            -- Same line set as project.total_expense / balance: task lines on the task's project
+            LEFT JOIN (
+                SELECT ts.project_id, SUM(COALESCE(l.total_cost, 0)) AS total
+                FROM (
+                    SELECT task_id, total_cost FROM construction_stage_material WHERE task_id IS NOT NULL
+                    UNION ALL
+                    SELECT task_id, total_cost FROM construction_stage_service WHERE task_id IS NOT NULL
+                ) l
+                JOIN construction_stage_task t ON t.id = l.task_id
+                JOIN construction_stage ts ON ts.id = t.stage_id
+                GROUP BY ts.project_id
+            ) cost ON cost.project_id = p.id
+            LEFT JOIN (
+                SELECT s.project_id, COUNT(*) AS cnt, COUNT(*) FILTER (WHERE s.is_done) AS done
+                FROM construction_stage_service s
+                GROUP BY s.project_id
+            ) svc ON svc.project_id = p.id
+            LEFT JOIN (
+                SELECT project_id, COUNT(*) AS cnt,
+                       COUNT(*) FILTER (WHERE state = 'completed') AS completed
+                FROM construction_stage GROUP BY project_id
+            ) stg ON stg.project_id = p.id
+            LEFT JOIN (
+                SELECT project_id, COUNT(*) AS cnt
+                FROM construction_material_request_batch
+                WHERE state IN ('draft', 'priced')
+                GROUP BY project_id
+            ) bat ON bat.project_id = p.id
+            LEFT JOIN (
+                SELECT project_id, COUNT(*) AS cnt
+                FROM construction_issue
+                WHERE state IN ('new', 'in_progress')
+                GROUP BY project_id
+            ) iss ON iss.project_id = p.id
+            LEFT JOIN (
+                SELECT project_id, COUNT(*) AS cnt
+                FROM construction_work_task
+                WHERE state != 'done' AND deadline_date < CURRENT_DATE
+                GROUP BY project_id
+            ) wt ON wt.project_id = p.id
+        """)
+        # Required by REFRESH ... CONCURRENTLY
+        self.env.cr.execute("CREATE UNIQUE INDEX construction_portfolio_kpi_id_uniq ON construction_portfolio_kpi (id)")
+        self.env.cr.execute("CREATE INDEX construction_portfolio_kpi_balance_idx ON construction_portfolio_kpi (balance)")
+
+    @api.model
+    def refresh_view(self):
+        """Cron: readers keep seeing the previous snapshot while it is rebuilt."""
+        self.env.cr.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY construction_portfolio_kpi")
+        self.invalidate_model()
+        _logger.info("[PORTFOLIO] KPI view refreshed")
+
+    @api.model
+    def get_portfolio(self, order='balance', limit=50, offset=0, company_ids=None):
+        """Totals over all projects plus one page of rows, for the WebApp and the bot."""
+        where, params = '', []
+        if company_ids:
+            where, params = "WHERE company_id IN %s", [tuple(company_ids)]
+        self.env.cr.execute(f"""
+            SELECT COUNT(*), COALESCE(SUM(total_income), 0), COALESCE(SUM(total_expense), 0),
+                   COALESCE(SUM(balance), 0), COUNT(*) FILTER (WHERE balance < 0),
+                   COALESCE(SUM(open_batch_count), 0), COALESCE(SUM(open_issue_count), 0),
+                   COALESCE(SUM(overdue_task_count), 0), MAX(refreshed_at)
+            FROM construction_portfolio_kpi {where}
+        """, params)
+        (count, income, expense, balance, negative, batches, issues, overdue, refreshed_at) = self.env.cr.fetchone()
+
+        self.env.cr.execute(f"""
+            SELECT id, name, state, total_income, total_expense, balance, progress,
+                   stage_count, stage_completed_count, open_batch_count, open_issue_count, overdue_task_count
+            FROM construction_portfolio_kpi {where}
+            ORDER BY {PORTFOLIO_ORDERS.get(order, PORTFOLIO_ORDERS['balance'])}
+            LIMIT %s OFFSET %s
+        """, params + [limit, offset])
+        columns = [desc[0] for desc in self.env.cr.description]
+        rows = [dict(zip(columns, row)) for row in self.env.cr.fetchall()]
+        for row in rows:
+            row['project_id'] = row['id']
+
+        return {
+            'totals': {
+                'project_count': count,
+                'total_income': income,
+                'total_expense': expense,
+                'balance': balance,
+                'negative_count': negative,
+                'open_batch_count': batches,
+                'open_issue_count': issues,
+                'overdue_task_count': overdue,
+            },
+            'refreshed_at': fields.Datetime.to_string(refreshed_at) if refreshed_at else None,
+            'projects': rows,
+        }
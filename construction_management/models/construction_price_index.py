@@ -0,0 +1,198 @@
+from odoo import models, fields, api
+from odoo.addons.construction_management.services.line_matcher import normalize_name, normalize_uom, split_uom
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Priced rows from both sources, reduced to (key, uom_key, price, ts)
+_SAMPLES_SQL = """
+    SELECT l.price_key AS key, COALESCE(l.uom_key, '') AS uom_key,
+           l.unit_price AS price, COALESCE(l.write_date, l.create_date) AS ts,
+           l.product_name AS label
+    FROM construction_material_request_line l
+    WHERE l.unit_price > 0 AND COALESCE(l.price_key, '') != ''
+    UNION ALL
+    SELECT m.price_key, COALESCE(m.uom_key, ''), m.unit_price, m.date::timestamp, NULL
+    FROM construction_stage_material m
+    WHERE m.unit_price > 0 AND COALESCE(m.price_key, '') != ''
+"""
+
+
+class ConstructionPriceIndex(models.Model):
+    _name = 'construction.price.index'
+    _description = 'Narxlar tarixi indeksi'
+    _order = 'key, uom_key'
+    _rec_name = 'key'
+
+    key = fields.Char(string='Kalit', required=True, readonly=True)
+    uom_key = fields.Char(string="O'lchov birligi", readonly=True)
+    label = fields.Char(string='Mahsulot', readonly=True)
+    last_price = fields.Float(string='Oxirgi narx', readonly=True)
+    median_price = fields.Float(string='Median narx', readonly=True)
+    min_price = fields.Float(string='Eng past narx', readonly=True)
+    sample_count = fields.Integer(string='Namunalar soni', readonly=True)
+    last_date = fields.Date(string='Oxirgi sana', readonly=True)
+
+    _sql_constraints = [
+        ('key_uom_uniq', 'unique(key, uom_key)', 'Narx indeksi kaliti takrorlanmasligi kerak!'),
+    ]
+
+    @api.model
+    def make_key(self, product_name, uom=None):
+        """(price_key, uom_key) used by request lines and stage materials."""
+        uom_key = normalize_uom(uom) if uom else split_uom(product_name)
+        return normalize_name(product_name), uom_key or ''
+
+    def _upsert(self, where_sql='', params=()):
+        for source in ('construction.material.request.line', 'construction.stage.material'):
+            self.env[source].flush_model(['price_key', 'uom_key', 'unit_price'])
+        self.env.cr.execute(f"""
+            INSERT INTO construction_price_index
+                (key, uom_key, label, last_price, median_price, min_price, sample_count, last_date,
+                 create_uid, create_date, write_uid, write_date)
+            SELECT s.key, s.uom_key,
+                   (array_agg(s.label ORDER BY s.ts DESC) FILTER (WHERE s.label IS NOT NULL))[1],
+                   (array_agg(s.price ORDER BY s.ts DESC))[1],
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY s.price),
+                   MIN(s.price), COUNT(*), MAX(s.ts)::date,
+                   %s, (now() at time zone 'UTC'), %s, (now() at time zone 'UTC')
+            FROM ({_SAMPLES_SQL}) s
+            {where_sql}
+            GROUP BY s.key, s.uom_key
+            ON CONFLICT (key, uom_key) DO UPDATE SET
+                label = COALESCE(EXCLUDED.label, construction_price_index.label),
+                last_price = EXCLUDED.last_price,
+                median_price = EXCLUDED.median_price,
+                min_price = EXCLUDED.min_price,
+                sample_count = EXCLUDED.sample_count,
+                last_date = EXCLUDED.last_date,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+        """, (self.env.uid, self.env.uid) + tuple(params))
+
+    @api.model
+    def refresh_keys(self, keys):
+        """Recomputes the index rows for the given {(key, uom_key)} pairs."""
+        keys = {(k, u or '') for k, u in keys if k}
+        if not keys:
+            return
+        key_tuple = tuple(keys)
+        self.env.cr.execute("""
+            DELETE FROM construction_price_index
+            WHERE (key, COALESCE(uom_key, '')) IN %s
+        """, (key_tuple,))
+        self._upsert("WHERE (s.key, s.uom_key) IN %s", (key_tuple,))
+        self.invalidate_model()
+
+    @api.model
+    def rebuild(self):
+        """Full rebuild (cron / after imports)."""
+        self.env.cr.execute("DELETE FROM construction_price_index")
+        self._upsert()
+        self.invalidate_model()
+        _logger.info("[PRICE_INDEX] Rebuilt price history index")
+
+    @api.model
+    def suggest(self, items):
+        """
+        items: iterable of (product_name, uom or None)
+        Returns {product_name: index row dict} in a single indexed lookup.
+        An exact (key, uom) row wins. Unknown units take the key's most sampled row,
+        a known unit only falls back to rows without a unit.
+        """
+        wanted = {}
+        for product_name, uom in items:
+            key, uom_key = self.make_key(product_name, uom)
+            if key:
+                wanted[product_name] = (key, uom_key)
+        if not wanted:
+            return {}
+
+        self.env.cr.execute("""
+            SELECT key, COALESCE(uom_key, ''), last_price, median_price, min_price, sample_count, last_date
+            FROM construction_price_index
+            WHERE key IN %s
+        """, (tuple({k for k, u in wanted.values()}),))
+        rows = {}
+        for key, uom_key, last, median, low, count, last_date in self.env.cr.fetchall():
+            rows.setdefault(key, {})[uom_key] = {
+                'last_price': last,
+                'median_price': median,
+                'min_price': low,
+                'sample_count': count,
+                'last_date': last_date,
+            }
+
+        result = {}
+        for product_name, (key, uom_key) in wanted.items():
+            by_uom = rows.get(key)
+            if not by_uom:
+                continue
+            if uom_key in by_uom:
+                result[product_name] = by_uom[uom_key]
+            elif not uom_key:
+                result[product_name] = max(by_uom.values(), key=lambda r: r['sample_count'])
+            elif '' in by_uom:
+                result[product_name] = by_uom['']
+        return result
+
+
+class ConstructionPriceSourceMixin(models.AbstractModel):
+    """Keeps construction.price.index in sync with models carrying a unit_price."""
+    _name = 'construction.price.source.mixin'
+    _description = 'Narx indeksi manbasi'
+
+    # Fields whose change affects the (key, uom_key) of a row or its price
+    _price_index_trigger_fields = ('unit_price',)
+
+    price_key = fields.Char(string='Narx kaliti', compute='_compute_price_key', store=True, index=True)
+    uom_key = fields.Char(string="Narx o'lchov kaliti", compute='_compute_price_key', store=True)
+
+    @api.depends(lambda self: [name for name in ('name', 'uom_id') if name in self._fields])
+    def _compute_price_key(self):
+        """Default key from name / uom_id; sources with other field names override this."""
+        PriceIndex = self.env['construction.price.index']
+        for rec in self:
+            name = rec['name'] if 'name' in rec._fields else ''
+            uom = rec['uom_id'].name if 'uom_id' in rec._fields else None
+            rec.price_key, rec.uom_key = PriceIndex.make_key(name or '', uom)
+
+    def _get_price_index_keys(self):
+        return {(rec.price_key, rec.uom_key or '') for rec in self if rec.price_key}
+
+    def _write_unit_prices(self, prices):
+        """
+        prices: {record id: unit_price}. One write per distinct price and a
+        single index refresh for all of them.
+        """
+        records = self.filtered(lambda rec: rec.id in prices)
+        by_price = {}
+        for rec in records:
+            by_price.setdefault(prices[rec.id], []).append(rec.id)
+        old_keys = records._get_price_index_keys()
+        deferred = self.with_context(price_index_defer_refresh=True)
+        for price, ids in by_price.items():
+            deferred.browse(ids).write({'unit_price': price})
+        self.env['construction.price.index'].refresh_keys(old_keys | records._get_price_index_keys())
+        return records
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env['construction.price.index'].refresh_keys(records._get_price_index_keys())
+        return records
+
+    def write(self, vals):
+        if self.env.context.get('price_index_defer_refresh') \
+                or not any(f in vals for f in self._price_index_trigger_fields):
+            return super().write(vals)
+        old_keys = self._get_price_index_keys()
+        res = super().write(vals)
+        self.env['construction.price.index'].refresh_keys(old_keys | self._get_price_index_keys())
+        return res
+
+    def unlink(self):
+        old_keys = self._get_price_index_keys()
+        res = super().unlink()
+        self.env['construction.price.index'].refresh_keys(old_keys)
+        return res
@@ -1,11 +1,15 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.tools.sql import create_index
 import requests
 import logging
 
 _logger = logging.getLogger(__name__)
 from datetime import date, timedelta
 
+# check_cost_rollups: allowed difference between stored and recomputed costs
+COST_ROLLUP_TOLERANCE = 0.01
+
 DEFAULT_TASKS = {
     'demontaj': ['Оплата мастерам за работы', 'Материалы для работы', 'Rasmlar'],
     'montaj': ['Оплата мастерам за работы', 'Материалы для работы', 'Rasmlar'],
@@ -75,19 +79,21 @@ class ConstructionProject(models.Model):
 
     
     total_income = fields.Float(string='Jami kirim', compute='_compute_financials', store=True)
-    total_expense = fields.Float(string='Jami chiqim', compute='_compute_financials', store=True)
+    # Maintained by construction.cost.rollup.source.mixin
+    total_expense = fields.Float(string='Jami chiqim', readonly=True, copy=False)
     balance = fields.Float(string='Balans', compute='_compute_financials', store=True)
     
-    total_cost = fields.Float(string='Jami xarajat', compute='_compute_total_cost', store=True)
+    # Maintained by construction.cost.rollup.source.mixin
+    total_cost = fields.Float(string='Jami xarajat', readonly=True, copy=False)
+
+    # Bumped by construction.project.version.mixin; keys the WebApp cache
+    data_version = fields.Integer(string="Ma'lumotlar versiyasi", default=0, readonly=True, copy=False)
     
-    @api.depends('income_ids.amount', 'stage_ids.task_ids.total_cost')
+    @api.depends('income_ids.amount', 'total_expense')
     def _compute_financials(self):
         for record in self:
             record.total_income = sum(record.income_ids.mapped('amount'))
-            # Expense is sum of all task costs (materials + services)
-            # Efficient way: traverse stages -> tasks
-            tasks = record.stage_ids.mapped('task_ids')
-            record.total_expense = sum(tasks.mapped('total_cost'))
+            # Expense (sum of all task costs) is pushed as deltas by the lines
             record.balance = record.total_income - record.total_expense
 
 
@@ -175,6 +181,9 @@ class ConstructionProject(models.Model):
 
         res = super(ConstructionProject, self).write(vals)
 
+        if 'name' in vals:
+            self.env['construction.project.version.mixin']._bump_project_version(self.ids)
+
         if 'customer_id' in vals:
             for record in self:
                 if record.id in old_customers and record.customer_id != old_customers[record.id]:
@@ -307,10 +316,109 @@ class ConstructionProject(models.Model):
 
 
 
-    @api.depends('stage_ids.actual_cost')
-    def _compute_total_cost(self):
-        for record in self:
-            record.total_cost = sum(record.stage_ids.mapped('actual_cost'))
+    @api.model
+    def check_cost_rollups(self, project_ids=None, repair=False):
+        """
+        Compares task / stage / project cost rollups with a recomputation from
+        the lines. Returns the ids of projects that differ; with repair=True
+        their rollups are rewritten from the lines.
+        """
+        for model_name in ('construction.stage.material', 'construction.stage.service'):
+            self.env[model_name].flush_model(['task_id', 'stage_id', 'total_cost'])
+        self.env['construction.stage.task'].flush_model(['stage_id', 'total_cost'])
+        self.env['construction.stage'].flush_model(['project_id', 'actual_cost'])
+        self.flush_model(['total_income', 'total_expense', 'total_cost', 'balance'])
+
+        scope, params = '', []
+        if project_ids:
+            scope, params = "WHERE p.id IN %s", [tuple(project_ids)]
+        cr = self.env.cr
+        cr.execute(f"""
+            WITH lines AS (
+                SELECT task_id, stage_id, COALESCE(total_cost, 0) AS cost FROM construction_stage_material
+                UNION ALL
+                SELECT task_id, stage_id, COALESCE(total_cost, 0) FROM construction_stage_service
+            ),
+            task_expected AS (
+                SELECT t.id, st.project_id, COALESCE(SUM(l.cost), 0) AS cost, COALESCE(t.total_cost, 0) AS stored
+                FROM construction_stage_task t
+                JOIN construction_stage st ON st.id = t.stage_id
+                LEFT JOIN lines l ON l.task_id = t.id
+                GROUP BY t.id, st.project_id
+            ),
+            stage_expected AS (
+                SELECT st.id, st.project_id, COALESCE(SUM(l.cost), 0) AS cost, COALESCE(st.actual_cost, 0) AS stored
+                FROM construction_stage st
+                LEFT JOIN lines l ON l.stage_id = st.id
+                GROUP BY st.id, st.project_id
+            )
+            SELECT p.id
+            FROM construction_project p
+            LEFT JOIN (SELECT project_id, SUM(cost) AS cost, BOOL_OR(ABS(cost - stored) > %s) AS drift
+                       FROM task_expected GROUP BY project_id) te ON te.project_id = p.id
+            LEFT JOIN (SELECT project_id, SUM(cost) AS cost, BOOL_OR(ABS(cost - stored) > %s) AS drift
+                       FROM stage_expected GROUP BY project_id) se ON se.project_id = p.id
+            {scope}
+            {'AND' if scope else 'WHERE'} (
+                COALESCE(te.drift, FALSE) OR COALESCE(se.drift, FALSE)
+                OR ABS(COALESCE(te.cost, 0) - COALESCE(p.total_expense, 0)) > %s
+                OR ABS(COALESCE(se.cost, 0) - COALESCE(p.total_cost, 0)) > %s
+                OR ABS(COALESCE(p.total_income, 0) - COALESCE(te.cost, 0) - COALESCE(p.balance, 0)) > %s
+            )
+        """, [COST_ROLLUP_TOLERANCE] * 2 + params + [COST_ROLLUP_TOLERANCE] * 3)
+        mismatched = [row[0] for row in cr.fetchall()]
+        if mismatched:
+            _logger.warning(f"[COST ROLLUP] Rollups differ from the lines for projects {mismatched}")
+            if repair:
+                self._rebuild_cost_rollups(mismatched)
+        return mismatched
+
+    @api.model
+    def _rebuild_cost_rollups(self, project_ids):
+        cr = self.env.cr
+        ids = tuple(project_ids)
+        cr.execute("""
+            WITH lines AS (
+                SELECT task_id, COALESCE(total_cost, 0) AS cost FROM construction_stage_material
+                UNION ALL
+                SELECT task_id, COALESCE(total_cost, 0) FROM construction_stage_service
+            )
+            UPDATE construction_stage_task t
+            SET total_cost = COALESCE((SELECT SUM(l.cost) FROM lines l WHERE l.task_id = t.id), 0)
+            FROM construction_stage st
+            WHERE st.id = t.stage_id AND st.project_id IN %s
+        """, (ids,))
+        cr.execute("""
+            WITH lines AS (
+                SELECT stage_id, COALESCE(total_cost, 0) AS cost FROM construction_stage_material
+                UNION ALL
+                SELECT stage_id, COALESCE(total_cost, 0) FROM construction_stage_service
+            )
+            UPDATE construction_stage st
+            SET actual_cost = COALESCE((SELECT SUM(l.cost) FROM lines l WHERE l.stage_id = st.id), 0)
+            WHERE st.project_id IN %s
+        """, (ids,))
+        cr.execute("""
+            UPDATE construction_project p
+            SET total_expense = agg.expense,
+                total_cost = agg.cost,
+                balance = COALESCE(p.total_income, 0) - agg.expense
+            FROM (
+                SELECT p2.id,
+                       COALESCE((SELECT SUM(t.total_cost) FROM construction_stage_task t
+                                 JOIN construction_stage st ON st.id = t.stage_id
+                                 WHERE st.project_id = p2.id), 0) AS expense,
+                       COALESCE((SELECT SUM(st.actual_cost) FROM construction_stage st
+                                 WHERE st.project_id = p2.id), 0) AS cost
+                FROM construction_project p2
+                WHERE p2.id IN %s
+            ) agg
+            WHERE p.id = agg.id
+        """, (ids,))
+        self.env['construction.stage.task'].invalidate_model(['total_cost'])
+        self.env['construction.stage'].invalidate_model(['actual_cost'])
+        self.invalidate_model(['total_expense', 'total_cost', 'balance'])
+        _logger.info(f"[COST ROLLUP] Rebuilt projects {list(project_ids)}")
 
 
 
@@ -356,6 +464,20 @@ class ConstructionProject(models.Model):
     def action_cancel(self):
         self.write({'state': 'cancelled'})
 
+    def action_reprice_open_services(self):
+        """Applies current service list prices to the open service lines of the selected projects."""
+        count = self.env['construction.stage.service'].reprice_open_lines(self.ids)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Narxlar yangilandi'),
+                'message': _('%s ta xizmat qatori yangilandi', count),
+                'type': 'success',
+                'sticky': False,
+            },
+        }
+
     def action_view_analytic_lines(self):
         self.ensure_one()
         return {
@@ -407,57 +529,12 @@ class ConstructionProject(models.Model):
 
     def action_open_financial_report(self):
         self.ensure_one()
-        ledger_data = self.get_project_ledger()
-        
-        # Create Wizard
-        wizard = self.env['construction.financial.report.wizard'].create({
-            'project_id': self.id,
-        })
-        
-        # Process items and Create Lines
-        current_group_name = _('Initial Balance / Uncategorized')
-        previous_balance = 0.0
-        
-        for item in ledger_data:
-            # Filter out days with no activity
-            if item.get('income', 0) == 0 and item.get('expense', 0) == 0:
-                continue
-
-            # If item is income, update the group name and add Previous Balance line
-            if item.get('income', 0) > 0:
-                amount_str = "{:,.2f}".format(item['income'])
-                # Format: "YYYY-MM-DD | Income: Description (Amount)"
-                current_group_name = f"{item['date']} | Income: {item['description']} ({amount_str})"
-                
-                # Add Previous Balance line for this new group
-                self.env['construction.financial.report.line'].create({
-                    'wizard_id': wizard.id,
-                    'date': item['date'],
-                    'description': _('Ostatka'),
-                    'income': 0,
-                    'expense': 0,
-                    'balance': previous_balance,
-                    'group_name': current_group_name,
-                })
-            
-            self.env['construction.financial.report.line'].create({
-                'wizard_id': wizard.id,
-                'date': item['date'],
-                'description': item['description'],
-                'income': item['income'],
-                'expense': item['expense'],
-                'balance': item['balance'],
-                'group_name': current_group_name,
-            })
-            
-            previous_balance = item['balance']
-            
         return {
             'name': _('Financial Report Preview'),
             'type': 'ir.actions.act_window',
-            'res_model': 'construction.financial.report.line',
+            'res_model': 'construction.financial.ledger.line',
             'view_mode': 'tree',
-            'domain': [('wizard_id', '=', wizard.id)],
+            'domain': [('project_id', '=', self.id)],
             'context': {
                 'search_default_group_by_source': 1,
                 'create': False,
@@ -466,94 +543,102 @@ class ConstructionProject(models.Model):
             'target': 'new',
         }
 
-    def get_project_ledger(self):
+    def _fetch_ledger_rows(self, end_date):
+        """
+        Incomes and task materials/services up to end_date as one stream sorted by
+        date (incomes first within a day): (date, kind, stage_name, product_id, description, amount).
+        Costs follow the form order: stage (_order id), then task sequence, then task id.
+        """
+        self.env.cr.execute("""
+            SELECT x.date, x.kind, x.stage_name, x.product_id, x.description, x.amount
+            FROM (
+                SELECT i.date, 'income' AS kind, NULL::varchar AS stage_name, NULL::integer AS product_id,
+                       i.description, COALESCE(i.amount, 0) AS amount,
+                       0 AS rank, 0 AS stage_id, 0 AS task_sequence, 0 AS task_id, i.id
+                FROM construction_project_income i
+                WHERE i.project_id = %s AND i.date <= %s
+                UNION ALL
+                SELECT m.date, 'material', st.name, m.product_id,
+                       NULL, COALESCE(m.total_cost, 0),
+                       1, st.id, t.sequence, t.id, m.id
+                FROM construction_stage_material m
+                JOIN construction_stage_task t ON t.id = m.task_id
+                JOIN construction_stage st ON st.id = t.stage_id
+                WHERE m.project_id = %s AND m.date <= %s
+                UNION ALL
+                SELECT s.date, 'service', st.name, s.service_id,
+                       s.description, COALESCE(s.total_cost, 0),
+                       2, st.id, t.sequence, t.id, s.id
+                FROM construction_stage_service s
+                JOIN construction_stage_task t ON t.id = s.task_id
+                JOIN construction_stage st ON st.id = t.stage_id
+                WHERE s.project_id = %s AND s.date <= %s
+            ) x
+            ORDER BY x.date, (x.rank > 0), x.stage_id, x.task_sequence, x.task_id, x.rank, x.id
+        """, (self.id, end_date) * 3)
+        return self.env.cr.fetchall()
+
+    def get_project_ledger(self, include_empty_days=False):
+        """
+        Running balance ledger, one pass over the date-sorted transaction stream.
+        Days without transactions are only added (as empty rows) when
+        include_empty_days is set, from the project start to today.
+        """
         self.ensure_one()
-        ledger = []
-        
-        # 1. Determine Date Range
-        start = self.start_date or fields.Date.today()
-        # Find first transaction date if earlier than start_date
-        dates = [start]
-        if self.income_ids:
-            dates.append(min(self.income_ids.mapped('date')))
-        
-        # Collect expenses to find min date
-        all_expenses = []
-        for stage in self.stage_ids:
-            for task in stage.task_ids:
-                for mat in task.material_ids:
-                    all_expenses.append({
-                        'date': mat.date,
-                        'description': f"[{stage.name}] {mat.product_id.display_name}",
-                        'amount': mat.total_cost,
-                        'type': 'expense'
-                    })
-                    dates.append(mat.date)
-                for svc in task.service_ids:
-                    all_expenses.append({
-                        'date': svc.date,
-                        'description': f"[{stage.name}] {svc.service_id.display_name} ({svc.description or ''})",
-                        'amount': svc.total_cost,
-                        'type': 'expense'
-                    })
-                    dates.append(svc.date)
-        
-        start_date = min(dates)
         end_date = fields.Date.today()
-        
-        # 2. Collect Incomes
-        all_incomes = []
-        for income in self.income_ids:
-            all_incomes.append({
-                'date': income.date,
-                'description': income.description or "Income",
-                'amount': income.amount,
-                'type': 'income'
-            })
+        rows = self._fetch_ledger_rows(end_date)
 
-        # 3. Build Daily Ledger
-        current_date = start_date
+        # Product names in one batch (display_name includes code / variant)
+        product_ids = {row[3] for row in rows if row[3]}
+        product_names = {p.id: p.display_name for p in self.env['product.product'].browse(product_ids)}
+
+        ledger = []
         running_balance = 0.0
-        
-        while current_date <= end_date:
-            day_incomes = [i for i in all_incomes if i['date'] == current_date]
-            day_expenses = [e for e in all_expenses if e['date'] == current_date]
-            
-            # If transactions exist for this day
-            if day_incomes or day_expenses:
-                # Add incomes first
-                for inc in day_incomes:
-                    running_balance += inc['amount']
-                    ledger.append({
-                        'date': current_date,
-                        'description': inc['description'],
-                        'income': inc['amount'],
-                        'expense': 0,
-                        'balance': running_balance
-                    })
-                
-                # Add expenses
-                for exp in day_expenses:
-                    running_balance -= exp['amount']
-                    ledger.append({
-                        'date': current_date,
-                        'description': exp['description'],
-                        'income': 0,
-                        'expense': exp['amount'],
-                        'balance': running_balance
-                    })
-            else:
-                # Nothing happened
+
+        def empty_day(day):
+            return {'date': day, 'description': "", 'income': 0, 'expense': 0, 'balance': running_balance}
+
+        next_day = None
+        if include_empty_days:
+            start = self.start_date or end_date
+            next_day = min(start, rows[0][0]) if rows else start
+
+        for day, kind, stage_name, product_id, description, amount in rows:
+            if next_day is not None:
+                while next_day < day:
+                    ledger.append(empty_day(next_day))
+                    next_day += timedelta(days=1)
+                next_day = day + timedelta(days=1)
+
+            if kind == 'income':
+                running_balance += amount
                 ledger.append({
-                    'date': current_date,
-                    'description': "",
-                    'income': 0,
+                    'date': day,
+                    'description': description or "Income",
+                    'income': amount,
                     'expense': 0,
                     'balance': running_balance
                 })
-            
-            current_date += timedelta(days=1)
-            
+                continue
+
+            if kind == 'material':
+                label = f"[{stage_name}] {product_names.get(product_id, '')}"
+            else:
+                label = f"[{stage_name}] {product_names.get(product_id, '')} ({description or ''})"
+            running_balance -= amount
+            ledger.append({
+                'date': day,
+                'description': label,
+                'income': 0,
+                'expense': amount,
+                'balance': running_balance
+            })
+
+        if next_day is not None:
+            while next_day <= end_date:
+                ledger.append(empty_day(next_day))
+                next_day += timedelta(days=1)
+
         return ledger
 
 
@@ -561,7 +646,12 @@ class ConstructionProject(models.Model):
 
 class ConstructionProjectIncome(models.Model):
     _name = 'construction.project.income'
+    _inherit = ['construction.project.version.mixin', 'construction.daily.balance.source.mixin']
     _description = 'Project Income'
+    _daily_balance_column = 'income'
+    _daily_balance_amount_field = 'amount'
+    _daily_balance_project_path = 'project_id'
+    _daily_balance_trigger_fields = ('amount', 'date', 'project_id')
     _order = 'date desc'
 
     project_id = fields.Many2one('construction.project', string='Project', required=True, ondelete='cascade')
@@ -569,3 +659,35 @@ class ConstructionProjectIncome(models.Model):
     amount = fields.Float(string='Miqdor', required=True)
     description = fields.Char(string='Izoh')
 
+    def init(self):
+        create_index(self.env.cr, 'construction_project_income_project_date_idx',
+                     self._table, ['project_id', 'date'])
+
+    def _balance_deltas(self, sign=1):
+        deltas = {}
+        for rec in self.sudo():
+            deltas[rec.project_id.id] = deltas.get(rec.project_id.id, 0.0) + sign * (rec.amount or 0.0)
+        return deltas
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env['construction.alert.rule']._evaluate_deltas(balance_deltas=records._balance_deltas())
+        return records
+
+    def write(self, vals):
+        if 'amount' not in vals and 'project_id' not in vals:
+            return super().write(vals)
+        deltas = self._balance_deltas(-1)
+        res = super().write(vals)
+        for project_id, amount in self._balance_deltas().items():
+            deltas[project_id] = deltas.get(project_id, 0.0) + amount
+        self.env['construction.alert.rule']._evaluate_deltas(balance_deltas=deltas)
+        return res
+
+    def unlink(self):
+        deltas = self._balance_deltas(-1)
+        res = super().unlink()
+        self.env['construction.alert.rule']._evaluate_deltas(balance_deltas=deltas)
+        return res
+
@@ -4,7 +4,7 @@ from odoo.exceptions import ValidationError
 class ConstructionStage(models.Model):
     _name = 'construction.stage'
     _description = 'Construction Stage'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'construction.project.version.mixin']
     _order = 'id'
 
 
@@ -48,7 +48,8 @@ class ConstructionStage(models.Model):
     actual_end_date = fields.Date(string='Haqiqiy tugash sanasi')
     
     estimated_budget = fields.Float(string='Taxminiy byudjet')
-    actual_cost = fields.Float(string='Haqiqiy xarajat', compute='_compute_actual_cost', store=True)
+    # Maintained by construction.cost.rollup.source.mixin
+    actual_cost = fields.Float(string='Haqiqiy xarajat', readonly=True, copy=False)
     progress = fields.Float(string='Jarayon (%)')
     
     material_ids = fields.One2many('construction.stage.material', 'stage_id', string='Materiallar')
@@ -81,12 +82,21 @@ class ConstructionStage(models.Model):
             'context': {'default_stage_id': self.id},
         }
 
-    @api.depends('material_ids.total_cost', 'service_ids.total_cost')
-    def _compute_actual_cost(self):
-        for record in self:
-            material_cost = sum(record.material_ids.mapped('total_cost'))
-            service_cost = sum(record.service_ids.mapped('total_cost'))
-            record.actual_cost = material_cost + service_cost
+    def write(self, vals):
+        old_projects = set(self.mapped('project_id').ids) if 'project_id' in vals else set()
+        res = super().write(vals)
+        if old_projects:
+            # All lines of the stage moved with it
+            project_ids = list(old_projects | set(self.mapped('project_id').ids))
+            self.env['construction.project.daily.balance'].rebuild(project_ids)
+            self.env['construction.project'].check_cost_rollups(project_ids, repair=True)
+        return res
+
+    def unlink(self):
+        # The database cascade would skip the lines' unlink (daily balance and cost deltas)
+        self.sudo().mapped('material_ids').unlink()
+        self.sudo().mapped('service_ids').unlink()
+        return super().unlink()
 
     def action_start(self):
         self.write({'state': 'in_progress', 'start_date': fields.Date.today()})
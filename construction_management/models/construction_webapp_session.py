@@ -1,8 +1,28 @@
 from odoo import models, fields, api
+import hashlib
+import hmac
+import json
 import secrets
+import time
 from datetime import datetime, timedelta
+from urllib.parse import parse_qsl
+
+DEFAULT_TOKEN_TTL_MINUTES = 30
+# Telegram re-signs initData every time the WebApp is opened
+INIT_DATA_MAX_AGE = 24 * 3600
+
+
+def _digest_equals(expected, received):
+    """Constant-time compare on bytes: compare_digest rejects non-ASCII str input."""
+    return hmac.compare_digest(expected.encode(), str(received).encode('utf-8', 'surrogatepass'))
+
 
 class ConstructionWebAppSession(models.Model):
+    """
+    Legacy DB-backed WebApp sessions.
+    New links use stateless signed tokens (sign_token / verify_token); rows left
+    here are only purged by the cleanup cron.
+    """
     _name = 'construction.webapp.session'
     _description = 'Construction WebApp Session'
 
@@ -15,10 +35,10 @@ class ConstructionWebAppSession(models.Model):
     def create_session(self, user_id):
         # Clean up expired sessions for this user
         self.search([('user_id', '=', user_id), ('expiry', '<', fields.Datetime.now())]).unlink()
-        
+
         token = secrets.token_urlsafe(32)
         expiry = fields.Datetime.now() + timedelta(minutes=30) # 30 min expiry
-        
+
         return self.create({
             'token': token,
             'user_id': user_id,
@@ -33,3 +53,91 @@ class ConstructionWebAppSession(models.Model):
             self.active = False
             return False
         return True
+
+    # --- Stateless tokens ---
+
+    def _get_signing_key(self):
+        # get_param is ormcached, so this stays in memory after the first call
+        secret = self.env['ir.config_parameter'].sudo().get_param('database.secret') or ''
+        return hashlib.sha256(f"construction.webapp:{secret}".encode()).digest()
+
+    def _sign(self, payload):
+        return hmac.new(self._get_signing_key(), payload.encode(), hashlib.sha256).hexdigest()
+
+    @api.model
+    def sign_token(self, user_id, ttl_minutes=None):
+        """Returns "<user_id>.<expiry_ts>.<signature>"."""
+        if ttl_minutes is None:
+            try:
+                ttl_minutes = int(self.env['ir.config_parameter'].sudo().get_param(
+                    'construction.webapp_token_ttl', DEFAULT_TOKEN_TTL_MINUTES))
+            except (TypeError, ValueError):
+                ttl_minutes = DEFAULT_TOKEN_TTL_MINUTES
+        payload = f"{int(user_id)}.{int(time.time()) + ttl_minutes * 60}"
+        return f"{payload}.{self._sign(payload)}"
+
+    @api.model
+    def verify_token(self, token):
+        """Returns the user id of a valid, unexpired token, else None. No DB access."""
+        if not token or token.count('.') != 2:
+            return None
+        user_id, expiry, signature = token.split('.')
+        if not (user_id.isascii() and user_id.isdigit() and expiry.isascii() and expiry.isdigit()):
+            return None
+        if not _digest_equals(self._sign(f"{user_id}.{expiry}"), signature):
+            return None
+        if int(expiry) < time.time():
+            return None
+        return int(user_id)
+
+    @api.model
+    def sign_image(self, image_id, checksum):
+        """
+        Signature of a content-addressed image URL. It does not expire: the URL
+        only ever serves that exact content, so browsers may cache it forever.
+        """
+        return self._sign(f"image.{int(image_id)}.{checksum}")[:32]
+
+    @api.model
+    def verify_image_signature(self, image_id, checksum, signature):
+        return bool(signature) and _digest_equals(self.sign_image(image_id, checksum), signature)
+
+    @api.model
+    def verify_init_data(self, init_data):
+        """
+        Validates Telegram WebApp initData (https://core.telegram.org/bots/webapps).
+        Returns the Telegram user id, or None when the signature or age is invalid.
+        """
+        if not init_data:
+            return None
+        bot_token = self.env['ir.config_parameter'].sudo().get_param('construction_bot.token')
+        if not bot_token:
+            return None
+        try:
+            pairs = dict(parse_qsl(init_data, keep_blank_values=True, strict_parsing=True))
+        except ValueError:
+            return None
+        received_hash = pairs.pop('hash', None)
+        if not received_hash:
+            return None
+
+        data_check_string = '\n'.join(f"{k}={v}" for k, v in sorted(pairs.items()))
+        secret_key = hmac.new(b'WebAppData', bot_token.encode(), hashlib.sha256).digest()
+        expected = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+        if not _digest_equals(expected, received_hash):
+            return None
+
+        try:
+            if time.time() - int(pairs.get('auth_date', 0)) > INIT_DATA_MAX_AGE:
+                return None
+            return int(json.loads(pairs.get('user') or '{}').get('id'))
+        except (TypeError, ValueError):
+            return None
+
+    @api.model
+    def cleanup_legacy_sessions(self):
+        """Cron: legacy session rows are no longer read, drop the expired ones."""
+        self.env.cr.execute(
+            "DELETE FROM construction_webapp_session WHERE expiry < %s OR active IS NOT TRUE",
+            (fields.Datetime.now(),)
+        )
@@ -0,0 +1 @@
+from . import construction_financial_ledger
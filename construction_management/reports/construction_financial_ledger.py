@@ -0,0 +1,101 @@
+from odoo import models, fields, tools
+
+
+class ConstructionFinancialLedgerLine(models.Model):
+    """
+    Read-only financial report preview: a SQL view over incomes and task
+    materials/services with the running balance, the "funding source" group
+    (latest income so far) and an "Ostatka" row before every income.
+    Opening the report is one query and writes nothing. Every CTE is read
+    once, so Postgres inlines them and the project_id filter reaches the base
+    scans. Product names come through product_id, in the user's language.
+    """
+    _name = 'construction.financial.ledger.line'
+    _description = 'Loyiha moliyaviy operatsiyalari'
+    _auto = False
+    _order = 'project_id, sequence'
+
+    project_id = fields.Many2one('construction.project', string='Loyiha', readonly=True)
+    sequence = fields.Integer(string='Tartib', readonly=True)
+    date = fields.Date(string='Sana', readonly=True)
+    description = fields.Char(string='Izoh', readonly=True)
+    product_id = fields.Many2one('product.product', string='Mahsulot', readonly=True)
+    income = fields.Float(string='Kirim', readonly=True)
+    expense = fields.Float(string='Chiqim', readonly=True)
+    balance = fields.Float(string='Balans', readonly=True, group_operator=False)
+    group_name = fields.Char(string='Moliyalashtirish manbai', readonly=True)
+    currency_id = fields.Many2one('res.currency', related='project_id.currency_id', readonly=True)
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(f"""
+            CREATE OR REPLACE VIEW {self._table} AS
+            WITH stream AS (
+                SELECT i.project_id, i.date, 'income' AS kind,
+                       COALESCE(NULLIF(i.description, ''), 'Income') AS description, NULL::int AS product_id,
+                       i.amount AS income, 0.0 AS expense,
+                       0 AS rank, 0 AS stage_id, 0 AS task_id, i.id AS res_id
+                FROM construction_project_income i
+                WHERE i.date <= CURRENT_DATE AND COALESCE(i.amount, 0) != 0
+                UNION ALL
+                SELECT m.project_id, m.date, 'material', '[' || st.name || ']', m.product_id,
+                       0.0, m.total_cost,
+                       1, st.id, t.id, m.id
+                FROM construction_stage_material m
+                JOIN construction_stage_task t ON t.id = m.task_id
+                JOIN construction_stage st ON st.id = t.stage_id
+                WHERE m.date <= CURRENT_DATE AND COALESCE(m.total_cost, 0) != 0
+                UNION ALL
+                SELECT s.project_id, s.date, 'service',
+                       '[' || st.name || ']' || COALESCE(' (' || NULLIF(s.description, '') || ')', ''), s.service_id,
+                       0.0, s.total_cost,
+                       2, st.id, t.id, s.id
+                FROM construction_stage_service s
+                JOIN construction_stage_task t ON t.id = s.task_id
+                JOIN construction_stage st ON st.id = t.stage_id
+                WHERE s.date <= CURRENT_DATE AND COALESCE(s.total_cost, 0) != 0
+            ),
+            ordered AS (
+                SELECT s.*,
+                       SUM(s.income - s.expense) OVER w AS balance,
+                       -- Every positive income opens a new funding group
+                       SUM(CASE WHEN s.kind = 'income' AND s.income > 0 THEN 1 ELSE 0 END) OVER w AS grp
+                FROM stream s
+                WINDOW w AS (
+                    PARTITION BY s.project_id
+                    ORDER BY s.date, (s.rank > 0), s.stage_id, s.task_id, s.rank, s.res_id
+                    ROWS UNBOUNDED PRECEDING
+                )
+            ),
+            grouped AS (
+                SELECT o.*,
+                       COALESCE(MAX(CASE WHEN o.kind = 'income' AND o.income > 0 THEN
+                           to_char(o.date, 'YYYY-MM-DD') || ' | Income: ' || o.description
+                           || ' (' || to_char(o.income, 'FM999,999,999,999,990.00') || ')'
+                       END) OVER (PARTITION BY o.project_id, o.grp), 'Initial Balance / Uncategorized') AS group_name
+                FROM ordered o
+            ),
+            lines AS (
+                -- sub 0: balance carried into the group, shown right before its income
+                SELECT CASE WHEN x.sub = 0 THEN g.res_id * 4
+                            ELSE g.res_id * 4 + CASE g.kind WHEN 'income' THEN 1 WHEN 'material' THEN 2 ELSE 3 END
+                       END AS id,
+                       g.project_id, g.date,
+                       CASE WHEN x.sub = 0 THEN 'Ostatka' ELSE g.description END AS description,
+                       CASE WHEN x.sub = 0 THEN NULL ELSE g.product_id END AS product_id,
+                       CASE WHEN x.sub = 0 THEN 0.0 ELSE g.income END AS income,
+                       CASE WHEN x.sub = 0 THEN 0.0 ELSE g.expense END AS expense,
+                       CASE WHEN x.sub = 0 THEN g.balance - g.income ELSE g.balance END AS balance,
+                       g.group_name, g.rank, g.stage_id, g.task_id, g.res_id, x.sub
+                FROM grouped g
+                CROSS JOIN LATERAL (VALUES (0), (1)) AS x(sub)
+                WHERE x.sub = 1 OR (g.kind = 'income' AND g.income > 0)
+            )
+            SELECT l.id, l.project_id, l.date, l.description, l.product_id, l.income, l.expense, l.balance,
+                   l.group_name,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY l.project_id
+                       ORDER BY l.date, (l.rank > 0), l.stage_id, l.task_id, l.rank, l.res_id, l.sub
+                   ) AS sequence
+            FROM lines l
+        """)
@@ -0,0 +1,188 @@
+# Cash-flow Forecast
+# Projects project balances forward from the recent spend of their stages,
+# capped by what is left of each stage's estimated budget. No future income is
+# assumed: the answer is "when does the balance go negative without new payments".
+
+import logging
+from datetime import timedelta
+
+from odoo import fields
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+_logger = logging.getLogger(__name__)
+
+# Burn rate window and projection length, days (overridable via ir.config_parameter)
+LOOKBACK_DAYS = 30
+HORIZON_DAYS = 90
+ACTIVE_STATES = ('in_progress',)
+# Completed stages spend nothing more
+CLOSED_STAGE_STATES = ('completed',)
+
+
+class CashflowForecast:
+    """
+    All requested projects are loaded with three grouped queries and projected
+    together: stage spend is a (stages x lookback) matrix, the projection a
+    (projects x horizon) matrix. Falls back to plain Python without NumPy.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.cr = env.cr
+        ICP = env['ir.config_parameter'].sudo()
+        self.lookback_days = self._positive_int(ICP.get_param('construction.forecast_lookback_days'), LOOKBACK_DAYS)
+        self.horizon_days = self._positive_int(ICP.get_param('construction.forecast_horizon_days'), HORIZON_DAYS)
+
+    @staticmethod
+    def _positive_int(value, default):
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return default
+        return value if value > 0 else default
+
+    def _load(self, project_ids, today):
+        """(balances {project: balance}, stages [(id, project, budget, actual)], spend [(stage, day index, amount)])"""
+        self.cr.execute("""
+            SELECT id, COALESCE(balance, 0) FROM construction_project WHERE id IN %s ORDER BY id
+        """, (tuple(project_ids),))
+        balances = dict(self.cr.fetchall())
+
+        self.cr.execute("""
+            SELECT id, project_id, COALESCE(estimated_budget, 0), COALESCE(actual_cost, 0)
+            FROM construction_stage
+            WHERE project_id IN %s AND COALESCE(state, 'pending') NOT IN %s
+            ORDER BY id
+        """, (tuple(project_ids), CLOSED_STAGE_STATES))
+        stages = self.cr.fetchall()
+
+        # Daily spend per stage over the lookback window (day 0 = oldest day)
+        start = today - timedelta(days=self.lookback_days - 1)
+        self.cr.execute("""
+            SELECT x.stage_id, x.date - %s, SUM(x.amount)
+            FROM (
+                SELECT m.stage_id, m.date, COALESCE(m.total_cost, 0) AS amount
+                FROM construction_stage_material m
+                WHERE m.project_id IN %s AND m.date BETWEEN %s AND %s
+                UNION ALL
+                SELECT s.stage_id, s.date, COALESCE(s.total_cost, 0)
+                FROM construction_stage_service s
+                WHERE s.project_id IN %s AND s.date BETWEEN %s AND %s
+            ) x
+            GROUP BY x.stage_id, x.date
+        """, (start, tuple(project_ids), start, today, tuple(project_ids), start, today))
+        spend = self.cr.fetchall()
+        return balances, stages, spend
+
+    def _project_numpy(self, project_order, balances, stages, spend):
+        """(projection P x H, burn per stage, remaining per stage)"""
+        n_stages = len(stages)
+        project_index = {pid: i for i, pid in enumerate(project_order)}
+        stage_index = {row[0]: i for i, row in enumerate(stages)}
+
+        series = np.zeros((n_stages, self.lookback_days))
+        if spend:
+            rows = [(stage_index[stage_id], day, amount) for stage_id, day, amount in spend if stage_id in stage_index]
+            if rows:
+                idx, days, amounts = zip(*rows)
+                np.add.at(series, (np.array(idx), np.array(days)), np.array(amounts, dtype=float))
+        burn = series.sum(axis=1) / self.lookback_days
+
+        budget = np.array([row[2] for row in stages], dtype=float)
+        actual = np.array([row[3] for row in stages], dtype=float)
+        # Stages without a budget keep spending at their current rate
+        remaining = np.where(budget > 0, np.maximum(budget - actual, 0.0), np.inf)
+
+        horizon = np.arange(1, self.horizon_days + 1, dtype=float)
+        stage_spend = np.minimum(burn[:, None] * horizon[None, :], remaining[:, None])
+
+        spent = np.zeros((len(project_order), self.horizon_days))
+        if n_stages:
+            owner = np.array([project_index[row[1]] for row in stages])
+            np.add.at(spent, owner, stage_spend)
+        opening = np.array([balances[pid] for pid in project_order], dtype=float)
+        return opening[:, None] - spent, burn.tolist(), remaining.tolist()
+
+    def _project_python(self, project_order, balances, stages, spend):
+        stage_index = {row[0]: i for i, row in enumerate(stages)}
+        totals = [0.0] * len(stages)
+        for stage_id, _day, amount in spend:
+            if stage_id in stage_index:
+                totals[stage_index[stage_id]] += amount
+        burn = [total / self.lookback_days for total in totals]
+        remaining = [max(budget - actual, 0.0) if budget > 0 else float('inf')
+                     for _id, _pid, budget, actual in stages]
+
+        spent = {pid: [0.0] * self.horizon_days for pid in project_order}
+        for i, (_id, pid, _budget, _actual) in enumerate(stages):
+            row = spent[pid]
+            for day in range(self.horizon_days):
+                row[day] += min(burn[i] * (day + 1), remaining[i])
+        projection = [[balances[pid] - value for value in spent[pid]] for pid in project_order]
+        return projection, burn, remaining
+
+    def forecast(self, project_ids=None):
+        """
+        {project_id: forecast} for the given projects, or for every active
+        project. See forecast_project for the shape of one entry.
+        """
+        if project_ids is None:
+            self.cr.execute("SELECT id FROM construction_project WHERE state IN %s", (ACTIVE_STATES,))
+            project_ids = [row[0] for row in self.cr.fetchall()]
+        if not project_ids:
+            return {}
+
+        today = fields.Date.today()
+        balances, stages, spend = self._load(project_ids, today)
+        project_order = sorted(balances)
+        if not project_order:
+            return {}
+        project = self._project_numpy if HAS_NUMPY else self._project_python
+        projection, burn, remaining = project(project_order, balances, stages, spend)
+
+        by_project = {pid: [] for pid in project_order}
+        for i, (stage_id, pid, _budget, _actual) in enumerate(stages):
+            by_project[pid].append({
+                'id': stage_id,
+                'daily_burn': round(burn[i], 2),
+                'remaining_budget': None if remaining[i] == float('inf') else round(remaining[i], 2),
+            })
+
+        result = {}
+        for row_index, pid in enumerate(project_order):
+            values = [float(value) for value in projection[row_index]]
+            balance = balances[pid]
+            if balance < 0:
+                days_to_zero = 0
+            else:
+                days_to_zero = next((day + 1 for day, value in enumerate(values) if value < 0), None)
+            stage_items = by_project[pid]
+            result[pid] = {
+                'project_id': pid,
+                'balance': balance,
+                'daily_burn': round(sum(item['daily_burn'] for item in stage_items), 2),
+                'lookback_days': self.lookback_days,
+                'horizon_days': self.horizon_days,
+                'days_to_zero': days_to_zero,
+                'zero_date': (today + timedelta(days=days_to_zero)).strftime('%Y-%m-%d') if days_to_zero is not None else None,
+                'projection': [
+                    {'date': (today + timedelta(days=day + 1)).strftime('%Y-%m-%d'), 'balance': round(value, 2)}
+                    for day, value in enumerate(values)
+                ],
+                'stages': stage_items,
+            }
+        _logger.debug(f"[FORECAST] {len(result)} projects, {len(stages)} stages (numpy={HAS_NUMPY})")
+        return result
+
+    def forecast_project(self, project_id):
+        """
+        One project: balance, daily_burn, days_to_zero / zero_date (None when the
+        balance stays positive over the horizon), daily projection and per-stage
+        burn rates.
+        """
+        return self.forecast([project_id]).get(project_id)
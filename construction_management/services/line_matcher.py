@@ -0,0 +1,165 @@
+# Line Matcher Service
+# Matches free-form product names (voice / AI output) against request lines.
+
+import re
+import logging
+from collections import defaultdict
+
+_logger = logging.getLogger(__name__)
+
+# Uzbek / Russian Cyrillic -> Uzbek Latin
+_TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'j',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'x', 'ц': 's',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', 'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+}
+
+# Units and filler words that say nothing about the product itself
+_STOP_WORDS = {
+    'dona', 'ta', 'sht', 'm', 'm2', 'm3', 'kv', 'kub', 'metr', 'metrlik', 'mm', 'sm', 'cm',
+    'kg', 'gr', 'g', 'l', 'litr', 'qop', 'meshok', 'komplekt', 'kompl', 'pachka',
+    'rulon', 'tonna', 't', 'list', 'som', 'sum', 'narxi', 'narx',
+}
+
+_APOSTROPHES = re.compile(r"[ʻʼ‘’`']")
+_PARENS = re.compile(r"\([^)]*\)|\[[^\]]*\]")
+_NON_WORD = re.compile(r"[^0-9a-z.]+")
+# Units glued to numbers: "12mm", "50kg", "10m2"
+_GLUED_UNIT = re.compile(r"(\d)(mm|sm|cm|kg|gr|m2|m3|m|l|t)\b")
+
+MIN_SCORE = 0.3
+
+# Spelling variants of the bot's unit list
+_UOM_ALIASES = {
+    'sht': 'dona', 'ta': 'dona', 'pcs': 'dona',
+    'metr': 'm', 'kv.m': 'm2', 'kvm': 'm2', 'm²': 'm2', 'kub': 'm3', 'm³': 'm3',
+    'l': 'litr', 'meshok': 'qop', 'kompl': 'komplekt', 't': 'tonna',
+}
+_KNOWN_UOMS = {
+    'dona', 'm', 'm2', 'm3', 'kg', 'litr', 'qop', 'komplekt', 'pachka', 'rulon', 'tonna',
+}
+_TRAILING_UOM = re.compile(r"\(([^()]{1,12})\)\s*$")
+
+
+def normalize_name(name):
+    """
+    Folds a product name to a comparable form:
+    lowercase, Cyrillic transliterated, bracketed notes, units and punctuation removed.
+    "Гипсокартон (Knauf) 12,5 мм" -> "gipsokarton 12.5"
+    """
+    if not name:
+        return ''
+    text = name.lower()
+    text = ''.join(_TRANSLIT.get(ch, ch) for ch in text)
+    text = _APOSTROPHES.sub('', text)
+    text = _PARENS.sub(' ', text)
+    text = text.replace(',', '.')
+    text = _GLUED_UNIT.sub(r'\1 \2', text)
+    text = _NON_WORD.sub(' ', text)
+    words = [w.strip('.') for w in text.split()]
+    return ' '.join(w for w in words if w and w not in _STOP_WORDS)
+
+
+def normalize_uom(uom):
+    """'М2' -> 'm2', 'шт' -> 'dona'. Unknown units are returned folded as-is."""
+    if not uom:
+        return ''
+    text = ''.join(_TRANSLIT.get(ch, ch) for ch in uom.strip().lower())
+    text = text.replace(' ', '')
+    return _UOM_ALIASES.get(text, text)
+
+
+def split_uom(name):
+    """
+    Request lines created from AI drafts carry the unit as "Name (uom)".
+    Returns the normalized unit or ''.
+    """
+    match = _TRAILING_UOM.search(name or '')
+    if not match:
+        return ''
+    uom = normalize_uom(match.group(1))
+    return uom if uom in _KNOWN_UOMS else ''
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PendingLineIndex:
+    """
+    In-memory token + trigram index over request lines.
+    Built once per incoming message, then queried for every spoken item.
+
+    lines: iterable of (line_id, product_name)
+    """
+
+    def __init__(self, lines):
+        self._names = {}
+        self._tokens = {}
+        self._grams = {}
+        self._order = {}
+        self._by_token = defaultdict(set)
+        self._by_gram = defaultdict(set)
+        for pos, (line_id, product_name) in enumerate(lines):
+            norm = normalize_name(product_name)
+            if not norm:
+                continue
+            tokens = set(norm.split())
+            grams = _trigrams(norm)
+            self._names[line_id] = norm
+            self._tokens[line_id] = tokens
+            self._grams[line_id] = grams
+            self._order[line_id] = pos
+            for token in tokens:
+                self._by_token[token].add(line_id)
+            for gram in grams:
+                self._by_gram[gram].add(line_id)
+
+    def __len__(self):
+        return len(self._names)
+
+    def _score(self, norm, tokens, grams, line_id):
+        name = self._names[line_id]
+        if name == norm:
+            return 1.0
+        if norm in name or name in norm:
+            # Substring match; prefer the closest length
+            return 0.9 - 0.1 * abs(len(name) - len(norm)) / max(len(name), len(norm))
+        line_tokens = self._tokens[line_id]
+        token_score = len(tokens & line_tokens) / len(line_tokens)
+        line_grams = self._grams[line_id]
+        gram_score = 2.0 * len(grams & line_grams) / (len(grams) + len(line_grams))
+        return 0.5 * token_score + 0.5 * gram_score
+
+    def search(self, name, limit=5, min_score=MIN_SCORE):
+        """Returns [(line_id, score), ...] best first."""
+        norm = normalize_name(name)
+        if not norm:
+            return []
+        tokens = set(norm.split())
+        grams = _trigrams(norm)
+
+        # Candidates: any shared token, or at least a third of the query trigrams
+        hits = defaultdict(int)
+        for gram in grams:
+            for line_id in self._by_gram.get(gram, ()):
+                hits[line_id] += 1
+        candidates = {line_id for line_id, count in hits.items() if count * 3 >= len(grams)}
+        for token in tokens:
+            candidates |= self._by_token.get(token, set())
+
+        scored = []
+        for line_id in candidates:
+            score = self._score(norm, tokens, grams, line_id)
+            if score >= min_score:
+                scored.append((line_id, score))
+        scored.sort(key=lambda r: (-r[1], self._order[r[0]]))
+        return scored[:limit]
+
+    def best(self, name, min_score=MIN_SCORE):
+        """Returns the best matching line id or None."""
+        result = self.search(name, limit=1, min_score=min_score)
+        return result[0][0] if result else None
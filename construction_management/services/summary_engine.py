@@ -0,0 +1,734 @@
+# Summary Engine
+# Builds the WebApp dashboard payload from a handful of grouped SQL queries.
+
+import gzip
+import json
+import logging
+from datetime import timedelta
+
+import psycopg2
+
+from odoo import fields
+from odoo.exceptions import AccessError, UserError
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+_logger = logging.getLogger(__name__)
+
+# Responses smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 200
+# Delta sync re-sends rows written this long before the watermark: a concurrent
+# transaction may commit after the watermark with an earlier write_date
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# Batch endpoint: queries per request and the fields project_totals can return
+MAX_BATCH_QUERIES = 20
+PROJECT_TOTAL_FIELDS = (
+    'name', 'balance', 'income_period', 'payment_count', 'last_payment_date',
+    'expense_period', 'material_total', 'service_total',
+)
+
+# Tombstone model -> key of the delta sync payload
+SYNC_MODELS = {
+    'construction.project.income': 'incomes',
+    'construction.stage.material': 'expenses',
+    'construction.stage.service': 'expenses',
+    'construction.stage': 'stages',
+    'construction.stage.task': 'tasks',
+    'construction.stage.image': 'images',
+}
+
+
+def resolve_period(period, custom_start=None, custom_end=None):
+    """(date_from, date_to) for the dashboard period filter; (None, None) means all time."""
+    today = fields.Date.today()
+    if period == 'today':
+        return today, today
+    if period == 'week':
+        return today - timedelta(days=today.weekday()), today  # Start of week (Mon)
+    if period == 'month':
+        return today.replace(day=1), today
+    if period == 'custom' and custom_start and custom_end:
+        return fields.Date.from_string(custom_start), fields.Date.from_string(custom_end)
+    return None, None
+
+
+def dumps(data):
+    """Fast JSON encoding (orjson when installed). Returns bytes."""
+    if HAS_ORJSON:
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, default=str, separators=(',', ':')).encode('utf-8')
+
+
+def encode_response(data, accept_encoding=''):
+    """Returns (body, headers) ready for request.make_response."""
+    return compress_body(dumps(data), accept_encoding)
+
+
+def compress_body(body, accept_encoding='', gzipped=None):
+    """gzips an encoded JSON body when the client accepts it; gzipped is a precomputed copy."""
+    headers = [('Content-Type', 'application/json; charset=utf-8'), ('Vary', 'Accept-Encoding')]
+    if len(body) >= GZIP_MIN_BYTES and 'gzip' in (accept_encoding or ''):
+        body = gzipped or gzip.compress(body, compresslevel=5)
+        headers.append(('Content-Encoding', 'gzip'))
+    return body, headers
+
+
+class SummaryEngine:
+    """
+    Access is checked once on the project through the ORM (record rules live there);
+    child rows are then read with plain SQL scoped to that project.
+    """
+
+    def __init__(self, env, user):
+        self.env = env
+        self.user = user
+        self.cr = env.cr
+        self.lang = user.lang or 'en_US'
+
+    def get_project(self, project_id=None):
+        """Project visible to the user (first one when no id is given), or None."""
+        Project = self.env['construction.project'].with_user(self.user)
+        if not project_id:
+            return Project.search([], limit=1) or None
+        project = Project.browse(project_id).exists()
+        if not project:
+            return None
+        try:
+            project.check_access_rights('read')
+            project.check_access_rule('read')
+        except Exception:
+            return None
+        return project
+
+    def get_data_version(self, project_id):
+        """Current data_version of the project, or None if it does not exist."""
+        self.cr.execute("SELECT COALESCE(data_version, 0) FROM construction_project WHERE id = %s", (project_id,))
+        row = self.cr.fetchone()
+        return row[0] if row else None
+
+    def sync_state(self, project_id):
+        """{'version', 'watermark'}: where a client starts polling /webapp/api/changes from."""
+        self.cr.execute("""
+            SELECT COALESCE(data_version, 0), now() AT TIME ZONE 'UTC'
+            FROM construction_project WHERE id = %s
+        """, (project_id,))
+        version, watermark = self.cr.fetchone()
+        return {'version': version, 'watermark': fields.Datetime.to_string(watermark)}
+
+    def _date_clause(self, column, date_from, date_to):
+        sql, params = '', []
+        if date_from:
+            sql += f" AND {column} >= %s"
+            params.append(date_from)
+        if date_to:
+            sql += f" AND {column} <= %s"
+            params.append(date_to)
+        return sql, params
+
+    def _product_name(self, alias):
+        return f"COALESCE({alias}.name->>%s, {alias}.name->>'en_US')"
+
+    def get_stage_project_id(self, stage_id):
+        """Project id of a stage (not access-checked), or None."""
+        self.cr.execute("SELECT project_id FROM construction_stage WHERE id = %s", (stage_id,))
+        row = self.cr.fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _limit(limit, default=DEFAULT_PAGE_SIZE):
+        try:
+            return max(1, min(int(limit), MAX_PAGE_SIZE))
+        except (TypeError, ValueError):
+            return default
+
+    # --- Headline totals ---
+
+    def income_totals(self, project_id, date_from=None, date_to=None):
+        clause, params = self._date_clause('i.date', date_from, date_to)
+        self.cr.execute(f"""
+            SELECT COALESCE(SUM(i.amount), 0), COUNT(*), MAX(i.date)
+            FROM construction_project_income i
+            WHERE i.project_id = %s {clause}
+        """, [project_id] + params)
+        return self.cr.fetchone()
+
+    def expense_stage_totals(self, project_id, date_from=None, date_to=None):
+        """
+        Per-stage material/service totals, no line items. Counts the task lines
+        under the task's stage, the same set as project.balance and the daily
+        balance snapshot behind project_totals.
+        """
+        m_clause, m_params = self._date_clause('m.date', date_from, date_to)
+        s_clause, s_params = self._date_clause('s.date', date_from, date_to)
+        self.cr.execute(f"""
+            SELECT st.id, st.name,
+                   COALESCE(SUM(x.amount) FILTER (WHERE x.kind = 'material'), 0),
+                   COALESCE(SUM(x.amount) FILTER (WHERE x.kind = 'service'), 0),
+                   COUNT(*)
+            FROM (
+                SELECT m.task_id, 'material' AS kind, COALESCE(m.total_cost, 0) AS amount
+                FROM construction_stage_material m
+                WHERE m.task_id IS NOT NULL {m_clause}
+                UNION ALL
+                SELECT s.task_id, 'service', COALESCE(s.total_cost, 0)
+                FROM construction_stage_service s
+                WHERE s.task_id IS NOT NULL {s_clause}
+            ) x
+            JOIN construction_stage_task t ON t.id = x.task_id
+            JOIN construction_stage st ON st.id = t.stage_id
+            WHERE st.project_id = %s
+            GROUP BY st.id, st.name
+            ORDER BY st.id
+        """, m_params + s_params + [project_id])
+        return [{
+            'id': stage_id,
+            'name': name,
+            'material_total': material,
+            'service_total': service,
+            'total': material + service,
+            'count': count,
+        } for stage_id, name, material, service, count in self.cr.fetchall()]
+
+    def stage_headers(self, project_id, stage_ids=None):
+        """Stages with checklist progress and image counts, no tasks or images."""
+        stage_clause, stage_params = '', []
+        if stage_ids is not None:
+            if not stage_ids:
+                return []
+            stage_clause, stage_params = "AND st.id IN %s", [tuple(stage_ids)]
+        self.cr.execute(f"""
+            SELECT st.id, st.name, st.stage_type,
+                   COALESCE(chk.total, 0), COALESCE(chk.done, 0), COALESCE(img.cnt, 0)
+            FROM construction_stage st
+            LEFT JOIN (
+                SELECT t.stage_id, COUNT(*) AS total, COUNT(*) FILTER (WHERE s.is_done) AS done
+                FROM construction_stage_task t
+                JOIN construction_stage_service s ON s.task_id = t.id
+                WHERE t.name NOT ILIKE %s AND t.name NOT ILIKE %s
+                GROUP BY t.stage_id
+            ) chk ON chk.stage_id = st.id
+            LEFT JOIN (
+                SELECT t.stage_id, COUNT(*) AS cnt
+                FROM construction_stage_image i
+                JOIN construction_stage_task t ON t.id = i.task_id
+                WHERE t.name ILIKE %s
+                GROUP BY t.stage_id
+            ) img ON img.stage_id = st.id
+            WHERE st.project_id = %s {stage_clause}
+            ORDER BY st.id
+        """, ['%rasmlar%', '%материал%', '%rasmlar%', project_id] + stage_params)
+
+        result = []
+        for stage_id, name, stage_type, total, done, image_count in self.cr.fetchall():
+            progress = (done / total * 100) if total > 0 else 0
+            if progress >= 100:
+                status = 'completed'
+            elif progress > 0:
+                status = 'in_progress'
+            else:
+                status = 'pending'
+            result.append({
+                'id': stage_id,
+                'name': name,
+                'type': stage_type,
+                'status': status,
+                'progress': round(progress, 1),
+                'service_count': total,
+                'image_count': image_count,
+            })
+        return result
+
+    def build_summary(self, project, period='all', custom_start=None, custom_end=None):
+        """Headline totals only; details come from the paginated endpoints."""
+        date_from, date_to = resolve_period(period, custom_start, custom_end)
+        pid = project.id
+
+        income_total, payment_count, last_payment = self.income_totals(pid, date_from, date_to)
+        expense_stages = self.expense_stage_totals(pid, date_from, date_to)
+        material_total = sum(st['material_total'] for st in expense_stages)
+        service_total = sum(st['service_total'] for st in expense_stages)
+
+        return {
+            'project': {
+                'id': pid,
+                'name': project.name,
+                'balance': project.balance,  # All time
+                'income_period': income_total,
+                'expense_period': material_total + service_total,
+                'material_total': material_total,
+                'service_total': service_total,
+                'last_payment_date': last_payment.strftime('%Y-%m-%d') if last_payment else None,
+                'payment_count': payment_count,
+            },
+            'stages': self.stage_headers(pid),
+            'expense_by_stage': expense_stages,
+        }
+
+    # --- Paginated details (keyset cursors) ---
+
+    def _expense_lines_sql(self, m_where, s_where):
+        """
+        Material and service lines as (kind, id, stage_id, name, amount, date, status).
+        Params: lang, <m_where params>, lang, <s_where params>.
+        """
+        return f"""
+                SELECT 'material' AS kind, m.id, m.stage_id,
+                       {self._product_name('pt')} AS name,
+                       m.total_cost AS amount, m.date, m.state AS status
+                FROM construction_stage_material m
+                JOIN product_product pp ON pp.id = m.product_id
+                JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                WHERE {m_where}
+                UNION ALL
+                SELECT 'service', s.id, s.stage_id,
+                       {self._product_name('pt')}
+                           || CASE WHEN COALESCE(s.description, '') != '' THEN ' (' || s.description || ')' ELSE '' END,
+                       s.total_cost, s.date,
+                       CASE WHEN s.is_done THEN 'Done' ELSE 'Planned' END
+                FROM construction_stage_service s
+                JOIN product_product pp ON pp.id = s.service_id
+                JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                WHERE {s_where}
+        """
+
+    @staticmethod
+    def _expense_item(row):
+        kind, item_id, stage_id, name, amount, item_date, status = row
+        return {
+            'type': kind,
+            'id': item_id,
+            'stage_id': stage_id,
+            'name': name,
+            'amount': amount or 0.0,
+            'date': item_date.strftime('%Y-%m-%d'),
+            'status': status,
+            'color': 'blue' if kind == 'material' else 'yellow',
+        }
+
+    # Checksum of the stored image file, selected as 4th column of image queries
+    IMAGE_CHECKSUM_JOIN = """
+            LEFT JOIN ir_attachment att
+                   ON att.res_model = 'construction.stage.image'
+                  AND att.res_field = 'image'
+                  AND att.res_id = img.id
+    """
+
+    def image_url(self, img_id, checksum, token=None, size=None):
+        """
+        Content-addressed, signed URL (cacheable forever); token URL as fallback.
+        size: 'small' / 'medium' rendition, None for the original.
+        """
+        size_param = f'&size={size}' if size else ''
+        if checksum:
+            sig = self.env['construction.webapp.session'].sudo().sign_image(img_id, checksum)
+            return f'/webapp/api/image/{img_id}/{checksum}?sig={sig}{size_param}'
+        return f'/webapp/api/image/{img_id}?token={token}{size_param}'
+
+    def _image_item(self, row, token):
+        img_id, stage_id, img_name, checksum = row[:4]
+        return {
+            'id': img_id,
+            'stage_id': stage_id,
+            'url': self.image_url(img_id, checksum, token),
+            'thumb_url': self.image_url(img_id, checksum, token, 'small'),
+            'preview_url': self.image_url(img_id, checksum, token, 'medium'),
+            'name': img_name or "Rasm",
+        }
+
+    def income_days(self, project_id, date_from=None, date_to=None, cursor=None, limit=None):
+        """
+        Income grouped by day, newest first.
+        cursor: the last day already shown ("YYYY-MM-DD").
+        """
+        limit = self._limit(limit)
+        clause, params = self._date_clause('i.date', date_from, date_to)
+        if cursor:
+            clause += " AND i.date < %s"
+            params.append(fields.Date.from_string(cursor))
+        self.cr.execute(f"""
+            SELECT i.date, SUM(i.amount)
+            FROM construction_project_income i
+            WHERE i.project_id = %s {clause}
+            GROUP BY i.date
+            ORDER BY i.date DESC
+            LIMIT %s
+        """, [project_id] + params + [limit + 1])
+        day_rows = self.cr.fetchall()
+        has_more = len(day_rows) > limit
+        day_rows = day_rows[:limit]
+        if not day_rows:
+            return {'days': [], 'next_cursor': None}
+
+        days = {}
+        for day, total in day_rows:
+            days[day] = {'date': day.strftime('%Y-%m-%d'), 'total': total, 'items': []}
+        self.cr.execute("""
+            SELECT i.id, i.date, i.description, i.amount
+            FROM construction_project_income i
+            WHERE i.project_id = %s AND i.date IN %s
+            ORDER BY i.date DESC, i.id DESC
+        """, (project_id, tuple(days)))
+        for inc_id, day, description, amount in self.cr.fetchall():
+            days[day]['items'].append({'id': inc_id, 'description': description, 'amount': amount})
+
+        result = list(days.values())
+        return {'days': result, 'next_cursor': result[-1]['date'] if has_more else None}
+
+    def expense_items(self, stage_id, date_from=None, date_to=None, cursor=None, limit=None):
+        """
+        Material then service task lines of one stage (the lines behind
+        expense_stage_totals). cursor: "<kind>:<id>" of the last item already shown.
+        """
+        limit = self._limit(limit)
+        m_clause, m_params = self._date_clause('m.date', date_from, date_to)
+        s_clause, s_params = self._date_clause('s.date', date_from, date_to)
+        cursor_clause, cursor_params = '', []
+        if cursor and ':' in cursor:
+            kind, last_id = cursor.split(':', 1)
+            if kind in ('material', 'service') and last_id.isdigit():
+                cursor_clause = "WHERE (x.kind, x.id) > (%s, %s)"
+                cursor_params = [kind, int(last_id)]
+        stage_tasks = "task_id IN (SELECT id FROM construction_stage_task WHERE stage_id = %s)"
+        self.cr.execute(f"""
+            SELECT x.kind, x.id, x.stage_id, x.name, x.amount, x.date, x.status
+            FROM ({self._expense_lines_sql(f"m.{stage_tasks} {m_clause}", f"s.{stage_tasks} {s_clause}")}) x
+            {cursor_clause}
+            ORDER BY x.kind, x.id
+            LIMIT %s
+        """, [self.lang, stage_id] + m_params + [self.lang, stage_id] + s_params + cursor_params + [limit + 1])
+        rows = self.cr.fetchall()
+        has_more = len(rows) > limit
+        items = [self._expense_item(row) for row in rows[:limit]]
+        next_cursor = f"{items[-1]['type']}:{items[-1]['id']}" if has_more else None
+        return {'items': items, 'next_cursor': next_cursor}
+
+    def stage_checklist(self, stage_id, cursor=None, limit=None):
+        """
+        Checklist services of a stage grouped by task.
+        cursor: "<task sequence>:<task id>:<service id>" of the last service shown.
+        """
+        limit = self._limit(limit, default=MAX_PAGE_SIZE)
+        cursor_clause, cursor_params = '', []
+        parts = (cursor or '').split(':')
+        if len(parts) == 3 and all(p.lstrip('-').isdigit() for p in parts):
+            cursor_clause = "AND (t.sequence, t.id, s.id) > (%s, %s, %s)"
+            cursor_params = [int(p) for p in parts]
+        self.cr.execute(f"""
+            SELECT t.id, t.sequence, t.name, t.progress,
+                   s.id, {self._product_name('pt')}, s.description, s.quantity,
+                   u.name, s.unit_price, s.total_cost, s.is_done
+            FROM construction_stage_task t
+            JOIN construction_stage_service s ON s.task_id = t.id
+            JOIN product_product pp ON pp.id = s.service_id
+            JOIN product_template pt ON pt.id = pp.product_tmpl_id
+            LEFT JOIN construction_uom u ON u.id = s.construction_uom_id
+            WHERE t.stage_id = %s
+              AND t.name NOT ILIKE %s
+              AND t.name NOT ILIKE %s
+              {cursor_clause}
+            ORDER BY t.sequence, t.id, s.id
+            LIMIT %s
+        """, [self.lang, stage_id, '%rasmlar%', '%материал%'] + cursor_params + [limit + 1])
+        rows = self.cr.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        tasks = []
+        for (task_id, sequence, task_name, task_progress, svc_id, svc_name, description,
+             quantity, unit, price, total, is_done) in rows:
+            if not tasks or tasks[-1]['id'] != task_id:
+                tasks.append({'id': task_id, 'name': task_name, 'progress': task_progress, 'items': []})
+            tasks[-1]['items'].append({
+                'id': svc_id,
+                'name': svc_name,
+                'description': description or "",
+                'quantity': quantity,
+                'unit': unit or "",
+                'price': price,
+                'total': total,
+                'is_done': bool(is_done),
+            })
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = f"{last[1]}:{last[0]}:{last[4]}"
+        return {'tasks': tasks, 'next_cursor': next_cursor}
+
+    def stage_images(self, stage_id, token, cursor=None, limit=None):
+        """
+        Images of the stage's "Rasmlar" tasks, newest first.
+        cursor: "<upload timestamp>|<image id>" of the last image shown.
+        """
+        limit = self._limit(limit)
+        cursor_clause, cursor_params = '', []
+        if cursor and '|' in cursor:
+            ts, last_id = cursor.rsplit('|', 1)
+            if last_id.isdigit():
+                try:
+                    cursor_params = [fields.Datetime.from_string(ts), int(last_id)]
+                    cursor_clause = "AND (img.upload_date, img.id) < (%s, %s)"
+                except ValueError:
+                    pass
+        self.cr.execute(f"""
+            SELECT img.id, t.stage_id, img.name, att.checksum, img.upload_date
+            FROM construction_stage_image img
+            JOIN construction_stage_task t ON t.id = img.task_id
+            {self.IMAGE_CHECKSUM_JOIN}
+            WHERE t.stage_id = %s AND t.name ILIKE %s
+              AND img.upload_date IS NOT NULL
+              {cursor_clause}
+            ORDER BY img.upload_date DESC, img.id DESC
+            LIMIT %s
+        """, [stage_id, '%rasmlar%'] + cursor_params + [limit + 1])
+        rows = self.cr.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        images = [self._image_item(row, token) for row in rows]
+        next_cursor = None
+        if has_more:
+            next_cursor = f"{fields.Datetime.to_string(rows[-1][4])}|{rows[-1][0]}"
+        return {'images': images, 'next_cursor': next_cursor}
+
+    # --- Delta sync ---
+
+    def changes(self, project_id, since=None, token=None):
+        """
+        Rows of the project written after `since` (the watermark returned by a
+        previous call) and the ids deleted since then. Clients upsert by id, so
+        the overlap window re-sending a few rows is harmless.
+        Without a usable `since` (first call, or older than the tombstone
+        retention) everything is returned with reset=True.
+        """
+        self.cr.execute("SELECT now() AT TIME ZONE 'UTC'")
+        watermark = self.cr.fetchone()[0]
+        try:
+            since_dt = fields.Datetime.from_string(since) if since else None
+        except (TypeError, ValueError):
+            since_dt = None
+        retention = self.env['construction.sync.tombstone'].get_retention_days()
+        reset = not since_dt or since_dt < watermark - timedelta(days=retention)
+        threshold = None if reset else since_dt - SYNC_OVERLAP
+
+        def written(alias):
+            if threshold is None:
+                return '', []
+            return f" AND {alias}.write_date >= %s", [threshold]
+
+        clause, params = written('i')
+        self.cr.execute(f"""
+            SELECT i.id, i.date, i.description, i.amount
+            FROM construction_project_income i
+            WHERE i.project_id = %s {clause}
+            ORDER BY i.id
+        """, [project_id] + params)
+        incomes = [{
+            'id': inc_id,
+            'date': day.strftime('%Y-%m-%d'),
+            'description': description,
+            'amount': amount,
+        } for inc_id, day, description, amount in self.cr.fetchall()]
+
+        m_clause, m_params = written('m')
+        s_clause, s_params = written('s')
+        self.cr.execute(f"""
+            SELECT x.kind, x.id, x.stage_id, x.name, x.amount, x.date, x.status
+            FROM ({self._expense_lines_sql(f"m.project_id = %s {m_clause}", f"s.project_id = %s {s_clause}")}) x
+            ORDER BY x.kind, x.id
+        """, [self.lang, project_id] + m_params + [self.lang, project_id] + s_params)
+        expenses = [self._expense_item(row) for row in self.cr.fetchall()]
+
+        clause, params = written('img')
+        self.cr.execute(f"""
+            SELECT img.id, t.stage_id, img.name, att.checksum
+            FROM construction_stage_image img
+            JOIN construction_stage_task t ON t.id = img.task_id
+            {self.IMAGE_CHECKSUM_JOIN}
+            WHERE img.project_id = %s AND t.name ILIKE %s
+              AND img.upload_date IS NOT NULL {clause}
+            ORDER BY img.id
+        """, [project_id, '%rasmlar%'] + params)
+        images = [self._image_item(row, token) for row in self.cr.fetchall()]
+
+        # Stage progress depends on its tasks, services and images
+        stage_ids = None
+        deleted = {}
+        if threshold is not None:
+            self.cr.execute("""
+                SELECT st.id FROM construction_stage st
+                WHERE st.project_id = %s AND st.write_date >= %s
+                UNION
+                SELECT t.stage_id FROM construction_stage_task t
+                JOIN construction_stage st ON st.id = t.stage_id
+                WHERE st.project_id = %s AND t.write_date >= %s
+                UNION
+                SELECT s.stage_id FROM construction_stage_service s
+                WHERE s.project_id = %s AND s.write_date >= %s
+            """, [project_id, threshold] * 3)
+            stage_ids = {row[0] for row in self.cr.fetchall()} | {img['stage_id'] for img in images}
+
+            self.cr.execute("""
+                SELECT model_name, array_agg(DISTINCT res_id)
+                FROM construction_sync_tombstone
+                WHERE project_id = %s AND deleted_at >= %s
+                GROUP BY model_name
+            """, (project_id, threshold))
+            for model_name, ids in self.cr.fetchall():
+                key = SYNC_MODELS.get(model_name)
+                if key == 'expenses':
+                    kind = 'material' if model_name == 'construction.stage.material' else 'service'
+                    deleted.setdefault(key, []).extend(f"{kind}:{res_id}" for res_id in ids)
+                elif key:
+                    deleted.setdefault(key, []).extend(ids)
+            if deleted:
+                # Tombstones do not keep the stage id; resending all headers is cheap
+                stage_ids = None
+
+        return {
+            'watermark': fields.Datetime.to_string(watermark),
+            'reset': reset,
+            'incomes': incomes,
+            'expenses': expenses,
+            'stages': self.stage_headers(project_id, stage_ids),
+            'images': images,
+            'deleted': deleted,
+        }
+
+    # --- Batch queries ---
+
+    @staticmethod
+    def _pick(item, fields):
+        """Keeps only the requested keys (id always stays)."""
+        if not fields:
+            return item
+        return {key: value for key, value in item.items() if key == 'id' or key in fields}
+
+    def _pick_page(self, page, key, fields):
+        page[key] = [self._pick(item, fields) for item in page[key]]
+        return page
+
+    def project_totals(self, project, date_from=None, date_to=None, fields=None):
+        """Headline totals; only the lookups behind the requested fields are run."""
+        wanted = set(fields or PROJECT_TOTAL_FIELDS)
+        result = {'id': project.id}
+        if 'name' in wanted:
+            result['name'] = project.name
+        if 'balance' in wanted:
+            result['balance'] = project.balance  # All time
+        if wanted & {'income_period', 'expense_period', 'material_total', 'service_total'}:
+            # One indexed pass over the project's daily balance rows
+            totals = self.env['construction.project.daily.balance'].sudo().get_period_totals(
+                project.id, date_from, date_to)
+            result.update({
+                'income_period': totals['income'],
+                'expense_period': totals['expense'],
+                'material_total': totals['material_cost'],
+                'service_total': totals['service_cost'],
+            })
+        if wanted & {'payment_count', 'last_payment_date'}:
+            income_total, payment_count, last_payment = self.income_totals(project.id, date_from, date_to)
+            result.update({
+                'payment_count': payment_count,
+                'last_payment_date': last_payment.strftime('%Y-%m-%d') if last_payment else None,
+            })
+        return self._pick(result, wanted)
+
+    def recent_incomes(self, project_id, limit=None):
+        self.cr.execute("""
+            SELECT i.id, i.date, i.description, i.amount
+            FROM construction_project_income i
+            WHERE i.project_id = %s
+            ORDER BY i.date DESC, i.id DESC
+            LIMIT %s
+        """, (project_id, self._limit(limit, default=10)))
+        return [{
+            'id': inc_id,
+            'date': day.strftime('%Y-%m-%d'),
+            'description': description,
+            'amount': amount,
+        } for inc_id, day, description, amount in self.cr.fetchall()]
+
+    def _batch_query_handlers(self):
+        """name -> (scope, handler(target_id, project, params, fields, token))."""
+        def period(params):
+            return resolve_period(params.get('period', 'all'), params.get('custom_start'), params.get('custom_end'))
+
+        return {
+            'project_totals': ('project', lambda pid, project, params, fields, token:
+                               self.project_totals(project, *period(params), fields=fields)),
+            'stage_progress': ('project', lambda pid, project, params, fields, token:
+                               [self._pick(st, fields) for st in self.stage_headers(pid, params.get('stage_ids'))]),
+            'expense_by_stage': ('project', lambda pid, project, params, fields, token:
+                                 [self._pick(st, fields) for st in self.expense_stage_totals(pid, *period(params))]),
+            'recent_incomes': ('project', lambda pid, project, params, fields, token:
+                               [self._pick(inc, fields) for inc in self.recent_incomes(pid, params.get('limit'))]),
+            'incomes': ('project', lambda pid, project, params, fields, token: self._pick_page(
+                self.income_days(pid, *period(params), cursor=params.get('cursor'), limit=params.get('limit')),
+                'days', fields)),
+            'expenses': ('stage', lambda sid, project, params, fields, token: self._pick_page(
+                self.expense_items(sid, *period(params), cursor=params.get('cursor'), limit=params.get('limit')),
+                'items', fields)),
+            'stage_checklist': ('stage', lambda sid, project, params, fields, token: self._pick_page(
+                self.stage_checklist(sid, cursor=params.get('cursor'), limit=params.get('limit')),
+                'tasks', fields)),
+            'stage_images': ('stage', lambda sid, project, params, fields, token: self._pick_page(
+                self.stage_images(sid, token, cursor=params.get('cursor'), limit=params.get('limit')),
+                'images', fields)),
+        }
+
+    def run_batch(self, queries, token=None):
+        """
+        Runs named queries in one request. Each query is
+        {"id": alias, "name": ..., "project_id"/"stage_id": ..., "params": {...}, "fields": [...]}.
+        Project access is checked once per project for the whole batch; a failing
+        query returns {"error": ...} without affecting the others.
+        """
+        handlers = self._batch_query_handlers()
+        projects = {}
+        results = {}
+        for index, query in enumerate(queries[:MAX_BATCH_QUERIES]):
+            if not isinstance(query, dict):
+                continue
+            alias = str(query.get('id') or query.get('name') or index)
+            spec = handlers.get(query.get('name'))
+            if not spec:
+                results[alias] = {'error': 'Unknown query'}
+                continue
+            scope, handler = spec
+            try:
+                target_id = int(query.get(f'{scope}_id') or 0)
+            except (TypeError, ValueError):
+                target_id = 0
+            pid = target_id if scope == 'project' else (self.get_stage_project_id(target_id) if target_id else None)
+            if not pid:
+                results[alias] = {'error': f'{scope.title()} Not Found'}
+                continue
+            if pid not in projects:
+                projects[pid] = self.get_project(pid)
+            if not projects[pid]:
+                results[alias] = {'error': 'Project Not Found'}
+                continue
+            params = query.get('params') or {}
+            fields = query.get('fields')
+            if not isinstance(params, dict) or not (fields is None or isinstance(fields, list)):
+                results[alias] = {'error': 'Invalid params'}
+                continue
+            # A database error only rolls back its own savepoint, the next queries still run
+            try:
+                with self.cr.savepoint():
+                    results[alias] = handler(target_id, projects[pid], params, fields, token)
+            except (TypeError, ValueError, UserError, AccessError) as e:
+                results[alias] = {'error': str(e)}
+            except psycopg2.Error as e:
+                _logger.warning(f"[BATCH] Query {alias} ({query.get('name')}) failed: {e}")
+                results[alias] = {'error': 'Query failed'}
+            except Exception:
+                _logger.exception(f"[BATCH] Query {alias} ({query.get('name')}) crashed")
+                results[alias] = {'error': 'Query failed'}
+        return results
@@ -1 +0,0 @@
-from . import construction_financial_report_wizard
@@ -14,8 +14,10 @@
         'data/ir_config_parameter.xml',
         # 'data/gemini_param.xml',
         'data/bot_token.xml',
+        'security/ir.model.access.csv',
         'views/res_users_views.xml',
         'views/res_partner_views.xml',
+        'views/ai_usage_views.xml',
     ],
     'installable': True,
     'application': False,
@@ -1,3 +1,4 @@
 from . import res_users
 from . import res_partner
+from . import ai_usage
 from . import telegram_bot
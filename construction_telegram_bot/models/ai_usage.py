@@ -0,0 +1,102 @@
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_DAILY_TOKEN_BUDGET = 200000
+
+
+class ConstructionAiUsage(models.Model):
+    _name = 'construction.ai.usage'
+    _description = 'AI Chaqiruvlari (Token hisobi)'
+    _order = 'create_date desc'
+
+    date = fields.Date(string='Sana', default=fields.Date.context_today, required=True, index=True)
+    project_id = fields.Many2one('construction.project', string='Loyiha', ondelete='set null', index=True)
+    user_id = fields.Many2one('res.users', string='Foydalanuvchi', ondelete='set null')
+    flow = fields.Selection([
+        ('material_request', 'Material so\'rovi'),
+        ('pricing', 'Narxlash'),
+        ('batch_pricing', 'Narxlash (Batch)'),
+    ], string='Jarayon', required=True)
+    model_name = fields.Char(string='Model')
+    input_type = fields.Selection([
+        ('text', 'Matn'),
+        ('voice', 'Ovoz'),
+        ('photo', 'Rasm'),
+    ], string='Kirish turi')
+    input_tokens = fields.Integer(string='Kirish tokenlari')
+    output_tokens = fields.Integer(string='Chiqish tokenlari')
+    total_tokens = fields.Integer(string='Jami tokenlar', compute='_compute_total_tokens', store=True)
+    latency_ms = fields.Integer(string='Kechikish (ms)', group_operator='avg')
+    cached = fields.Boolean(string='Keshdan')
+    over_budget = fields.Boolean(string='Limitdan oshgan')
+    success = fields.Boolean(string='Muvaffaqiyatli', default=True)
+    error = fields.Char(string='Xatolik')
+
+    @api.depends('input_tokens', 'output_tokens')
+    def _compute_total_tokens(self):
+        for rec in self:
+            rec.total_tokens = rec.input_tokens + rec.output_tokens
+
+    @api.model
+    def get_daily_budget(self, project):
+        """Project budget wins; falls back to the global system parameter. 0 means unlimited."""
+        if project and project.ai_daily_token_budget:
+            return project.ai_daily_token_budget
+        value = self.env['ir.config_parameter'].sudo().get_param(
+            'construction.ai_daily_token_budget', DEFAULT_DAILY_TOKEN_BUDGET)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return DEFAULT_DAILY_TOKEN_BUDGET
+
+    @api.model
+    def get_tokens_today(self, project):
+        if not project:
+            return 0
+        self.env.cr.execute("""
+            SELECT COALESCE(SUM(input_tokens + output_tokens), 0)
+            FROM construction_ai_usage
+            WHERE project_id = %s AND date = %s
+        """, (project.id, fields.Date.context_today(self)))
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def is_over_budget(self, project):
+        budget = self.get_daily_budget(project)
+        if not budget:
+            return False
+        return self.get_tokens_today(project) >= budget
+
+    @api.model
+    def log_call(self, flow, usage=None, project=None, user=None, input_type=None, over_budget=False, error=None):
+        usage = usage or {}
+        try:
+            return self.sudo().create({
+                'flow': flow,
+                'project_id': project.id if project else False,
+                'user_id': user.id if user else False,
+                'model_name': usage.get('model'),
+                'input_type': input_type,
+                'input_tokens': usage.get('input_tokens', 0),
+                'output_tokens': usage.get('output_tokens', 0),
+                'latency_ms': usage.get('latency_ms', 0),
+                'cached': usage.get('cached', False),
+                'over_budget': over_budget,
+                'success': not error,
+                'error': error and str(error)[:250],
+            })
+        except Exception as e:
+            # Accounting must never break the bot flow
+            _logger.error(f"[AI_USAGE] Failed to log call: {e}")
+            return self.browse()
+
+
+class ConstructionProject(models.Model):
+    _inherit = 'construction.project'
+
+    ai_daily_token_budget = fields.Integer(
+        string='AI kunlik token limiti',
+        help="0 bo'lsa umumiy sozlama (construction.ai_daily_token_budget) ishlatiladi."
+    )
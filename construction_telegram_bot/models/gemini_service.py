@@ -3,6 +3,9 @@ import json
 import logging
 import requests
 import base64
+import hashlib
+import time
+from collections import OrderedDict
 try:
     import google.generativeai as genai
     from google.generativeai.types import HarmCategory, HarmBlockThreshold
@@ -12,9 +15,96 @@ except (ImportError, Exception):
 
 _logger = logging.getLogger(__name__)
 
+DEFAULT_MODEL = "gemini-flash-latest"
+LIGHT_MODEL = "gemini-flash-lite-latest"
+# Text inputs up to this length ("Gipsokarton 12, Rotband 5") go to the light model
+SHORT_TEXT_CHARS = 400
+SHORT_OUTPUT_TOKENS = 2048
+MAX_OUTPUT_TOKENS = 8192
+
+# Small in-process cache for identical text-only requests (retries, re-sent messages).
+# Shared by every database served by this worker, so keys carry the db name.
+_RESPONSE_CACHE = OrderedDict()
+_RESPONSE_CACHE_SIZE = 256
+
+
 class GeminiService:
     @staticmethod
-    def process_request(api_key, text_prompt=None, media_data=None, mime_type=None):
+    def route(text_prompt=None, media_data=None, over_budget=False, default_model=DEFAULT_MODEL, light_model=LIGHT_MODEL):
+        """
+        Budget-aware routing policy.
+        Returns (model_name, max_output_tokens).
+        """
+        is_short_text = not media_data and text_prompt and len(text_prompt) <= SHORT_TEXT_CHARS
+        if over_budget:
+            return light_model, SHORT_OUTPUT_TOKENS
+        if is_short_text:
+            return light_model, SHORT_OUTPUT_TOKENS
+        return default_model, MAX_OUTPUT_TOKENS
+
+    @staticmethod
+    def _configure(api_key, api_endpoint=None):
+        """
+        api_endpoint (construction.gemini_api_endpoint) points the client at another
+        generateContent server, e.g. tools/gemini_standin.py for local and load tests.
+        """
+        if api_endpoint:
+            genai.configure(api_key=api_key, transport='rest', client_options={'api_endpoint': api_endpoint})
+        else:
+            genai.configure(api_key=api_key)
+
+    @staticmethod
+    def _generate(model, parts, cache_key=None):
+        """
+        Runs generate_content and collects usage info.
+        Returns (response_text, usage dict).
+        """
+        if cache_key and cache_key in _RESPONSE_CACHE:
+            _RESPONSE_CACHE.move_to_end(cache_key)
+            return _RESPONSE_CACHE[cache_key], {
+                'input_tokens': 0, 'output_tokens': 0, 'latency_ms': 0, 'cached': True,
+            }
+
+        started = time.monotonic()
+        response = model.generate_content(parts)
+        latency_ms = int((time.monotonic() - started) * 1000)
+
+        meta = getattr(response, 'usage_metadata', None)
+        usage = {
+            'input_tokens': getattr(meta, 'prompt_token_count', 0) or 0,
+            'output_tokens': getattr(meta, 'candidates_token_count', 0) or 0,
+            'latency_ms': latency_ms,
+            'cached': False,
+        }
+        text = response.text
+        if cache_key:
+            _RESPONSE_CACHE[cache_key] = text
+            while len(_RESPONSE_CACHE) > _RESPONSE_CACHE_SIZE:
+                _RESPONSE_CACHE.popitem(last=False)
+        return text, usage
+
+    @staticmethod
+    def _cache_key(dbname, flow, model_name, text_prompt, media_data):
+        if media_data or not text_prompt:
+            return None
+        digest = hashlib.sha1(text_prompt.encode('utf-8')).hexdigest()
+        return f"{dbname}:{flow}:{model_name}:{digest}"
+
+    @staticmethod
+    def _parse_json(text):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            # Fallback clean extraction
+            text = text.strip()
+            if text.startswith('```json'):
+                text = text[7:-3]
+            return json.loads(text)
+
+    @staticmethod
+    def process_request(api_key, text_prompt=None, media_data=None, mime_type=None,
+                        model_name=DEFAULT_MODEL, max_output_tokens=MAX_OUTPUT_TOKENS, api_endpoint=None,
+                        dbname=None):
         if not HAS_GEMINI:
             return {'error': "Serverda Google GenAI kutubxonasi o'rnatilmagan."}
         
@@ -22,19 +112,19 @@ class GeminiService:
             return {'error': "API kalit topilmadi. Tizim sozlamalarini tekshiring."}
 
         try:
-            genai.configure(api_key=api_key)
+            GeminiService._configure(api_key, api_endpoint)
             
             # Model Configuration
             generation_config = {
                 "temperature": 0.2,
                 "top_p": 0.95,
                 "top_k": 64,
-                "max_output_tokens": 8192,
+                "max_output_tokens": max_output_tokens,
                 "response_mime_type": "application/json",
             }
             
             model = genai.GenerativeModel(
-                model_name="gemini-flash-latest",
+                model_name=model_name,
                 generation_config=generation_config,
                 system_instruction="""
                     Sen qurilish bo'yicha yordamchisan. 
@@ -84,28 +174,27 @@ class GeminiService:
             if not parts:
                 return {'error': "Input yo'q."}
 
-            response = model.generate_content(parts)
-            
+            cache_key = GeminiService._cache_key(dbname, 'material_request', model_name, text_prompt, media_data)
+            text, usage = GeminiService._generate(model, parts, cache_key=cache_key)
+            usage['model'] = model_name
+
             # Parse JSON response
             try:
-                result = json.loads(response.text)
-                return result
-            except json.JSONDecodeError:
-                # Fallback clean extraction
-                text = response.text.strip()
-                if text.startswith('```json'):
-                    text = text[7:-3]
-                try:
-                    return json.loads(text)
-                except:
-                    return {'error': "AI javobini o'qib bo'lmadi (JSON error).", 'raw': response.text}
-                    
+                result = GeminiService._parse_json(text)
+            except ValueError:
+                return {'error': "AI javobini o'qib bo'lmadi (JSON error).", 'raw': text, 'usage': usage}
+            if isinstance(result, dict):
+                result['usage'] = usage
+            return result
+
         except Exception as e:
             _logger.error(f"Gemini API Error: {e}")
             return {'error': f"AI Xatolik: {str(e)}"}
 
     @staticmethod
-    def process_pricing_request(api_key, media_data, mime_type):
+    def process_pricing_request(api_key, media_data, mime_type,
+                                model_name=DEFAULT_MODEL, max_output_tokens=SHORT_OUTPUT_TOKENS, api_endpoint=None,
+                                dbname=None):
         """
         Extracts (product_name, price) pairs from audio/text for Snab.
         """
@@ -116,7 +205,7 @@ class GeminiService:
             return {'error': "API kalit topilmadi."}
 
         try:
-            genai.configure(api_key=api_key)
+            GeminiService._configure(api_key, api_endpoint)
             
             # Specialized System Instruction for Pricing
             system_instruction = """
@@ -141,11 +230,12 @@ class GeminiService:
             
             generation_config = {
                 "temperature": 0.1, # Low temp for precision
+                "max_output_tokens": max_output_tokens,
                 "response_mime_type": "application/json",
             }
             
             model = genai.GenerativeModel(
-                model_name="gemini-flash-latest", # Or gemini-1.5-flash
+                model_name=model_name,
                 generation_config=generation_config,
                 system_instruction=system_instruction
             )
@@ -158,20 +248,20 @@ class GeminiService:
                 })
             else:
                  return {'error': "Ovozli xabar topilmadi."}
-                 
-            response = model.generate_content(parts)
-            
+
+            cache_key = None
+            if mime_type == 'text/plain' and isinstance(media_data, str):
+                cache_key = GeminiService._cache_key(dbname, 'pricing', model_name, media_data, None)
+            text, usage = GeminiService._generate(model, parts, cache_key=cache_key)
+            usage['model'] = model_name
+
             try:
-                result = json.loads(response.text)
-                return result
-            except json.JSONDecodeError:
-                 # Fallback
-                text = response.text.strip()
-                if text.startswith('```json'): text = text[7:-3]
-                try:
-                    return json.loads(text)
-                except:
-                    return {'error': "AI javobini o'qib bo'lmadi.", 'raw': response.text}
+                result = GeminiService._parse_json(text)
+            except ValueError:
+                return {'error': "AI javobini o'qib bo'lmadi.", 'raw': text, 'usage': usage}
+            if isinstance(result, dict):
+                result['usage'] = usage
+            return result
 
         except Exception as e:
             _logger.error(f"Gemini Pricing Error: {str(e)}")
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import io
+import logging
+try:
+    from PIL import Image, ImageOps
+    HAS_PIL = True
+except (ImportError, Exception):
+    HAS_PIL = False
+
+_logger = logging.getLogger(__name__)
+
+# Defaults used when the system parameters are not set.
+# A 1600px long edge keeps handwritten lists and price tags readable for the model.
+DEFAULT_MAX_EDGE = 1600
+DEFAULT_JPEG_QUALITY = 82
+
+
+class ImagePrepService:
+    """Prepares Telegram photos before they are sent to the AI model."""
+
+    @staticmethod
+    def get_settings(env):
+        params = env['ir.config_parameter'].sudo()
+        try:
+            max_edge = int(params.get_param('construction.ai_image_max_edge', DEFAULT_MAX_EDGE))
+        except (TypeError, ValueError):
+            max_edge = DEFAULT_MAX_EDGE
+        try:
+            quality = int(params.get_param('construction.ai_image_quality', DEFAULT_JPEG_QUALITY))
+        except (TypeError, ValueError):
+            quality = DEFAULT_JPEG_QUALITY
+        return max(max_edge, 320), min(max(quality, 30), 95)
+
+    @staticmethod
+    def pick_photo_size(photo_sizes, max_edge):
+        """
+        Telegram sends every photo in several sizes (smallest first).
+        Returns the smallest size whose long edge still reaches max_edge,
+        or the largest one when none of them does.
+        """
+        if not photo_sizes:
+            return None
+        sizes = sorted(photo_sizes, key=lambda p: max(p.get('width', 0), p.get('height', 0)))
+        for size in sizes:
+            if max(size.get('width', 0), size.get('height', 0)) >= max_edge:
+                return size
+        return sizes[-1]
+
+    @staticmethod
+    def downscale(content, max_edge, quality):
+        """
+        Re-encodes the image as JPEG with its long edge bounded by max_edge.
+        Returns (bytes, mime_type). The original bytes are returned untouched
+        when Pillow is missing, the image is already small enough or decoding fails.
+        """
+        if not content or not HAS_PIL:
+            return content, 'image/jpeg'
+        try:
+            img = Image.open(io.BytesIO(content))
+            # exif_transpose returns a copy without .format
+            source_format = img.format
+            img = ImageOps.exif_transpose(img)
+            if max(img.size) <= max_edge and source_format == 'JPEG':
+                return content, 'image/jpeg'
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            out = io.BytesIO()
+            img.save(out, format='JPEG', quality=quality, optimize=True)
+            data = out.getvalue()
+            if len(data) >= len(content):
+                return content, 'image/jpeg'
+            _logger.info(f"[AI_IMAGE] Downscaled {len(content)} -> {len(data)} bytes ({img.size[0]}x{img.size[1]})")
+            return data, 'image/jpeg'
+        except Exception as e:
+            _logger.warning(f"[AI_IMAGE] Downscale failed, sending original: {e}")
+            return content, 'image/jpeg'
@@ -9,7 +9,11 @@ import tempfile
 import os
 from odoo import models, fields, api, _
 from odoo.addons.construction_management.services.inventory_lite import InventoryLiteService
-from .gemini_service import GeminiService
+from odoo.addons.construction_management.services.line_matcher import PendingLineIndex
+from odoo.addons.construction_management.services.cashflow_forecast import CashflowForecast
+from odoo.addons.construction_management.models.construction_alert import md_escape
+from .gemini_service import GeminiService, DEFAULT_MODEL, LIGHT_MODEL, SHORT_OUTPUT_TOKENS
+from .image_service import ImagePrepService
 
 _logger = logging.getLogger(__name__)
 
@@ -642,6 +646,9 @@ class ConstructionTelegramBot(models.AbstractModel):
         elif data == 'nav:back':
             self._show_main_menu(user) 
 
+        elif data.startswith('admin:portfolio:'):
+            self._show_admin_portfolio(user, order=data.split(':')[2])
+
         # --- Menu Callbacks ---
         elif data.startswith('menu:'):
             # Special redirects for Step 3
@@ -692,6 +699,9 @@ class ConstructionTelegramBot(models.AbstractModel):
             elif data == 'menu:supply:delivery_status':
                  self._start_snab_delivery_status(user)
                  return
+            elif data == 'menu:admin:projects':
+                self._show_admin_portfolio(user)
+                return
 
             self._handle_menu_placeholder(user, data)
         
@@ -720,6 +730,9 @@ class ConstructionTelegramBot(models.AbstractModel):
                  'construction_bot_state': 'idle'
              })
              self._show_main_menu(user)
+        elif data.startswith('snab:mr:accept_suggestions:'):
+             batch_id = int(data.split(':')[3])
+             self._accept_price_suggestions(user, batch_id, back='panel')
         elif data.startswith('snab:mr:send_for_approval:'):
              batch_id = int(data.split(':')[3])
              self._send_batch_for_approval(user, batch_id)
@@ -834,6 +847,9 @@ class ConstructionTelegramBot(models.AbstractModel):
         elif data.startswith('snab:req:setprice:'):
              line_id = int(data.split(':')[3])
              self._ask_snab_line_price(user, line_id)
+        elif data.startswith('snab:req:accept_suggestions:'):
+             batch_id = int(data.split(':')[3])
+             self._accept_price_suggestions(user, batch_id, back='req')
         elif data.startswith('snab:req:send:'):
              batch_id = int(data.split(':')[3])
              self._handle_snab_send_approval(user, batch_id)
@@ -1026,8 +1042,8 @@ class ConstructionTelegramBot(models.AbstractModel):
         # Assuming web.base.url is correct or I should trust it.
         # But Telegram WebApp requires https. Retrieve the tunnel URL from parameters or config if needed.
         # Let's trust web.base.url but ensure scheme is https if possible, or leave it to Odoo config.
-        session = self.env['construction.webapp.session'].sudo().create_session(user.id)
-        return f"{base_url}/webapp/dashboard?token={session.token}"
+        token = self.env['construction.webapp.session'].sudo().sign_token(user.id)
+        return f"{base_url}/webapp/dashboard?token={token}"
 
     def _show_menu_client(self, user):
         dashboard_url = self._get_dashboard_url(user)
@@ -1103,6 +1119,45 @@ class ConstructionTelegramBot(models.AbstractModel):
         ]
         self._send_message(user.telegram_chat_id, "🛡 *Admin menyusi*", reply_markup={'inline_keyboard': buttons})
 
+    def _show_admin_portfolio(self, user, order='balance'):
+        """Cross-project summary from the portfolio KPI view (refreshed by cron)."""
+        if user.construction_role != 'admin' and not user.has_group('base.group_system'):
+            self._send_message(user.telegram_chat_id, "⛔ Bu bo‘lim faqat adminlar uchun.")
+            return
+
+        data = self.env['construction.portfolio.kpi'].sudo().get_portfolio(
+            order=order, limit=10, company_ids=user.company_ids.ids)
+        totals = data['totals']
+
+        msg = f"🧾 *Loyihalar portfeli* ({totals['project_count']} ta)\n\n"
+        msg += f"💵 *Jami Kirim:* {self._format_money_uzs(totals['total_income'])}\n"
+        msg += f"💸 *Jami Chiqim:* {self._format_money_uzs(totals['total_expense'])}\n"
+        lbl = "🟢" if totals['balance'] >= 0 else "🔴"
+        msg += f"{lbl} *Balans:* {self._format_money_uzs(totals['balance'])}\n"
+        msg += f"🔴 Manfiy balansli loyihalar: {totals['negative_count']}\n"
+        msg += f"📦 Ochiq so‘rovlar: {totals['open_batch_count']}\n"
+        msg += f"⚠️ Ochiq muammolar: {totals['open_issue_count']}\n"
+        msg += f"⏰ Muddati o‘tgan vazifalar: {totals['overdue_task_count']}\n\n"
+
+        titles = {'balance': "Eng past balans", 'overdue': "Eng ko‘p kechikish", 'expense': "Eng katta chiqim"}
+        msg += f"*{titles.get(order, titles['balance'])}:*\n"
+        for i, row in enumerate(data['projects'], 1):
+            lbl = "🟢" if row['balance'] >= 0 else "🔴"
+            msg += f"{i}) {md_escape(row['name'])} — {lbl} {self._format_money_uzs(row['balance'])}, {row['progress']:.0f}%"
+            if row['overdue_task_count']:
+                msg += f", ⏰ {row['overdue_task_count']}"
+            msg += "\n"
+        if data['refreshed_at']:
+            msg += f"\n_Yangilangan: {data['refreshed_at']} (UTC)_"
+
+        buttons = [
+            [{'text': "💰 Balans", 'callback_data': "admin:portfolio:balance"},
+             {'text': "⏰ Kechikish", 'callback_data': "admin:portfolio:overdue"},
+             {'text': "💸 Chiqim", 'callback_data': "admin:portfolio:expense"}],
+            self._get_nav_row(),
+        ]
+        self._send_message(user.telegram_chat_id, msg, reply_markup={'inline_keyboard': buttons})
+
     def _handle_menu_placeholder(self, user, data):
         # Step 3 Override: Redirect Worker Menu
         if data == 'menu:worker:today_tasks':
@@ -2123,6 +2178,8 @@ class ConstructionTelegramBot(models.AbstractModel):
             self._show_main_menu(user)
             return
         
+        suggestions = self._get_price_suggestions(batch)
+
         # Build lines status list
         lines_status = []
         for i, line in enumerate(batch.line_ids, 1):
@@ -2130,6 +2187,12 @@ class ConstructionTelegramBot(models.AbstractModel):
                 lines_status.append(
                     f"{i}) {line.product_name} — {line.quantity} × {line.unit_price:,.0f} so'm = {line.total_price:,.0f} so'm ✅"
                 )
+            elif line.id in suggestions:
+                hint = suggestions[line.id]
+                lines_status.append(
+                    f"{i}) {line.product_name} — {line.quantity}  | Narx: — "
+                    f"💡 {hint['last_price']:,.0f} (median {hint['median_price']:,.0f}, min {hint['min_price']:,.0f})"
+                )
             else:
                 lines_status.append(
                     f"{i}) {line.product_name} — {line.quantity}  | Narx: —"
@@ -2152,6 +2215,9 @@ class ConstructionTelegramBot(models.AbstractModel):
             label = f"{short_name} ({line.quantity}) {status_icon}"
             buttons.append([{'text': label, 'callback_data': f"snab:mr:line:{line.id}"}])
         
+        if suggestions:
+            buttons.append([{'text': f"💡 Tavsiyalarni qabul qilish ({len(suggestions)})", 'callback_data': f"snab:mr:accept_suggestions:{batch.id}"}])
+
         # Navigation row
         buttons.append(self._get_nav_row(back_cb="snab:mr:exit"))
         
@@ -3105,7 +3171,19 @@ class ConstructionTelegramBot(models.AbstractModel):
         msg += f"💸 *Jami Chiqim:* {self._format_money_uzs(project.total_expense)}\n"
         
         lbl = "🟢" if project.balance >= 0 else "🔴"
-        msg += f"{lbl} *Balans:* {self._format_money_uzs(project.balance)}\n\n"
+        msg += f"{lbl} *Balans:* {self._format_money_uzs(project.balance)}\n"
+
+        # Forecast: recent stage spend with no new income
+        forecast = CashflowForecast(self.env).forecast_project(project.id)
+        if not forecast:
+            msg += "\n"
+        elif forecast['days_to_zero'] is None:
+            msg += f"📈 *Prognoz:* {forecast['horizon_days']} kun ichida balans musbat\n\n"
+        elif forecast['days_to_zero'] == 0:
+            msg += "🚨 *Prognoz:* balans allaqachon manfiy\n\n"
+        else:
+            msg += (f"📉 *Prognoz:* {forecast['zero_date']} da balans manfiy bo'ladi "
+                    f"(kuniga ~{self._format_money_uzs(forecast['daily_burn'])})\n\n")
 
         # Approval Batches (Material Requests)
         # Approved Today
@@ -3252,10 +3330,20 @@ class ConstructionTelegramBot(models.AbstractModel):
         batch = self.env['construction.material.request.batch'].browse(batch_id)
         if not batch.exists(): return
         
+        suggestions = self._get_price_suggestions(batch)
+
         buttons = []
         for line in batch.line_ids:
-            price_lbl = f" ({line.unit_price:,.0f})" if line.unit_price > 0 else ""
+            if line.unit_price > 0:
+                price_lbl = f" ({line.unit_price:,.0f})"
+            elif line.id in suggestions:
+                price_lbl = f" 💡{suggestions[line.id]['last_price']:,.0f}"
+            else:
+                price_lbl = ""
             buttons.append([{'text': f"{line.product_name}{price_lbl}", 'callback_data': f"snab:req:setprice:{line.id}"}])
+
+        if suggestions:
+            buttons.append([{'text': f"💡 Tavsiyalarni qabul qilish ({len(suggestions)})", 'callback_data': f"snab:req:accept_suggestions:{batch.id}"}])
             
         buttons.append([{'text': "⬅️ Ortga", 'callback_data': f"snab:req:open:{batch.id}"}])
         
@@ -3265,6 +3353,53 @@ class ConstructionTelegramBot(models.AbstractModel):
             reply_markup={'inline_keyboard': buttons}
         )
 
+    def _get_price_suggestions(self, batch):
+        """Price history hints for the unpriced lines of a batch: {line_id: index row}"""
+        unpriced = batch.line_ids.filtered(lambda l: l.unit_price <= 0)
+        if not unpriced:
+            return {}
+        by_name = self.env['construction.price.index'].sudo().suggest(
+            [(line.product_name, None) for line in unpriced]
+        )
+        return {
+            line.id: by_name[line.product_name]
+            for line in unpriced
+            if line.product_name in by_name and by_name[line.product_name]['last_price'] > 0
+        }
+
+    def _accept_price_suggestions(self, user, batch_id, back='panel'):
+        """One tap: fill every unpriced line with its last known price"""
+        if user.construction_role != 'supply':
+            self._send_message(user.telegram_chat_id, "⛔ Siz snab emassiz.")
+            return
+
+        batch = self.env['construction.material.request.batch'].sudo().browse(batch_id)
+        if not batch.exists():
+            self._send_message(user.telegram_chat_id, "❌ So'rov topilmadi.")
+            return
+        # Same states the voice pricing accepts
+        if batch.state not in ('draft', 'priced'):
+            self._send_message(user.telegram_chat_id, f"⚠️ Bu so'rov holati: {batch.state}")
+            return
+
+        suggestions = self._get_price_suggestions(batch)
+        lines = batch.line_ids._write_unit_prices(
+            {line_id: row['last_price'] for line_id, row in suggestions.items()})
+        if lines and batch.state == 'draft':
+            batch.write({'state': 'priced'})
+
+        if lines:
+            # Same undo slot as voice pricing
+            user.sudo().write({'snab_last_priced_line_ids': [(6, 0, lines.ids)]})
+            self._send_message(user.telegram_chat_id, f"✅ {len(lines)} ta qatorga tavsiya narxi qo'yildi.")
+        else:
+            self._send_message(user.telegram_chat_id, "ℹ️ Tavsiya topilmadi.")
+
+        if back == 'panel':
+            self._show_pricing_panel(user)
+        else:
+            self._start_snab_pricing_flow(user, batch.id)
+
     def _ask_snab_line_price(self, user, line_id):
         line = self.env['construction.material.request.line'].browse(line_id)
         if not line.exists(): return
@@ -3336,7 +3471,6 @@ class ConstructionTelegramBot(models.AbstractModel):
             self._show_main_menu(user)
             return
 
-        api_key = self.env['ir.config_parameter'].sudo().get_param('construction.gemini_api_key')
         
         # 1. Download Voice
         voice_data = None
@@ -3365,7 +3499,7 @@ class ConstructionTelegramBot(models.AbstractModel):
         self._send_message(user.telegram_chat_id, "⏳ AI tahlil qilmoqda...")
 
         # 2. Process with Gemini
-        result = GeminiService.process_pricing_request(api_key, voice_data, mime_type)
+        result = self._run_ai_call(user, 'pricing', project=project, media_data=voice_data, mime_type=mime_type)
         
         if result.get('error'):
             self._send_message(user.telegram_chat_id, f"❌ Xatolik: {result['error']}")
@@ -3377,56 +3511,27 @@ class ConstructionTelegramBot(models.AbstractModel):
             return
             
         # 3. Match and Update
-        # Find all pending lines for this project
-        pending_lines = self.env['construction.material.request.line'].search([
+        # Find all pending lines for this project and index them once
+        Line = self.env['construction.material.request.line']
+        pending_rows = Line.search_read([
             ('batch_id.project_id', '=', project.id),
             ('batch_id.state', 'in', ['draft', 'priced'])
-        ])
+        ], ['product_name'], order='id')
+        line_index = PendingLineIndex((r['id'], r['product_name']) for r in pending_rows)
         
         updated_count = 0
         not_found = []
         updated_lines = []
         
         for item in items:
-            name_spoken = item.get('name', '').lower()
+            name_spoken = item.get('name', '')
             price = item.get('price', 0)
             
             if not name_spoken or price <= 0: continue
             
-            # Fuzzy match attempt
-            # Simple strategy: Check if spoken name is contained in product name (or vice versa)
-            # Better: Jaccard similarity or fuzzywuzzy. But we only have standard lib + odoo.
-            # Let's use ILIKE logic and word intersection.
-            
-            best_match = None
-            
-            # Strategy A: Direct substring
-            candidates = pending_lines.filtered(lambda l: name_spoken in l.product_name.lower())
-            
-            # Strategy B: Reverse substring (product name inside spoken text - less likely for short voice commands)
-            if not candidates:
-                 candidates = pending_lines.filtered(lambda l: l.product_name.lower() in name_spoken)
-                 
-            if candidates:
-                # Pick first or best? If multiple, maybe closest length?
-                # Just pick first for now
-                best_match = candidates[0]
-            else:
-                # Strategy C: Word intersection
-                spoken_words = set(name_spoken.split())
-                best_score = 0
-                
-                for line in pending_lines:
-                    line_words = set(line.product_name.lower().split())
-                    common = spoken_words.intersection(line_words)
-                    if len(common) > 0:
-                        score = len(common) / len(line_words) # % of line words matched
-                        if score > best_score:
-                            best_score = score
-                            best_match = line
-                
-                if best_score < 0.3: # Threshold
-                    best_match = None
+            # Ranked lookup: transliteration-folded, unit-stripped token/trigram match
+            line_id = line_index.best(name_spoken)
+            best_match = Line.browse(line_id) if line_id else None
 
             if best_match:
                 # Update Price
@@ -3519,9 +3624,6 @@ class ConstructionTelegramBot(models.AbstractModel):
             self._show_main_menu(user)
             return
 
-        api_key = self.env['ir.config_parameter'].sudo().get_param('construction.gemini_api_key')
-
-        
         # 1. Download Voice
         voice_data = None
         mime_type = None
@@ -3544,8 +3646,7 @@ class ConstructionTelegramBot(models.AbstractModel):
         self._send_message(user.telegram_chat_id, "🤖 AI tahlil qilmoqda...")
         
         # 2. Process with Gemini
-        from .gemini_service import GeminiService
-        result = GeminiService.process_pricing_request(api_key, voice_data, mime_type)
+        result = self._run_ai_call(user, 'batch_pricing', project=batch.project_id, media_data=voice_data, mime_type=mime_type)
         
         if result.get('error'):
             self._send_message(user.telegram_chat_id, f"❌ Xatolik: {result['error']}")
@@ -3557,45 +3658,21 @@ class ConstructionTelegramBot(models.AbstractModel):
             return
             
         # 3. Match and Update (only within this batch)
-        pending_lines = batch.line_ids
+        line_index = PendingLineIndex((l.id, l.product_name) for l in batch.line_ids)
+        Line = self.env['construction.material.request.line']
         
         updated_lines = []
         not_found = []
         
         for item in items:
-            name_spoken = item.get('name', '').lower()
+            name_spoken = item.get('name', '')
             price = item.get('price', 0)
             
             if not name_spoken or price <= 0: continue
             
             # Fuzzy match
-            best_match = None
-            
-            # Strategy A: Direct substring
-            candidates = pending_lines.filtered(lambda l: name_spoken in l.product_name.lower())
-            
-            # Strategy B: Reverse substring
-            if not candidates:
-                 candidates = pending_lines.filtered(lambda l: l.product_name.lower() in name_spoken)
-                 
-            if candidates:
-                best_match = candidates[0]
-            else:
-                # Strategy C: Word intersection
-                spoken_words = set(name_spoken.split())
-                best_score = 0
-                
-                for line in pending_lines:
-                    line_words = set(line.product_name.lower().split())
-                    common = spoken_words.intersection(line_words)
-                    if len(common) > 0:
-                        score = len(common) / len(line_words)
-                        if score > best_score:
-                            best_score = score
-                            best_match = line
-                
-                if best_score < 0.3:
-                    best_match = None
+            line_id = line_index.best(name_spoken)
+            best_match = Line.browse(line_id) if line_id else None
 
             if best_match:
                 # Update Price
@@ -3917,6 +3994,61 @@ class ConstructionTelegramBot(models.AbstractModel):
         
         self._send_message(user.telegram_chat_id, msg, reply_markup={'inline_keyboard': buttons})
 
+    def _run_ai_call(self, user, flow, project=None, text_prompt=None, media_data=None, mime_type=None):
+        """
+        Single entry point for Gemini calls: picks the model via the budget-aware
+        routing policy, runs the request and records token usage.
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        api_key = params.get_param('construction.gemini_api_key')
+        api_endpoint = params.get_param('construction.gemini_api_endpoint') or None
+        default_model = params.get_param('construction.gemini_model', DEFAULT_MODEL)
+        light_model = params.get_param('construction.gemini_model_light', LIGHT_MODEL)
+
+        Usage = self.env['construction.ai.usage']
+        over_budget = Usage.is_over_budget(project)
+        if over_budget:
+            _logger.warning(f"[AI_USAGE] Project {project.name} is over its daily token budget, using {light_model}")
+
+        if mime_type == 'text/plain':
+            input_type = 'text'
+        elif mime_type and mime_type.startswith('image/'):
+            input_type = 'photo'
+        elif mime_type:
+            input_type = 'voice'
+        else:
+            input_type = 'text'
+
+        if flow == 'material_request':
+            model_name, max_tokens = GeminiService.route(
+                text_prompt=text_prompt, media_data=media_data, over_budget=over_budget,
+                default_model=default_model, light_model=light_model)
+            result = GeminiService.process_request(
+                api_key, text_prompt=text_prompt, media_data=media_data, mime_type=mime_type,
+                model_name=model_name, max_output_tokens=max_tokens, api_endpoint=api_endpoint,
+                dbname=self.env.cr.dbname)
+        else:
+            routed_text = media_data if mime_type == 'text/plain' else None
+            model_name, max_tokens = GeminiService.route(
+                text_prompt=routed_text, media_data=None if routed_text else media_data,
+                over_budget=over_budget, default_model=default_model, light_model=light_model)
+            # Price lists are short, the output limit never needs the full 8k
+            max_tokens = min(max_tokens, SHORT_OUTPUT_TOKENS)
+            result = GeminiService.process_pricing_request(
+                api_key, media_data, mime_type, model_name=model_name, max_output_tokens=max_tokens,
+                api_endpoint=api_endpoint, dbname=self.env.cr.dbname)
+
+        if not isinstance(result, dict):
+            if result:
+                _logger.warning(f"[AI_USAGE] Unexpected {type(result).__name__} reply for {flow}")
+                result = {'error': "AI javobi noto'g'ri formatda"}
+            else:
+                result = {}
+        usage = result.pop('usage', None) or {'model': model_name}
+        Usage.log_call(flow, usage=usage, project=project, user=user, input_type=input_type,
+                       over_budget=over_budget, error=result.get('error'))
+        return result
+
     def _handle_usta_ai_input(self, user, message):
         chat_id = user.telegram_chat_id
         
@@ -3937,8 +4069,6 @@ class ConstructionTelegramBot(models.AbstractModel):
         gemini_media = None
         gemini_mime = None
         
-        api_key = self.env['ir.config_parameter'].sudo().get_param('construction.gemini_api_key')
-        
         try:
             if voice:
                 file_id = voice['file_id']
@@ -3949,15 +4079,16 @@ class ConstructionTelegramBot(models.AbstractModel):
                         gemini_media = content
                         gemini_mime = 'audio/ogg'
             elif photo:
-                # Get largest photo
-                file_id = photo[-1]['file_id']
+                # Smallest Telegram size that still meets the resolution target
+                max_edge, quality = ImagePrepService.get_settings(self.env)
+                file_id = ImagePrepService.pick_photo_size(photo, max_edge)['file_id']
                 file_info = self._get_file(file_id)
+                content = None
+                caption = message.get('caption', '')
                 if file_info and file_info.get('file_path'):
                     content = self._download_file(file_info['file_path'])
-                    caption = message.get('caption', '')
                     if content:
-                        gemini_media = content
-                        gemini_mime = 'image/jpeg'
+                        gemini_media, gemini_mime = ImagePrepService.downscale(content, max_edge, quality)
                     if caption:
                         gemini_text = caption
                 # If there's text with photo (caption), we treat it as AI prompt.
@@ -3975,7 +4106,9 @@ class ConstructionTelegramBot(models.AbstractModel):
             return
 
         # 2. Call Gemini
-        result = GeminiService.process_request(api_key, text_prompt=gemini_text, media_data=gemini_media, mime_type=gemini_mime)
+        result = self._run_ai_call(
+            user, 'material_request', project=user.usta_ai_project_id,
+            text_prompt=gemini_text, media_data=gemini_media, mime_type=gemini_mime)
         
         if not result or 'error' in result:
             err = result.get('error', "Noma'lum xatolik") if result else "Javob yo'q"
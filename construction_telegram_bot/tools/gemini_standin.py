@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the Gemini generateContent API.
+
+Implements the subset used by models/gemini_service.py:
+    POST /v1beta/models/<model>:generateContent
+
+Point the bot at it with the system parameter
+    construction.gemini_api_endpoint = http://127.0.0.1:8765
+(any non-empty construction.gemini_api_key works).
+
+Control endpoints:
+    GET    /_standin/requests   captured requests (JSON)
+    DELETE /_standin/requests   clear captured requests
+    POST   /_standin/script     queue scripted responses: {"responses": [<json>, ...]}
+    POST   /_standin/config     change latency/error injection at runtime
+
+Usage:
+    python3 gemini_standin.py --port 8765 --latency-ms 800 --jitter-ms 400 \\
+        --error-rate 0.05 --script responses.json --capture captured.jsonl
+
+Only the standard library is used so it runs anywhere Odoo runs.
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_logger = logging.getLogger('gemini_standin')
+
+_GENERATE_PATH = re.compile(r'^/v1(?:beta)?/models/(?P<model>[^:/]+):generateContent$')
+
+# Default answers, picked by the system instruction of the calling flow
+DEFAULT_RESPONSES = {
+    'pricing': {
+        'items': [
+            {'name': 'Gipsokarton', 'price': 50000},
+            {'name': 'Rotband', 'price': 80000},
+        ]
+    },
+    'material_request': {
+        'items': [
+            {'name_raw': 'gipsokarton', 'name_clean': 'Gipsokarton', 'qty': 10, 'uom': 'dona'},
+            {'name_raw': 'rotband', 'name_clean': 'Rotband', 'qty': 5, 'uom': 'qop'},
+        ],
+        'warnings': [],
+    },
+}
+
+
+class StandinState:
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, error_status=500,
+                 capture_path=None, max_captured=1000):
+        self.lock = threading.Lock()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.capture_path = capture_path
+        self.script = deque()
+        self.captured = deque(maxlen=max_captured)
+        self.counter = 0
+
+    def next_scripted(self):
+        with self.lock:
+            return self.script.popleft() if self.script else None
+
+    def capture(self, entry):
+        with self.lock:
+            self.counter += 1
+            entry['seq'] = self.counter
+            self.captured.append(entry)
+            if self.capture_path:
+                with open(self.capture_path, 'a', encoding='utf-8') as fh:
+                    fh.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def _estimate_tokens(payload):
+    """Rough token count: ~4 chars per token for text, a flat rate for inline media."""
+    chars = 0
+    media = 0
+    for content in payload.get('contents', []):
+        for part in content.get('parts', []):
+            if 'text' in part:
+                chars += len(part['text'])
+            elif 'inlineData' in part or 'inline_data' in part:
+                blob = part.get('inlineData') or part.get('inline_data')
+                # base64 -> bytes, then ~1 token per 100 bytes of audio/image
+                media += int(len(blob.get('data', '')) * 3 / 4 / 100)
+    system = payload.get('systemInstruction') or payload.get('system_instruction') or {}
+    for part in system.get('parts', []):
+        chars += len(part.get('text', ''))
+    return max(1, chars // 4 + media)
+
+
+def _flow_of(payload):
+    system = payload.get('systemInstruction') or payload.get('system_instruction') or {}
+    text = ' '.join(p.get('text', '') for p in system.get('parts', []))
+    return 'pricing' if 'narxlovchi' in text else 'material_request'
+
+
+def _summarize_parts(payload):
+    parts = []
+    for content in payload.get('contents', []):
+        for part in content.get('parts', []):
+            if 'text' in part:
+                parts.append({'text': part['text'][:500]})
+            else:
+                blob = part.get('inlineData') or part.get('inline_data') or {}
+                parts.append({
+                    'mime_type': blob.get('mimeType') or blob.get('mime_type'),
+                    'bytes': int(len(blob.get('data', '')) * 3 / 4),
+                })
+    return parts
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    server_version = 'GeminiStandin/1.0'
+    state = None  # set by make_server
+
+    def log_message(self, fmt, *args):
+        _logger.debug(fmt, *args)
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        return json.loads(raw.decode('utf-8') or '{}')
+
+    def do_GET(self):
+        if self.path == '/_standin/requests':
+            with self.state.lock:
+                return self._send_json(200, list(self.state.captured))
+        self._send_json(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+    def do_DELETE(self):
+        if self.path == '/_standin/requests':
+            with self.state.lock:
+                self.state.captured.clear()
+            return self._send_json(200, {'ok': True})
+        self._send_json(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        try:
+            payload = self._read_json()
+        except ValueError:
+            return self._send_json(400, {'error': {'code': 400, 'message': 'Invalid JSON'}})
+
+        if path == '/_standin/script':
+            with self.state.lock:
+                self.state.script.extend(payload.get('responses', []))
+            return self._send_json(200, {'queued': len(self.state.script)})
+        if path == '/_standin/config':
+            with self.state.lock:
+                for key in ('latency_ms', 'jitter_ms', 'error_rate', 'error_status'):
+                    if key in payload:
+                        setattr(self.state, key, type(getattr(self.state, key))(payload[key]))
+            return self._send_json(200, {'ok': True})
+
+        match = _GENERATE_PATH.match(path)
+        if not match:
+            return self._send_json(404, {'error': {'code': 404, 'message': f'Unknown path {path}'}})
+        self._generate_content(match.group('model'), payload)
+
+    def _generate_content(self, model, payload):
+        state = self.state
+        started = time.monotonic()
+        delay = state.latency_ms + (random.uniform(0, state.jitter_ms) if state.jitter_ms else 0)
+        if delay:
+            time.sleep(delay / 1000.0)
+
+        flow = _flow_of(payload)
+        entry = {
+            'ts': time.time(),
+            'model': model,
+            'flow': flow,
+            'generation_config': payload.get('generationConfig') or payload.get('generation_config'),
+            'parts': _summarize_parts(payload),
+        }
+
+        if state.error_rate and random.random() < state.error_rate:
+            entry['status'] = state.error_status
+            state.capture(entry)
+            return self._send_json(state.error_status, {
+                'error': {'code': state.error_status, 'message': 'Injected error', 'status': 'INTERNAL'}
+            })
+
+        scripted = state.next_scripted()
+        answer = scripted if scripted is not None else DEFAULT_RESPONSES[flow]
+        text = answer if isinstance(answer, str) else json.dumps(answer, ensure_ascii=False)
+
+        prompt_tokens = _estimate_tokens(payload)
+        output_tokens = max(1, len(text) // 4)
+        entry.update({
+            'status': 200,
+            'scripted': scripted is not None,
+            'latency_ms': int((time.monotonic() - started) * 1000),
+        })
+        state.capture(entry)
+
+        self._send_json(200, {
+            'candidates': [{
+                'content': {'role': 'model', 'parts': [{'text': text}]},
+                'finishReason': 'STOP',
+                'index': 0,
+            }],
+            'usageMetadata': {
+                'promptTokenCount': prompt_tokens,
+                'candidatesTokenCount': output_tokens,
+                'totalTokenCount': prompt_tokens + output_tokens,
+            },
+            'modelVersion': model,
+        })
+
+
+def make_server(host='127.0.0.1', port=8765, **state_kwargs):
+    state = StandinState(**state_kwargs)
+    handler = type('BoundStandinHandler', (StandinHandler,), {'state': state})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Gemini generateContent stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=int, default=0)
+    parser.add_argument('--jitter-ms', type=int, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--script', help='JSON file: list of responses served in order before the defaults')
+    parser.add_argument('--capture', help='Append every request summary to this JSONL file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    server = make_server(
+        args.host, args.port,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, error_status=args.error_status,
+        capture_path=args.capture,
+    )
+    if args.script:
+        with open(args.script, encoding='utf-8') as fh:
+            server.RequestHandlerClass.state.script.extend(json.load(fh))
+
+    _logger.info(f"Gemini stand-in listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()